@@ -0,0 +1,357 @@
+"""Нагрузочный бенчмарк API целиком.
+
+Заполняем БД реалистичным объёмом данных генератором «benchmarks.generate_data»
+(рестораны, покупатели, курьеры, история доставленных и активные заказы) и нагружаем
+приложение виртуальными пользователями, каждый из которых по кругу выполняет свой сценарий:
+    - покупатель смотрит свои заказы, стоимость доставки, делает заказ и следит за ним;
+    - курьер смотрит свободные заказы, берёт один из них, смотрит свои заказы и
+      завершает взятый заказ;
+    - ресторан смотрит список своих заказов и один заказ подробно.
+
+Приложение вызывается либо напрямую как ASGI-приложение, в том же процессе
+(«--transport asgi»), либо по сети через uvicorn, запущенный отдельным процессом
+(«--transport uvicorn»). Ограничение частоты запросов в обоих случаях
+выключено, токены выдаются без запроса к API.
+
+Для каждого маршрута печатаем количество запросов в секунду и задержки p50/p95/p99.
+Результаты сохраняются в JSON («--output») и сравниваются с сохранённым раньше
+результатом («--baseline»): если p95 маршрута выросла или количество запросов
+в секунду упало больше чем на «--tolerance», бенчмарк завершается с кодом 1.
+
+БД берётся из переменных окружения приложения, таблицы должны быть созданы миграциями.
+Данные бенчмарка не удаляются, используйте отдельную БД.
+
+Запуск из папки «courier_service»:
+    ~$ python -m benchmarks.bench_load --duration 30 --buyers 20 --couriers 10 --restaurants 5 \\
+           --output results.json --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+import httpx
+from src.database import engine
+from src.users.security import COURIER_ROLE, USER_ROLE, create_access_token
+
+from .generate_data import (City, GeneratedCity, courier_phone, generate,
+                            user_phone)
+
+
+class Dataset(NamedTuple):
+    """ID и токены заполненных в БД объектов."""
+
+    restaurant_ids: List[int]
+    user_tokens: List[str]
+    courier_tokens: List[str]
+
+
+class Stats:
+    """Задержки и коды ответов по маршрутам."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def add(self, name: str, latency: float, status: int) -> None:
+        self.latencies[name].append(latency)
+        self.statuses[name][status] += 1
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по отсортированному списку, методом ближайшего ранга."""
+
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def make_dataset(city: GeneratedCity) -> Dataset:
+    """Токены для всех покупателей и свободных курьеров сгенерированного города."""
+
+    return Dataset(
+        list(city.restaurant_ids),
+        [create_access_token({'sub': user_phone(user_id), 'role': USER_ROLE, 'id': user_id})
+         for user_id in city.user_ids],
+        [create_access_token({'sub': courier_phone(courier_id), 'role': COURIER_ROLE, 'id': courier_id})
+         for courier_id in city.courier_ids if courier_id not in city.busy_courier_ids],
+    )
+
+
+class VirtualUser:
+    """Виртуальный пользователь: запросы к API с замером задержки."""
+
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, token: Optional[str] = None) -> None:
+        self.client = client
+        self.stats = stats
+        self.headers: Dict[str, str] = {'Authorization': f'Bearer {token}'} if token else {}
+
+    async def request(self, method: str, url: str, name: str) -> httpx.Response:
+        """Запрос к API. «name» — шаблон маршрута, по которому группируется статистика."""
+
+        started = perf_counter()
+        try:
+            response: httpx.Response = await self.client.request(method, url, headers=self.headers)
+        except httpx.HTTPError:
+            self.stats.add(name, perf_counter() - started, 599)
+            raise
+        self.stats.add(name, perf_counter() - started, response.status_code)
+        return response
+
+
+async def buyer_scenario(user: VirtualUser, rng: random.Random, dataset: Dataset) -> None:
+    restaurant_id: int = rng.choice(dataset.restaurant_ids)
+    await user.request('GET', '/api/v1/users/orders/get', 'GET /api/v1/users/orders/get')
+    await user.request('GET', f'/api/v1/users/shipping_cost/{restaurant_id}',
+                       'GET /api/v1/users/shipping_cost/{restaurant_id}')
+    response = await user.request('POST', f'/api/v1/users/orders/post/{restaurant_id}',
+                                  'POST /api/v1/users/orders/post/{restaurant_id}')
+    if response.status_code == 201:
+        await user.request('GET', f'/api/v1/users/orders/get/{response.json()["id"]}',
+                           'GET /api/v1/users/orders/get/{order_id}')
+
+
+async def courier_scenario(user: VirtualUser, rng: random.Random, dataset: Dataset) -> None:
+    response = await user.request('GET', '/api/v1/couriers/available_orders',
+                                  'GET /api/v1/couriers/available_orders')
+    orders: List[Dict[str, Any]] = response.json() if response.status_code == 200 else []
+    if not orders:
+        return
+
+    order_id: int = rng.choice(orders[:10])['id']
+    # заказ мог взять другой курьер, это ожидаемый ответ 404
+    response = await user.request('POST', f'/api/v1/couriers/orders/{order_id}',
+                                  'POST /api/v1/couriers/orders/{order_id}')
+    await user.request('GET', '/api/v1/couriers/orders', 'GET /api/v1/couriers/orders')
+    if response.status_code == 204:
+        await user.request('PUT', f'/api/v1/couriers/orders/{order_id}',
+                           'PUT /api/v1/couriers/orders/{order_id}')
+
+
+async def restaurant_scenario(user: VirtualUser, rng: random.Random, dataset: Dataset) -> None:
+    restaurant_id: int = rng.choice(dataset.restaurant_ids)
+    response = await user.request('GET', f'/api/v1/restaurants/{restaurant_id}/orders',
+                                  'GET /api/v1/restaurants/{restaurant_id}/orders')
+    orders: List[Dict[str, Any]] = response.json() if response.status_code == 200 else []
+    if orders:
+        await user.request('GET', f'/api/v1/restaurants/{restaurant_id}/orders/{rng.choice(orders)["id"]}',
+                           'GET /api/v1/restaurants/{restaurant_id}/orders/{order_id}')
+
+
+async def run_virtual_user(scenario: Any, user: VirtualUser, rng: random.Random, dataset: Dataset,
+                           deadline: float) -> None:
+    while perf_counter() < deadline:
+        try:
+            await scenario(user, rng, dataset)
+        except httpx.HTTPError:
+            await asyncio.sleep(0.1)
+
+
+async def run_load(
+        client: httpx.AsyncClient,
+        dataset: Dataset,
+        rng: random.Random,
+        buyers: int,
+        couriers: int,
+        restaurants: int,
+        duration: float,
+) -> Stats:
+    """Запускаем виртуальных пользователей на «duration» секунд."""
+
+    stats = Stats()
+    deadline: float = perf_counter() + duration
+    users = (
+        [(buyer_scenario, VirtualUser(client, stats, rng.choice(dataset.user_tokens))) for _ in range(buyers)]
+        + [(courier_scenario, VirtualUser(client, stats, token))
+           for token in rng.sample(dataset.courier_tokens, couriers)]
+        + [(restaurant_scenario, VirtualUser(client, stats)) for _ in range(restaurants)]
+    )
+    await asyncio.gather(*(
+        run_virtual_user(scenario, user, random.Random(rng.random()), dataset, deadline)
+        for scenario, user in users
+    ))
+    return stats
+
+
+def summarize(stats: Stats, duration: float) -> Dict[str, Dict[str, Any]]:
+    """Количество запросов в секунду, перцентили задержки и коды ответов по маршрутам."""
+
+    summary: Dict[str, Dict[str, Any]] = {}
+    for name in sorted(stats.latencies):
+        latencies: List[float] = sorted(stats.latencies[name])
+        summary[name] = {
+            'count': len(latencies),
+            'rps': round(len(latencies) / duration, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'errors': sum(count for status, count in stats.statuses[name].items() if status >= 500),
+            'statuses': {str(status): count for status, count in sorted(stats.statuses[name].items())},
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict[str, Any]]) -> None:
+    print(f'{"Маршрут":<60} {"RPS":>8} {"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9} {"5xx":>5}')
+    for name, row in summary.items():
+        print(f'{name:<60} {row["rps"]:>8.1f} {row["p50_ms"]:>9.1f} {row["p95_ms"]:>9.1f} '
+              f'{row["p99_ms"]:>9.1f} {row["errors"]:>5}')
+
+
+def compare(
+        summary: Dict[str, Dict[str, Any]],
+        baseline: Dict[str, Dict[str, Any]],
+        tolerance: float,
+) -> bool:
+    """Сравниваем результат с сохранённым. Возвращаем False, если есть ухудшение больше допустимого."""
+
+    ok = True
+    print(f'\nСравнение с базовым результатом (допустимо ухудшение на {tolerance:.0%}):')
+    for name, row in summary.items():
+        base: Optional[Dict[str, Any]] = baseline.get(name)
+        if base is None:
+            continue
+        p95_change: float = row['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        rps_change: float = row['rps'] / base['rps'] - 1 if base['rps'] else 0.0
+        regressed: bool = p95_change > tolerance or rps_change < -tolerance
+        ok = ok and not regressed
+        print(f'{"!" if regressed else " "} {name:<60} p95 {p95_change:+.0%}, RPS {rps_change:+.0%}')
+    return ok
+
+
+def disable_rate_limit() -> None:
+    """Выключаем ограничение частоты запросов: все виртуальные пользователи приходят с одного адреса."""
+
+    from src.main import limiter
+
+    limiter.enabled = False
+
+
+def serve(port: int) -> None:
+    """Запускаем приложение в uvicorn, для «--transport uvicorn»."""
+
+    import uvicorn
+    from src.main import app
+
+    disable_rate_limit()
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+
+
+async def wait_for_server(client: httpx.AsyncClient, timeout: float = 30) -> None:
+    deadline: float = perf_counter() + timeout
+    while True:
+        try:
+            await client.get('/docs')
+            return
+        except httpx.TransportError:
+            if perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+@asynccontextmanager
+async def connect(transport: str, port: int, connections: int) -> AsyncIterator[httpx.AsyncClient]:
+    """Клиент к приложению: в том же процессе («asgi») или к uvicorn в отдельном процессе."""
+
+    if transport == 'asgi':
+        from src.main import app
+
+        disable_rate_limit()
+        asgi_transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=asgi_transport, base_url='http://bench') as client:
+            yield client
+        return
+
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_load', '--serve', str(port)])
+    try:
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', timeout=60,
+                                     limits=httpx.Limits(max_connections=connections)) as client:
+            await wait_for_server(client)
+            yield client
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def seed_dataset(args: argparse.Namespace, min_couriers: int = 0) -> Dataset:
+    """Заполняем БД генератором по параметрам «--seed-*» из командной строки."""
+
+    started = perf_counter()
+    city: GeneratedCity = await generate(engine, City(
+        args.seed_restaurants, args.seed_users, max(args.seed_couriers, min_couriers), args.seed_orders,
+        args.seed_active_orders, days=30,
+    ), args.seed)
+    await engine.dispose()
+    print(f'Данные для бенчмарка добавлены за {perf_counter() - started:.1f} с')
+    return make_dataset(city)
+
+
+def add_seed_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--seed-restaurants', type=int, default=50, help='Ресторанов в БД')
+    parser.add_argument('--seed-users', type=int, default=2000, help='Покупателей в БД')
+    parser.add_argument('--seed-couriers', type=int, default=500, help='Курьеров в БД')
+    parser.add_argument('--seed-orders', type=int, default=20_000, help='Доставленных заказов в БД')
+    parser.add_argument('--seed-active-orders', type=int, default=200, help='Активных заказов в БД')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел')
+
+
+async def main(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    dataset: Dataset = await seed_dataset(args, args.couriers)
+
+    connections: int = args.buyers + args.couriers + args.restaurants
+    async with connect(args.transport, args.port, connections) as client:
+        stats: Stats = await run_load(
+            client, dataset, rng, args.buyers, args.couriers, args.restaurants, args.duration
+        )
+
+    summary: Dict[str, Dict[str, Any]] = summarize(stats, args.duration)
+    print_summary(summary)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'meta': {
+                    'transport': args.transport, 'duration': args.duration, 'buyers': args.buyers,
+                    'couriers': args.couriers, 'restaurants': args.restaurants,
+                    'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                },
+                'endpoints': summary,
+            }, file, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline: Dict[str, Dict[str, Any]] = json.load(file)['endpoints']
+        if not compare(summary, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    parser.add_argument('--transport', choices=['asgi', 'uvicorn'], default='asgi',
+                        help='Вызов приложения в процессе бенчмарка или по сети через uvicorn')
+    parser.add_argument('--port', type=int, default=8765, help='Порт uvicorn')
+    parser.add_argument('--duration', type=float, default=30, help='Длительность нагрузки в секундах')
+    parser.add_argument('--buyers', type=int, default=20, help='Виртуальных покупателей')
+    parser.add_argument('--couriers', type=int, default=10, help='Виртуальных курьеров')
+    parser.add_argument('--restaurants', type=int, default=5, help='Виртуальных ресторанов')
+    parser.add_argument('--output', help='Файл JSON для результатов')
+    parser.add_argument('--baseline', help='Файл JSON с результатами для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое ухудшение, доля')
+    add_seed_arguments(parser)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+    else:
+        sys.exit(asyncio.run(main(args)))
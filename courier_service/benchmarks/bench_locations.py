@@ -0,0 +1,127 @@
+"""Бенчмарк приёма геопозиций курьеров.
+
+Замеряем:
+    - скорость записи геопозиций в хранилище в памяти и поиска ближайших курьеров;
+    - пропускную способность роутера «POST /api/v1/couriers/location» при вызове
+      ASGI-приложения напрямую, без сети и HTTP-сервера (аутентификация, валидация
+      и все middleware приложения учитываются).
+
+Запрос к БД во время замера не выполняется, запись пакетов в БД отключена.
+
+Запуск из папки «courier_service»:
+    ~$ python -m benchmarks.bench_locations --couriers 10000 --pings 200000
+"""
+
+import argparse
+import asyncio
+import random
+from time import perf_counter
+from typing import Any, Dict, List
+
+import orjson
+from src.delivery.geo import CITY_BOUNDS, Point
+from src.delivery.locations import courier_locations
+from src.main import app
+from src.users.security import COURIER_ROLE, create_access_token
+
+
+def random_point(rng: random.Random) -> Point:
+    """Случайная точка в границах города."""
+
+    south, west, north, east = CITY_BOUNDS
+    return Point(rng.uniform(south, north), rng.uniform(west, east))
+
+
+async def bench_store(rng: random.Random, couriers: int, pings: int, queries: int) -> None:
+    points: List[Point] = [random_point(rng) for _ in range(pings)]
+
+    started = perf_counter()
+    for i, point in enumerate(points):
+        courier_locations.record(i % couriers + 1, point)
+    elapsed = perf_counter() - started
+    print(f'Хранилище: {pings / elapsed:,.0f} геопозиций/с, курьеров в индексе {len(courier_locations)}')
+
+    targets: List[Point] = [random_point(rng) for _ in range(queries)]
+    started = perf_counter()
+    for point in targets:
+        courier_locations.nearest(point, limit=5)
+    elapsed = perf_counter() - started
+    print(f'Поиск 5 ближайших: {queries / elapsed:,.0f} запросов/с')
+
+
+async def call_app(scope: Dict[str, Any], body: bytes) -> int:
+    """Вызываем ASGI-приложение и возвращаем код ответа."""
+
+    statuses: List[int] = []
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response_sent = asyncio.Event()
+
+    async def receive() -> Dict[str, Any]:
+        if messages:
+            return messages.pop()
+        # клиент не отключается, пока не получит ответ
+        await response_sent.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message: Dict[str, Any]) -> None:
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+        elif not message.get('more_body', False):
+            response_sent.set()
+
+    await app(scope, receive, send)
+    return statuses[0]
+
+
+async def bench_router(rng: random.Random, couriers: int, requests: int) -> None:
+    tokens = [
+        create_access_token({'sub': f'+7999{i:07d}', 'role': COURIER_ROLE, 'id': i})
+        for i in range(1, couriers + 1)
+    ]
+    scopes = [
+        {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+            'scheme': 'http', 'path': '/api/v1/couriers/location', 'raw_path': b'/api/v1/couriers/location',
+            'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 5000), 'server': ('test', 80),
+            'headers': [
+                (b'host', b'test'),
+                (b'content-type', b'application/json'),
+                (b'authorization', f'Bearer {token}'.encode()),
+            ],
+        }
+        for token in tokens
+    ]
+    bodies = [
+        orjson.dumps({'latitude': point.latitude, 'longitude': point.longitude})
+        for point in (random_point(rng) for _ in range(1000))
+    ]
+
+    assert await call_app(scopes[0], bodies[0]) == 204, 'Роутер вернул ошибку'
+
+    started = perf_counter()
+    for i in range(requests):
+        await call_app(scopes[i % couriers], bodies[i % len(bodies)])
+    elapsed = perf_counter() - started
+    print(f'Роутер: {requests / elapsed:,.0f} запросов/с на один воркер')
+
+
+async def main(couriers: int, pings: int, queries: int, requests: int, seed: int) -> None:
+    rng = random.Random(seed)
+    courier_locations.flush_interval = float('inf')
+
+    await bench_store(rng, couriers, pings, queries)
+    await bench_router(rng, couriers, requests)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--couriers', type=int, default=10_000, help='Количество курьеров')
+    parser.add_argument('--pings', type=int, default=200_000, help='Количество геопозиций для хранилища')
+    parser.add_argument('--queries', type=int, default=10_000, help='Количество запросов ближайших курьеров')
+    parser.add_argument('--requests', type=int, default=20_000, help='Количество запросов к роутеру')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.couriers, args.pings, args.queries, args.requests, args.seed))
@@ -0,0 +1,95 @@
+"""Бенчмарк автоматического распределения заказов.
+
+Замеряем время жадного распределения для большого пакета (по умолчанию 10 000
+курьеров и 10 000 заказов) и сравниваем качество жадного и точного (венгерского)
+решения на небольшом пакете. Точки курьеров и ресторанов случайны в границах города,
+у части курьеров позиция неизвестна.
+
+Запуск из папки «courier_service»:
+    ~$ python -m benchmarks.bench_matching --couriers 10000 --orders 10000
+"""
+
+import argparse
+import random
+from time import perf_counter
+from typing import List, Optional, Sequence
+
+from src.delivery.geo import CITY_BOUNDS, Point
+from src.delivery.matching import (Assignment, greedy_assignment, hungarian,
+                                   match, pickup_cost)
+
+
+def random_points(rng: random.Random, count: int) -> List[Point]:
+    """Случайные точки в границах города."""
+
+    south, west, north, east = CITY_BOUNDS
+    return [Point(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(count)]
+
+
+def total_distance(
+        couriers: Sequence[Optional[Point]],
+        orders: Sequence[Point],
+        assignment: Assignment,
+) -> float:
+    """Суммарное расстояние от курьеров до ресторанов, в километрах."""
+
+    return sum(pickup_cost(couriers[courier], orders[order]) for courier, order in assignment)
+
+
+def check_assignment(assignment: Assignment, couriers: int, orders: int) -> None:
+    """Каждый курьер и каждый заказ встречаются в назначениях не больше одного раза."""
+
+    assert len({courier for courier, _ in assignment}) == len(assignment), 'Курьер назначен дважды'
+    assert len({order for _, order in assignment}) == len(assignment), 'Заказ назначен дважды'
+    assert len(assignment) == min(couriers, orders), 'Остались свободные пары'
+
+
+def main(
+        couriers_count: int,
+        orders_count: int,
+        quality_size: int,
+        unknown_share: float,
+        seed: int,
+) -> None:
+    rng = random.Random(seed)
+
+    couriers: List[Optional[Point]] = [
+        None if rng.random() < unknown_share else point for point in random_points(rng, couriers_count)
+    ]
+    orders = random_points(rng, orders_count)
+
+    started = perf_counter()
+    assignment = match(couriers, orders)
+    elapsed = perf_counter() - started
+    check_assignment(assignment, couriers_count, orders_count)
+
+    print(f'Курьеров: {couriers_count}, заказов: {orders_count}, без позиции: {unknown_share:.0%}')
+    print(f'Распределение: {elapsed * 1000:.0f} мс, назначено {len(assignment)}, '
+          f'среднее расстояние {total_distance(couriers, orders, assignment) / len(assignment):.2f} км')
+
+    small_couriers, small_orders = couriers[:quality_size], orders[:quality_size]
+    cost = [[pickup_cost(courier, order) for order in small_orders] for courier in small_couriers]
+
+    started = perf_counter()
+    exact = hungarian(cost)
+    exact_elapsed = perf_counter() - started
+    greedy = greedy_assignment(small_couriers, small_orders)
+
+    exact_distance = total_distance(small_couriers, small_orders, exact)
+    greedy_distance = total_distance(small_couriers, small_orders, greedy)
+    print(f'Пакет {quality_size}×{quality_size}: венгерский алгоритм {exact_elapsed * 1000:.0f} мс, '
+          f'жадное решение длиннее точного на {(greedy_distance / exact_distance - 1):.1%}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--couriers', type=int, default=10_000, help='Количество свободных курьеров')
+    parser.add_argument('--orders', type=int, default=10_000, help='Количество заказов')
+    parser.add_argument('--quality-size', type=int, default=200, help='Размер пакета для сравнения качества')
+    parser.add_argument('--unknown-share', type=float, default=0.1, help='Доля курьеров без позиции')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел')
+    args = parser.parse_args()
+
+    main(args.couriers, args.orders, args.quality_size, args.unknown_share, args.seed)
@@ -0,0 +1,172 @@
+"""Бенчмарк доставки нескольких заказов за одну поездку.
+
+Моделируем рабочий день: заказы приходят равномерно случайно из ресторанов
+в случайные адреса города, свободный курьер забирает самый старый заказ и до
+«вместимости - 1» других ожидающих заказов из того же ресторана, а порядок точек
+строит «plan_route». Время поездки — длина маршрута при постоянной скорости
+плюс время на каждую точку маршрута.
+
+Для каждой вместимости печатаем количество доставок на курьеро-час и среднее
+время от создания заказа до доставки.
+
+Запуск из папки «courier_service»:
+    ~$ python -m benchmarks.bench_routing --couriers 50 --orders-per-hour 150
+"""
+
+import argparse
+import heapq
+import random
+from collections import deque
+from time import perf_counter
+from typing import Deque, Dict, List, Set, Tuple
+
+from src.delivery.geo import CITY_BOUNDS, Point, haversine_km
+from src.delivery.routing import DROP_OFF, plan_route, route_length
+
+# Заказ: минута создания, индекс ресторана, адрес доставки
+SimulatedOrder = Tuple[float, int, Point]
+
+
+def random_point(rng: random.Random) -> Point:
+    """Случайная точка в границах города."""
+
+    south, west, north, east = CITY_BOUNDS
+    return Point(rng.uniform(south, north), rng.uniform(west, east))
+
+
+def generate_orders(
+        rng: random.Random,
+        restaurants: int,
+        orders_per_hour: float,
+        hours: int,
+) -> List[SimulatedOrder]:
+    """Заказы за день, с экспоненциальными интервалами между ними."""
+
+    orders: List[SimulatedOrder] = []
+    minute = rng.expovariate(orders_per_hour / 60)
+    while minute < hours * 60:
+        orders.append((minute, rng.randrange(restaurants), random_point(rng)))
+        minute += rng.expovariate(orders_per_hour / 60)
+    return orders
+
+
+def simulate(
+        orders: List[SimulatedOrder],
+        restaurant_points: List[Point],
+        couriers: int,
+        capacity: int,
+        hours: int,
+        speed_kmh: float,
+        stop_minutes: float,
+        seed: int,
+) -> Tuple[int, float]:
+    """Моделируем день доставки.
+
+    Returns:
+        - Tuple[int, float]: Количество доставок за день и среднее время доставки в минутах.
+    """
+
+    rng = random.Random(seed)
+    day_end: float = hours * 60
+    # свободные курьеры: минута, когда курьер освободится, номер курьера
+    free_at: List[Tuple[float, int]] = [(0.0, courier) for courier in range(couriers)]
+    positions: List[Point] = [random_point(rng) for _ in range(couriers)]
+    # ожидающие заказы по ресторанам и все вместе, в порядке поступления
+    waiting: Dict[int, Deque[int]] = {}
+    arrivals: Deque[int] = deque()
+    taken: Set[int] = set()
+
+    delivered = 0
+    total_minutes = 0.0
+    next_order = 0
+
+    while free_at:
+        minute, courier = heapq.heappop(free_at)
+        if minute >= day_end:
+            break
+
+        # поступившие к этому времени заказы встают в очередь своего ресторана
+        while next_order < len(orders) and orders[next_order][0] <= minute:
+            waiting.setdefault(orders[next_order][1], deque()).append(next_order)
+            arrivals.append(next_order)
+            next_order += 1
+
+        while arrivals and arrivals[0] in taken:
+            arrivals.popleft()
+
+        if not arrivals:
+            # заказов нет, курьер ждёт следующего
+            if next_order < len(orders):
+                heapq.heappush(free_at, (orders[next_order][0], courier))
+            continue
+
+        restaurant: int = orders[arrivals[0]][1]
+        queue = waiting[restaurant]
+        batch: List[int] = [queue.popleft() for _ in range(min(capacity, len(queue)))]
+        taken.update(batch)
+        if not queue:
+            del waiting[restaurant]
+
+        start: Point = positions[courier]
+        route = plan_route(start, [(restaurant_points[restaurant], orders[order][2]) for order in batch])
+
+        elapsed = minute
+        previous: Point = start
+        for stop in route:
+            elapsed += haversine_km(previous, stop.point) / speed_kmh * 60 + stop_minutes
+            previous = stop.point
+            if stop.action == DROP_OFF and elapsed <= day_end:
+                delivered += 1
+                total_minutes += elapsed - orders[batch[stop.order]][0]
+
+        positions[courier] = route[-1].point
+        heapq.heappush(free_at, (minute + route_length(start, route) / speed_kmh * 60
+                                 + stop_minutes * len(route), courier))
+
+    return delivered, total_minutes / delivered if delivered else 0.0
+
+
+def main(
+        couriers: int,
+        restaurants: int,
+        orders_per_hour: float,
+        hours: int,
+        capacities: List[int],
+        speed_kmh: float,
+        stop_minutes: float,
+        seed: int,
+) -> None:
+    rng = random.Random(seed)
+    restaurant_points: List[Point] = [random_point(rng) for _ in range(restaurants)]
+    orders: List[SimulatedOrder] = generate_orders(rng, restaurants, orders_per_hour, hours)
+
+    print(f'Курьеров: {couriers}, ресторанов: {restaurants}, заказов за {hours} ч: {len(orders)}')
+    for capacity in capacities:
+        started = perf_counter()
+        delivered, average_minutes = simulate(
+            orders, restaurant_points, couriers, capacity, hours, speed_kmh, stop_minutes, seed
+        )
+        elapsed = perf_counter() - started
+        print(f'Вместимость {capacity}: {delivered / (couriers * hours):.2f} доставок на курьеро-час, '
+              f'доставлено {delivered}, среднее время доставки {average_minutes:.0f} мин '
+              f'(моделирование {elapsed:.1f} с)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--couriers', type=int, default=50, help='Количество курьеров')
+    parser.add_argument('--restaurants', type=int, default=40, help='Количество ресторанов')
+    parser.add_argument('--orders-per-hour', type=float, default=150, help='Заказов в час')
+    parser.add_argument('--hours', type=int, default=12, help='Длина рабочего дня в часах')
+    parser.add_argument('--capacities', type=int, nargs='+', default=[1, 2, 3, 4],
+                        help='Вместимости курьера для сравнения')
+    parser.add_argument('--speed', type=float, default=20, help='Скорость курьера/в км/ч')
+    parser.add_argument('--stop-minutes', type=float, default=3,
+                        help='Время на одну точку маршрута/в минутах')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел')
+    args = parser.parse_args()
+
+    main(args.couriers, args.restaurants, args.orders_per_hour, args.hours, args.capacities,
+         args.speed, args.stop_minutes, args.seed)
@@ -0,0 +1,104 @@
+"""Микробенчмарк сериализации списков заказов.
+
+Сравниваем стандартный путь FastAPI (валидация по «response_model», jsonable_encoder
+и stdlib json) с однократной валидацией через TypeAdapter и рендером через orjson.
+
+Запуск из папки «courier_service»:
+    ~$ python -m benchmarks.bench_serialization --items 10000
+"""
+
+import argparse
+import asyncio
+import statistics
+from datetime import datetime, time
+from time import perf_counter
+from typing import Awaitable, Callable, List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from src.core.responses import render
+from src.delivery.models import Order, Restaurant
+from src.delivery.schemas import CourierOrdersInfoPyd
+from src.users.models import User
+
+
+def make_orders(count: int) -> List[Order]:
+    """Создаём ORM-объекты заказов со связанными ресторанами и пользователями, без БД."""
+
+    restaurants = [
+        Restaurant(
+            id=i, name=f'Ресторан {i}', opening_time=time(9, 0), closing_time=time(23, 0),
+            duration_delivery=40, city='Тюмень', street='Ленина', house_number=str(i),
+        )
+        for i in range(50)
+    ]
+    users = [
+        User(
+            id=i, name='Иван', surname='Иванов', phone_number=f'+7999{i:07d}',
+            city='Тюмень', street='Республики', house_number=str(i % 200),
+        )
+        for i in range(count // 3 + 1)
+    ]
+    return [
+        Order(
+            id=i, status='Поиск курьера', start_time=datetime(2024, 1, 6, 16, 22, 31),
+            restaurant=restaurants[i % len(restaurants)], user=users[i % len(users)],
+        )
+        for i in range(count)
+    ]
+
+
+async def fastapi_path(orders: List[Order]) -> bytes:
+    """Путь FastAPI по умолчанию: валидация по «response_model» и stdlib json."""
+
+    field = create_response_field(name='Response', type_=List[CourierOrdersInfoPyd])
+    content = await serialize_response(field=field, response_content=orders)
+    return JSONResponse(content).body
+
+
+async def render_path(orders: List[Order]) -> bytes:
+    """Однократная валидация через TypeAdapter и рендер через orjson."""
+
+    return render(List[CourierOrdersInfoPyd], orders).body
+
+
+async def measure(
+        func: Callable[[List[Order]], Awaitable[bytes]],
+        orders: List[Order],
+        rounds: int,
+) -> List[float]:
+    """Замеряем время нескольких прогонов, в миллисекундах."""
+
+    await func(orders)  # прогрев: сборка валидаторов и TypeAdapter
+    timings = []
+    for _ in range(rounds):
+        started = perf_counter()
+        await func(orders)
+        timings.append((perf_counter() - started) * 1000)
+    return timings
+
+
+async def main(items: int, rounds: int) -> None:
+    orders = make_orders(items)
+
+    assert await fastapi_path(orders) == await render_path(orders), 'Ответы различаются'
+
+    baseline = await measure(fastapi_path, orders, rounds)
+    fast = await measure(render_path, orders, rounds)
+
+    print(f'Заказов в ответе: {items}, прогонов: {rounds}')
+    for name, timings in (('fastapi + json', baseline), ('TypeAdapter + orjson', fast)):
+        print(f'{name:>22}: медиана {statistics.median(timings):8.2f} мс, минимум {min(timings):8.2f} мс')
+    print(f'Ускорение по медиане: x{statistics.median(baseline) / statistics.median(fast):.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--items', type=int, default=10_000, help='Количество заказов в списке')
+    parser.add_argument('--rounds', type=int, default=10, help='Количество прогонов')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.items, args.rounds))
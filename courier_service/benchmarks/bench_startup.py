@@ -0,0 +1,143 @@
+"""Бенчмарк холодного запуска воркера.
+
+Каждый запуск — отдельный процесс Python с «-X importtime», который по очереди:
+    - импортирует «src.main» (импорт модулей и сборка приложения);
+    - выполняет startup lifespan, то есть прогрев воркера (нужна БД, «--no-lifespan» пропускает);
+    - отвечает на первый запрос к API с проверкой токена и на первый запрос к
+      админ панели: python-jose и sqladmin импортируются при первом использовании.
+
+Печатаем медиану каждого этапа по «--repeat» запускам и модули, импорт которых
+занял больше всего времени: собственное время модуля и вместе с модулями, которые
+он импортировал. Модули сторонних библиотек группируются по пакету верхнего уровня,
+модули, импортированные при первом запросе, тоже учитываются.
+
+Запуск из папки «courier_service»:
+    ~$ python -m benchmarks.bench_startup --repeat 5 --top 20
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from contextlib import AsyncExitStack
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+PHASES = ('import', 'lifespan', 'first_request', 'first_admin_request')
+
+
+async def boot(lifespan: bool) -> Dict[str, float]:
+    """Запускаем приложение в текущем процессе и замеряем этапы запуска, в секундах."""
+
+    timings: Dict[str, float] = {}
+    started: float = perf_counter()
+    from src.main import app
+    timings['import'] = perf_counter() - started
+
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with AsyncExitStack() as stack:
+        if lifespan:
+            mark: float = perf_counter()
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            timings['lifespan'] = perf_counter() - mark
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            # неверный токен: запрос проходит проверку токена, но не обращается к БД
+            mark = perf_counter()
+            await client.get('/api/v1/couriers/available_orders', headers={'Authorization': 'Bearer -'})
+            timings['first_request'] = perf_counter() - mark
+            mark = perf_counter()
+            await client.get('/admin/')
+            timings['first_admin_request'] = perf_counter() - mark
+    return timings
+
+
+def _group_name(module: str) -> str:
+    # модули приложения по отдельности, сторонние — по пакетам верхнего уровня
+    return module if module.startswith('src') else module.split('.')[0]
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[float, float]]:
+    """Время импорта по модулям приложения и пакетам сторонних библиотек из вывода «-X importtime».
+
+    Собственное время — сумма собственного времени модулей группы. Общее время —
+    сумма накопленного времени модулей группы, импортированных из другой группы,
+    то есть вместе с тем, что группа импортировала сама.
+
+    Returns:
+        - Dict[str, Tuple[float, float]]: Собственное и общее время групп, в секундах.
+    """
+
+    lines: List[Tuple[int, float, float, str]] = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        # вложенность импорта — отступ по два пробела на уровень
+        depth: int = (len(name) - len(name.lstrip()) - 1) // 2
+        lines.append((depth, int(own) / 1e6, int(cumulative) / 1e6, name.strip()))
+
+    groups: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0])
+    ancestors: List[str] = []
+    # модуль печатается после вложенных в него, поэтому идём с конца
+    for depth, own, cumulative, name in reversed(lines):
+        del ancestors[depth:]
+        group: str = _group_name(name)
+        groups[group][0] += own
+        if not ancestors or _group_name(ancestors[-1]) != group:
+            groups[group][1] += cumulative
+        ancestors.append(name)
+    return {group: (own, total) for group, (own, total) in groups.items()}
+
+
+def run_once(lifespan: bool) -> Tuple[Dict[str, float], Dict[str, Tuple[float, float]]]:
+    command: List[str] = [sys.executable, '-X', 'importtime', '-m', 'benchmarks.bench_startup', '--child']
+    if not lifespan:
+        command.append('--no-lifespan')
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    timings: Dict[str, float] = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(result.stderr)
+
+
+def main(args: argparse.Namespace) -> None:
+    runs: List[Dict[str, float]] = []
+    imports: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+    for _ in range(args.repeat):
+        timings, modules = run_once(not args.no_lifespan)
+        runs.append(timings)
+        for name, times in modules.items():
+            imports[name].append(times)
+
+    print(f'Медиана по {args.repeat} запускам, мс:')
+    for phase in PHASES:
+        values: List[float] = [run[phase] for run in runs if phase in run]
+        if values:
+            print(f'  {phase:<22} {statistics.median(values) * 1000:>9.1f}')
+
+    medians: Dict[str, Tuple[float, float]] = {
+        name: (statistics.median(own for own, _ in times), statistics.median(cum for _, cum in times))
+        for name, times in imports.items()
+    }
+    print(f'\n{"Модуль или пакет":<45} {"своё, мс":>10} {"всего, мс":>10}')
+    for name, (own, cumulative) in sorted(medians.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f'{name:<45} {own * 1000:>10.1f} {cumulative * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--no-lifespan', action='store_true', help='Не выполнять прогрев, БД не нужна')
+    parser.add_argument('--repeat', type=int, default=5, help='Количество запусков')
+    parser.add_argument('--top', type=int, default=25, help='Сколько модулей показать')
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(boot(not args.no_lifespan))))
+    else:
+        main(args)
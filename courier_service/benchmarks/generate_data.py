@@ -0,0 +1,286 @@
+"""Генератор синтетических данных для БД масштаба бенчмарков.
+
+Создаёт город: рестораны с часами работы, покупателей, курьеров и заказы.
+Доставленные заказы распределены по последним «days» дням с пиками в обед и
+вечером, популярность ресторанов и покупателей неравномерная, время доставки
+разбросано вокруг «duration_delivery» ресторана. Кроме истории создаются
+активные заказы за последний час: часть ждёт курьера, часть уже в пути.
+
+Строки пишутся командой COPY через asyncpg, минуя ORM и CRUD, с заранее
+известными ID, поэтому миллионы строк добавляются за минуты. Пароли хэшируются
+bcrypt только для небольшого набора паролей «password-<N>», у покупателя или
+курьера с ID «i» пароль «password-<i % PASSWORD_POOL>».
+
+Результат определяется зерном генератора: при одинаковом «--seed» и пустых
+таблицах («--truncate») получаются одинаковые данные, включая хэши паролей.
+Время заказов отсчитывается от текущего дня, остальное от даты запуска не зависит.
+
+БД берётся из переменных окружения приложения, таблицы должны быть созданы миграциями.
+
+Запуск из папки «courier_service»:
+    ~$ python -m benchmarks.generate_data --restaurants 1000 --users 1000000 --couriers 100000 \\
+           --orders 10000000 --seed 1 --truncate
+"""
+
+import argparse
+import asyncio
+import random
+import string
+from datetime import date, datetime, time, timedelta, timezone
+from itertools import accumulate
+from time import perf_counter
+from typing import Any, Iterator, List, NamedTuple, Sequence, Set, Tuple
+
+import pytz
+from passlib.hash import bcrypt
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from src.configs import TIMEZONE
+from src.database import engine
+from src.delivery.models import Courier, Order, Restaurant
+from src.users.models import User
+
+CHUNK_SIZE = 100_000
+PASSWORD_POOL = 8
+STREETS = [
+    'Ленина', 'Республики', 'Мельникайте', 'Ватутина', 'Широтная', 'Пермякова', 'Профсоюзная',
+    'Орджоникидзе', 'Малыгина', 'Герцена', 'Холодильная', 'Харьковская', 'Николая Федорова',
+]
+# доля заказов по часам местного времени: пики в обед и вечером
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 4, 6, 6, 7, 10, 14, 13, 9, 7, 8, 11, 15, 16, 13, 9, 5, 2]
+DELIVERED = 'Доставлен'
+SEARCHING = 'Поиск курьера'
+IN_TRANSIT = 'В пути'
+BUSY = 'Выполняет заказ'
+_BCRYPT_SALT_CHARS = './' + string.ascii_uppercase + string.ascii_lowercase + string.digits
+
+
+class City(NamedTuple):
+    """Размеры города."""
+
+    restaurants: int
+    users: int
+    couriers: int
+    orders: int  # доставленных заказов в истории
+    active_orders: int  # заказов за последний час, ожидающих курьера или в пути
+    days: int  # за сколько последних дней история заказов
+
+
+class GeneratedCity(NamedTuple):
+    """ID созданных строк. Номер телефона получается из ID функциями «user_phone» и «courier_phone»."""
+
+    restaurant_ids: range
+    user_ids: range
+    courier_ids: range
+    busy_courier_ids: Set[int]
+
+
+def user_phone(user_id: int) -> str:
+    return f'+78{user_id:09d}'
+
+
+def courier_phone(courier_id: int) -> str:
+    return f'+77{courier_id:09d}'
+
+
+def password_hashes(rng: random.Random, count: int = PASSWORD_POOL) -> List[str]:
+    """Хэши паролей «password-<N>» с солью из генератора, чтобы они тоже зависели только от зерна."""
+
+    return [
+        bcrypt.using(salt=''.join(rng.choices(_BCRYPT_SALT_CHARS, k=21)) + rng.choice('.Oeu'))
+        .hash(f'password-{i}')
+        for i in range(count)
+    ]
+
+
+def _popularity(rng: random.Random, count: int) -> List[float]:
+    # накопленные веса: у немногих ресторанов и покупателей заказов намного больше, чем у остальных
+    return list(accumulate(rng.paretovariate(1.2) for _ in range(count)))
+
+
+def restaurant_rows(rng: random.Random, ids: range) -> Iterator[Tuple[Any, ...]]:
+    for restaurant_id in ids:
+        if rng.random() < 0.1:
+            opening, closing = time(0, 0), time(23, 59, 59)
+        else:
+            opening, closing = time(rng.randint(7, 11), rng.choice((0, 30))), time(rng.randint(21, 23), 0)
+        yield (
+            restaurant_id, f'Ресторан {restaurant_id}', opening, closing, rng.randint(20, 90),
+            'Тюмень', rng.choice(STREETS), str(rng.randint(1, 200)),
+        )
+
+
+def person_rows(
+        rng: random.Random,
+        ids: range,
+        phone: Any,
+        hashes: Sequence[str],
+        with_address: bool,
+) -> Iterator[Tuple[Any, ...]]:
+    for person_id in ids:
+        row: Tuple[Any, ...] = (
+            person_id, f'Имя {person_id}', f'Фамилия {person_id}', phone(person_id),
+            hashes[person_id % len(hashes)],
+        )
+        if with_address:
+            row += ('Тюмень', rng.choice(STREETS), str(rng.randint(1, 200)))
+        yield row
+
+
+def order_rows(
+        rng: random.Random,
+        city: City,
+        first_id: int,
+        generated: GeneratedCity,
+        durations: Sequence[int],
+        today: date,
+) -> Iterator[Tuple[Any, ...]]:
+    """Доставленные заказы по дням, в порядке создания, затем активные заказы."""
+
+    tz = pytz.timezone(TIMEZONE)
+    restaurant_weights: List[float] = _popularity(rng, len(generated.restaurant_ids))
+    user_weights: List[float] = _popularity(rng, len(generated.user_ids))
+    hours: List[int] = list(range(24))
+    order_id: int = first_id
+
+    for day in range(city.days, 0, -1):
+        day_date: date = today - timedelta(days=day)
+        midnight: float = tz.localize(datetime.combine(day_date, time())).timestamp()
+        count: int = city.orders // city.days + (1 if day <= city.orders % city.days else 0)
+
+        seconds: List[float] = sorted(
+            hour * 3600 + rng.random() * 3600 for hour in rng.choices(hours, weights=HOUR_WEIGHTS, k=count)
+        )
+        restaurant_indexes = rng.choices(
+            range(len(restaurant_weights)), cum_weights=restaurant_weights, k=count
+        )
+        user_indexes = rng.choices(range(len(user_weights)), cum_weights=user_weights, k=count)
+
+        for second, restaurant_index, user_index in zip(seconds, restaurant_indexes, user_indexes):
+            minutes: float = min(rng.lognormvariate(0, 0.35) * durations[restaurant_index], 24 * 60)
+            yield (
+                order_id, DELIVERED,
+                # время создания хранится без часового пояса, по местному времени
+                datetime.combine(day_date, time()) + timedelta(seconds=int(second)),
+                datetime.fromtimestamp(midnight + second + minutes * 60, timezone.utc),
+                generated.restaurant_ids[restaurant_index], rng.choice(generated.courier_ids),
+                generated.user_ids[user_index],
+            )
+            order_id += 1
+
+    now: datetime = datetime.now(tz).replace(tzinfo=None, microsecond=0)
+    busy: List[int] = sorted(generated.busy_courier_ids)
+    for i in range(city.active_orders):
+        restaurant_index = rng.randrange(len(generated.restaurant_ids))
+        yield (
+            order_id, IN_TRANSIT if i < len(busy) else SEARCHING,
+            now - timedelta(seconds=rng.randrange(3600)), None,
+            generated.restaurant_ids[restaurant_index], busy[i] if i < len(busy) else None,
+            rng.choice(generated.user_ids),
+        )
+        order_id += 1
+
+
+async def _copy(conn: Any, table: str, columns: Sequence[str], rows: Iterator[Tuple[Any, ...]]) -> int:
+    # COPY порциями по «CHUNK_SIZE» строк, чтобы не держать в памяти всю таблицу
+    copied = 0
+    while True:
+        chunk: List[Tuple[Any, ...]] = [row for _, row in zip(range(CHUNK_SIZE), rows)]
+        if not chunk:
+            return copied
+        await conn.copy_records_to_table(table, records=chunk, columns=list(columns))
+        copied += len(chunk)
+
+
+async def _next_id(engine: AsyncEngine, table: Any) -> int:
+    async with engine.connect() as conn:
+        return (await conn.scalar(select(func.coalesce(func.max(table.id), 0)))) + 1
+
+
+async def generate(engine: AsyncEngine, city: City, seed: int, truncate: bool = False) -> GeneratedCity:
+    """Заполняем БД городом заданного размера.
+
+    Args:
+        - engine (AsyncEngine): Движок БД с драйвером asyncpg.
+        - city (City): Размеры города.
+        - seed (int): Зерно генератора случайных чисел.
+        - truncate (bool): Очистить таблицы перед заполнением, чтобы ID тоже повторялись.
+
+    Returns:
+        - GeneratedCity: ID созданных ресторанов, покупателей и курьеров.
+    """
+
+    rng = random.Random(seed)
+    hashes: List[str] = password_hashes(rng)
+
+    if truncate:
+        async with engine.begin() as conn:
+            await conn.execute(text('TRUNCATE restaurants, users, couriers, orders RESTART IDENTITY CASCADE'))
+
+    first_ids: List[int] = [await _next_id(engine, model) for model in (Restaurant, User, Courier, Order)]
+    restaurant_ids = range(first_ids[0], first_ids[0] + city.restaurants)
+    user_ids = range(first_ids[1], first_ids[1] + city.users)
+    courier_ids = range(first_ids[2], first_ids[2] + city.couriers)
+    busy_courier_ids: Set[int] = set(rng.sample(courier_ids, min(city.active_orders // 2, city.couriers)))
+    generated = GeneratedCity(restaurant_ids, user_ids, courier_ids, busy_courier_ids)
+
+    restaurants: List[Tuple[Any, ...]] = list(restaurant_rows(rng, restaurant_ids))
+    durations: List[int] = [row[4] for row in restaurants]
+
+    async with engine.begin() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        await _copy(raw, 'restaurants', [
+            'id', 'name', 'opening_time', 'closing_time', 'duration_delivery', 'city', 'street',
+            'house_number',
+        ], iter(restaurants))
+        await _copy(raw, 'users', [
+            'id', 'name', 'surname', 'phone_number', 'hashed_password', 'city', 'street', 'house_number',
+        ], person_rows(rng, user_ids, user_phone, hashes, with_address=True))
+        await _copy(raw, 'couriers', ['id', 'name', 'surname', 'phone_number', 'hashed_password'],
+                    person_rows(rng, courier_ids, courier_phone, hashes, with_address=False))
+        await _copy(raw, 'orders', [
+            'id', 'status', 'start_time', 'end_time', 'restaurant_id', 'courier_id', 'user_id',
+        ], order_rows(rng, city, first_ids[3], generated, durations, date.today()))
+
+        if busy_courier_ids:
+            await conn.execute(
+                Courier.__table__.update().where(Courier.id.in_(busy_courier_ids)).values(status=BUSY)
+            )
+        # последовательности ID продолжаются после строк, добавленных с явными ID
+        for table in ('restaurants', 'users', 'couriers', 'orders'):
+            await conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT coalesce(max(id), 0) + 1 FROM {table}), false)"
+            ))
+
+    return generated
+
+
+async def main(city: City, seed: int, truncate: bool) -> None:
+    started = perf_counter()
+    await generate(engine, city, seed, truncate)
+    await engine.dispose()
+
+    elapsed = perf_counter() - started
+    rows: int = city.restaurants + city.users + city.couriers + city.orders + city.active_orders
+    print(f'Добавлено {rows:,} строк за {elapsed:.1f} с ({rows / elapsed:,.0f} строк/с)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--restaurants', type=int, default=1000, help='Количество ресторанов')
+    parser.add_argument('--users', type=int, default=100_000, help='Количество покупателей')
+    parser.add_argument('--couriers', type=int, default=10_000, help='Количество курьеров')
+    parser.add_argument('--orders', type=int, default=1_000_000, help='Доставленных заказов в истории')
+    parser.add_argument('--active-orders', type=int, default=1000, help='Заказов за последний час')
+    parser.add_argument('--days', type=int, default=90, help='За сколько дней история заказов')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел')
+    parser.add_argument('--truncate', action='store_true', help='Очистить таблицы перед заполнением')
+    args = parser.parse_args()
+
+    asyncio.run(main(
+        City(args.restaurants, args.users, args.couriers, args.orders, args.active_orders, args.days),
+        args.seed, args.truncate,
+    ))
@@ -0,0 +1,225 @@
+"""Воспроизведение записанного трафика API.
+
+Запросы, записанные middleware «src.core.capture» в файл «CAPTURE_FILE» (вместе со
+старыми файлами после ротации), повторяются на тестовом экземпляре приложения в
+том же порядке и с теми же интервалами, либо быстрее в «--speed» раз («--speed 0» —
+без пауз, насколько позволяет «--concurrency»). Так изменения роутеров проверяются
+на реальной смеси запросов, а не только на сценариях «benchmarks.bench_load».
+
+Тестовая БД заполняется генератором «benchmarks.generate_data», приложение
+запускается так же, как в «benchmarks.bench_load» («--transport asgi» или «uvicorn»).
+В записи нет персональных данных, поэтому запрос собирается заново:
+    - токен выдаётся случайному покупателю или курьеру сгенерированного города по роли
+      из записи, запросы с неизвестной ролью получают неверный токен;
+    - путь и числовые параметры строки запроса берутся из записи, поэтому ID в пути
+      должны существовать в тестовой БД (генератор нумерует объекты с 1);
+    - тело запроса заполняется значениями-заглушками по его форме: строки «x», числа 1,
+      поэтому запросы регистрации и входа обычно получают ответ 422 или 401.
+
+Для каждого маршрута печатаем задержки p50/p95 при записи и при воспроизведении и
+изменение кодов ответов. Записанная задержка — время обработки в приложении, без сети.
+Результат сохраняется в JSON («--output») и сравнивается с прошлым воспроизведением
+того же файла («--baseline») так же, как в «benchmarks.bench_load».
+
+Запуск из папки «courier_service»:
+    ~$ python -m benchmarks.replay /var/log/courier/capture.jsonl --speed 10 --output replay.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import orjson
+from src.core.capture import traffic_capture
+from src.users.security import COURIER_ROLE, USER_ROLE
+
+from .bench_load import (Dataset, Stats, add_seed_arguments, compare, connect,
+                         seed_dataset, summarize)
+
+PLACEHOLDERS: Dict[str, Any] = {'str': 'x', 'int': 1, 'float': 1.0, 'bool': False}
+INVALID_TOKEN = 'invalid'
+
+
+def read_capture(path: str) -> List[Dict[str, Any]]:
+    """Записанные запросы из файла и его старых копий после ротации, по времени."""
+
+    paths: List[str] = [path]
+    index = 1
+    while os.path.exists(f'{path}.{index}'):
+        paths.append(f'{path}.{index}')
+        index += 1
+
+    records: List[Dict[str, Any]] = []
+    for name in paths:
+        with open(name, 'rb') as file:
+            records.extend(orjson.loads(line) for line in file if line.strip())
+    return sorted(records, key=lambda record: record['ts'])
+
+
+def placeholder(shape: Any) -> Any:
+    """Значение-заглушка по форме из «src.core.capture.shape»."""
+
+    if isinstance(shape, dict):
+        return {key: placeholder(item) for key, item in shape.items()}
+    if isinstance(shape, list):
+        return [placeholder(shape[0])] * shape[1] if shape else []
+    return PLACEHOLDERS.get(shape) if shape is not None else None
+
+
+def build_request(record: Dict[str, Any], dataset: Dataset, rng: random.Random) -> Dict[str, Any]:
+    """Аргументы «httpx.AsyncClient.request» для записанного запроса."""
+
+    token: Optional[str] = None
+    if record['role'] == USER_ROLE:
+        token = rng.choice(dataset.user_tokens)
+    elif record['role'] == COURIER_ROLE:
+        token = rng.choice(dataset.courier_tokens)
+    elif record['role'] != 'anonymous':
+        token = INVALID_TOKEN
+
+    request: Dict[str, Any] = {
+        'method': record['method'],
+        'url': record['path'],
+        'params': {key: PLACEHOLDERS['str'] if value == 'str' else value
+                   for key, value in record['query'].items()},
+        'headers': {'Authorization': f'Bearer {token}'} if token else {},
+    }
+    body: Any = record['body']
+    if body is None:
+        return request
+    if record['content_type'] == 'application/x-www-form-urlencoded':
+        request['data'] = placeholder(body)
+    elif isinstance(body, str) and body.startswith('bytes['):
+        request['content'] = bytes(int(body[6:-1]))
+        request['headers']['Content-Type'] = record['content_type'] or 'application/octet-stream'
+    else:
+        request['json'] = placeholder(body)
+    return request
+
+
+def captured_stats(records: List[Dict[str, Any]]) -> Stats:
+    """Задержки и коды ответов из записи."""
+
+    stats = Stats()
+    for record in records:
+        stats.add(f'{record["method"]} {record["route"]}', record['duration_ms'] / 1000, record['status'])
+    return stats
+
+
+async def replay(
+        client: httpx.AsyncClient,
+        records: List[Dict[str, Any]],
+        dataset: Dataset,
+        rng: random.Random,
+        speed: float,
+        concurrency: int,
+) -> Stats:
+    """Повторяем запросы с записанными интервалами, ускоренными в «speed» раз."""
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks: List[asyncio.Task] = []
+
+    async def send(record: Dict[str, Any]) -> Tuple[str, float, int]:
+        name = f'{record["method"]} {record["route"]}'
+        started = perf_counter()
+        try:
+            response: httpx.Response = await client.request(**build_request(record, dataset, rng))
+            return name, perf_counter() - started, response.status_code
+        except httpx.HTTPError:
+            return name, perf_counter() - started, 599
+        finally:
+            semaphore.release()
+
+    first_ts: float = records[0]['ts'] if records else 0
+    started: float = perf_counter()
+    for record in records:
+        if speed:
+            delay: float = (record['ts'] - first_ts) / speed - (perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(send(record)))
+
+    stats = Stats()
+    for name, latency, status in await asyncio.gather(*tasks):
+        stats.add(name, latency, status)
+    return stats
+
+
+def print_diff(captured: Dict[str, Dict[str, Any]], replayed: Dict[str, Dict[str, Any]]) -> None:
+    print(f'{"Маршрут":<60} {"Запросов":>8} {"p50 зап.":>9} {"p50 восп.":>10} '
+          f'{"p95 зап.":>9} {"p95 восп.":>10} {"p95":>6}  Коды ответов')
+    for name, row in replayed.items():
+        base: Dict[str, Any] = captured[name]
+        change: str = f'{row["p95_ms"] / base["p95_ms"] - 1:+.0%}' if base['p95_ms'] else ''
+        statuses: str = (
+            '' if row['statuses'] == base['statuses'] else f'{base["statuses"]} -> {row["statuses"]}'
+        )
+        print(f'{name:<60} {row["count"]:>8} {base["p50_ms"]:>9.1f} {row["p50_ms"]:>10.1f} '
+              f'{base["p95_ms"]:>9.1f} {row["p95_ms"]:>10.1f} {change:>6}  {statuses}')
+
+
+async def main(args: argparse.Namespace) -> int:
+    records: List[Dict[str, Any]] = read_capture(args.capture)[:args.limit]
+    if not records:
+        print('В записи нет запросов')
+        return 1
+    captured_duration: float = max(records[-1]['ts'] - records[0]['ts'], 1e-3)
+    print(f'Записано {len(records)} запросов за {captured_duration:.1f} с')
+
+    # воспроизведённые запросы не должны попасть в запись
+    os.environ.pop('CAPTURE_FILE', None)
+    traffic_capture.path = None
+
+    rng = random.Random(args.seed)
+    dataset: Dataset = await seed_dataset(args)
+
+    started: float = perf_counter()
+    async with connect(args.transport, args.port, args.concurrency) as client:
+        stats: Stats = await replay(client, records, dataset, rng, args.speed, args.concurrency)
+    duration: float = perf_counter() - started
+    print(f'Воспроизведено за {duration:.1f} с\n')
+
+    summary: Dict[str, Dict[str, Any]] = summarize(stats, duration)
+    print_diff(summarize(captured_stats(records), captured_duration), summary)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'meta': {'capture': args.capture, 'speed': args.speed, 'transport': args.transport},
+                'endpoints': summary,
+            }, file, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline: Dict[str, Dict[str, Any]] = json.load(file)['endpoints']
+        if not compare(summary, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('capture', help='Файл с записанными запросами, «CAPTURE_FILE»')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='Во сколько раз ускорить воспроизведение, 0 — без пауз')
+    parser.add_argument('--concurrency', type=int, default=100, help='Одновременных запросов, не больше')
+    parser.add_argument('--limit', type=int, help='Воспроизвести только первые N запросов')
+    parser.add_argument('--transport', choices=['asgi', 'uvicorn'], default='asgi',
+                        help='Вызов приложения в процессе бенчмарка или по сети через uvicorn')
+    parser.add_argument('--port', type=int, default=8765, help='Порт uvicorn')
+    parser.add_argument('--output', help='Файл JSON для результатов')
+    parser.add_argument('--baseline', help='Файл JSON с результатами прошлого воспроизведения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое ухудшение, доля')
+    add_seed_arguments(parser)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args)))
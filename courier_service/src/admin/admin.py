@@ -1,12 +1,22 @@
+import os
+
 import pytz
-from sqladmin import Admin, ModelView
+from sqladmin import Admin, BaseView, ModelView, expose
 from src.configs import TIMEZONE
+from src.core.request_profiling import profile_store
+from src.core.slow_queries import slow_query_log
+from src.core.tracing import trace_exporter
 from src.delivery.models import Courier, Order, Restaurant
 from src.users.models import User
+from starlette.responses import PlainTextResponse
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
 
 
 def setup_admin(app, engine):
-    admin = Admin(app, engine, title='Админ Панель')
+    """Подключаем админ панель к приложению «app» по адресу «/admin»."""
+
+    admin = Admin(app, engine, title='Админ Панель', templates_dir=TEMPLATES_DIR)
 
     class UserAdmin(ModelView, model=User):
         """Отображение пользователей/покупателей."""
@@ -101,7 +111,77 @@ def setup_admin(app, engine):
             Order.user_id,
         ]
 
+    class TracesAdmin(BaseView):
+        """Последние трассировки запросов к API из памяти воркера."""
+
+        name = 'Трассировки'
+        identity = 'traces'
+        icon = 'fa-solid fa-stopwatch'
+
+        @expose('/traces', identity='traces')
+        async def traces_page(self, request):
+            """Список трассировок и отрезки выбранной трассировки."""
+
+            trace_id = request.query_params.get('trace_id')
+            return await self.templates.TemplateResponse(request, 'traces.html', {
+                'title': 'Трассировки',
+                'traces': trace_exporter.recent(),
+                'trace': trace_exporter.find(trace_id) if trace_id else None,
+            })
+
+    class ProfilesAdmin(BaseView):
+        """Отчёты профилировщика по запросам с заголовком «X-Profile-Token»."""
+
+        name = 'Профили запросов'
+        identity = 'profiles'
+        icon = 'fa-solid fa-fire'
+
+        @expose('/profiles', identity='profiles')
+        async def profiles_page(self, request):
+            """Список отчётов и выбранный отчёт."""
+
+            profile_id = request.query_params.get('profile_id')
+            return await self.templates.TemplateResponse(request, 'profiles.html', {
+                'title': 'Профили запросов',
+                'profiles': profile_store.recent(),
+                'profile': profile_store.find(profile_id) if profile_id else None,
+            })
+
+        @expose('/profiles/folded', identity='profile_folded')
+        async def profile_folded(self, request):
+            """Стеки отчёта в свёрнутом формате для flamegraph.pl и speedscope."""
+
+            profile_id = request.query_params.get('profile_id', '')
+            profile = profile_store.find(profile_id)
+            if profile is None:
+                return PlainTextResponse('Профиль не найден.', status_code=404)
+            return PlainTextResponse(profile['folded'], headers={
+                'Content-Disposition': f'attachment; filename="{profile_id}.folded"'
+            })
+
+    class SlowQueriesAdmin(BaseView):
+        """Журнал медленных запросов к БД с их планами."""
+
+        name = 'Медленные запросы'
+        identity = 'slow_queries'
+        icon = 'fa-solid fa-hourglass-half'
+
+        @expose('/slow_queries', identity='slow_queries')
+        async def slow_queries_page(self, request):
+            """Список медленных запросов и план выбранного запроса."""
+
+            query_id = request.query_params.get('query_id')
+            return await self.templates.TemplateResponse(request, 'slow_queries.html', {
+                'title': 'Медленные запросы',
+                'queries': slow_query_log.recent(),
+                'query': slow_query_log.find(query_id) if query_id else None,
+            })
+
     admin.add_view(UserAdmin)
     admin.add_view(RestaurantAdmin)
     admin.add_view(CourierAdmin)
     admin.add_view(OrderAdmin)
+    admin.add_base_view(TracesAdmin)
+    admin.add_base_view(ProfilesAdmin)
+    admin.add_base_view(SlowQueriesAdmin)
+    return admin
@@ -0,0 +1,45 @@
+"""Отложенное подключение админ панели.
+
+sqladmin вместе с WTForms и Jinja2 импортируется несколько сотен миллисекунд, а
+админ панель открывают редко. Поэтому по адресу «/admin» монтируется «LazyAdmin»,
+который импортирует «src.admin.admin» и создаёт админ панель при первом запросе
+к ней или при запуске воркера, если задан «ADMIN_PRELOAD».
+"""
+
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.applications import Starlette
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class LazyAdmin:
+    """ASGI-приложение админ панели, которое создаётся при первом обращении."""
+
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self._app: Optional[ASGIApp] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._app is not None
+
+    @property
+    def routes(self) -> List[BaseRoute]:
+        # маршруты нужны «url_for» в шаблонах админ панели, то есть уже после загрузки
+        return getattr(self._app, 'routes', [])
+
+    def load(self) -> ASGIApp:
+        """Импортируем sqladmin и создаём админ панель, если она ещё не создана."""
+
+        if self._app is None:
+            from .admin import setup_admin
+
+            # sqladmin монтирует админ панель в переданное приложение, а нам нужно
+            # только само приложение админ панели, его монтирует «LazyAdmin»
+            self._app = setup_admin(Starlette(), self.engine).admin
+        return self._app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.load()(scope, receive, send)
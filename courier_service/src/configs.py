@@ -15,3 +15,89 @@ TIMEZONE = os.environ.get('TIMEZONE')
 SECRET_KEY = os.environ.get('SECRET_KEY')
 
 DB_HOST_TEST = os.environ.get('DB_HOST_TEST')
+
+# Пул соединений с БД в каждом воркере: сколько соединений держать открытыми
+# и сколько можно открыть сверх них при нагрузке.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+
+# Контроль допуска к БД: сколько запросов воркера одновременно работают с БД (по
+# умолчанию — сколько соединений может выдать пул), сколько ждут в очереди, сколько
+# секунд запрос может ждать и через сколько секунд повторить отклонённый запрос.
+DB_ADMISSION_LIMIT = int(os.environ.get('DB_ADMISSION_LIMIT', DB_POOL_SIZE + DB_MAX_OVERFLOW))
+DB_ADMISSION_QUEUE_SIZE = int(os.environ.get('DB_ADMISSION_QUEUE_SIZE', 50))
+DB_ADMISSION_TIMEOUT = float(os.environ.get('DB_ADMISSION_TIMEOUT', 1))
+DB_ADMISSION_RETRY_AFTER = int(os.environ.get('DB_ADMISSION_RETRY_AFTER', 1))
+
+# Запуск через «python -m src.server»: адрес, порт, количество воркеров (0 — по
+# количеству доступных процессору ядер) и сколько секунд при остановке ждать
+# завершения начатых запросов.
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', 8000))
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 0))
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+
+# Админ панель: подключать ли её и создавать ли её при запуске воркера, а не при
+# первом запросе к «/admin».
+ADMIN_ENABLED = os.environ.get('ADMIN_ENABLED', '1').lower() in ('1', 'true', 'yes')
+ADMIN_PRELOAD = os.environ.get('ADMIN_PRELOAD', '').lower() in ('1', 'true', 'yes')
+
+# Режим отладки: профилирование SQL-запросов каждого запроса к API
+DEBUG = os.environ.get('DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# Автоматическое распределение заказов: интервал между раундами в секундах
+# (0 — выключено) и максимальное количество курьеров и заказов в одном раунде
+# (не больше 1000).
+MATCHING_INTERVAL = float(os.environ.get('MATCHING_INTERVAL', 0))
+MATCHING_BATCH_SIZE = int(os.environ.get('MATCHING_BATCH_SIZE', 500))
+
+# Сколько заказов курьер может выполнять одновременно
+COURIER_MAX_ORDERS = int(os.environ.get('COURIER_MAX_ORDERS', 1))
+
+# Сколько ответов со списками заказов ресторанов воркер хранит в памяти.
+RESTAURANT_ORDERS_CACHE_SIZE = int(os.environ.get('RESTAURANT_ORDERS_CACHE_SIZE', 1000))
+
+# JSON-RPC: сколько вызовов можно передать в одном пакете и сколько вызовов чтения
+# пакета выполняются одновременно (каждый занимает своё соединение с БД).
+RPC_MAX_BATCH_SIZE = int(os.environ.get('RPC_MAX_BATCH_SIZE', 10))
+RPC_READ_CONCURRENCY = int(os.environ.get('RPC_READ_CONCURRENCY', 3))
+
+# Трассировка запросов: доля запросов, для которых собираются трассировки (0 — только
+# запросы с заголовком «traceparent» с флагом записи), файл JSONL для выгрузки
+# трассировок и сколько последних трассировок хранить в памяти для админ панели.
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0))
+TRACE_FILE = os.environ.get('TRACE_FILE')
+TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', 200))
+
+# Профилирование отдельных запросов: секрет для заголовка «X-Profile-Token»
+# (без него профилирование выключено), интервал между снимками стека в секундах
+# и сколько последних отчётов хранить в памяти для админ панели.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.001))
+PROFILE_BUFFER_SIZE = int(os.environ.get('PROFILE_BUFFER_SIZE', 20))
+
+# Журнал медленных запросов к БД: порог в секундах (0 — выключен), выполнять ли
+# EXPLAIN ANALYZE для медленных SELECT вместо EXPLAIN и сколько записей хранить в памяти.
+SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD', 0.2))
+SLOW_QUERY_EXPLAIN_ANALYZE = os.environ.get('SLOW_QUERY_EXPLAIN_ANALYZE', '').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get('SLOW_QUERY_BUFFER_SIZE', 100))
+
+# Запись трафика для воспроизведения: файл JSONL (без него запись выключена), доля
+# записываемых запросов, размер файла в байтах, после которого он ротируется, и
+# сколько старых файлов хранить.
+CAPTURE_FILE = os.environ.get('CAPTURE_FILE')
+CAPTURE_SAMPLE_RATE = float(os.environ.get('CAPTURE_SAMPLE_RATE', 1))
+CAPTURE_MAX_BYTES = int(os.environ.get('CAPTURE_MAX_BYTES', 50 * 1024 * 1024))
+CAPTURE_BACKUP_COUNT = int(os.environ.get('CAPTURE_BACKUP_COUNT', 5))
+
+# Ограничение частоты запросов: файл с общими для воркеров счётчиками (лучше в
+# /dev/shm, чтобы он был в памяти), количество ячеек в нём, заголовок с адресом
+# клиента, который выставляет nginx (пусто — брать адрес соединения), и адреса или
+# сети через запятую, от которых этому заголовку можно верить.
+RATE_LIMIT_STORAGE = os.environ.get(
+    'RATE_LIMIT_STORAGE',
+    '/dev/shm/courier-service-rate-limit' if os.path.isdir('/dev/shm') else '/tmp/courier-service-rate-limit',
+)
+RATE_LIMIT_SLOTS = int(os.environ.get('RATE_LIMIT_SLOTS', 65536))
+RATE_LIMIT_REAL_IP_HEADER = os.environ.get('RATE_LIMIT_REAL_IP_HEADER', '')
+RATE_LIMIT_TRUSTED_PROXIES = os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '')
@@ -0,0 +1,184 @@
+"""Контроль допуска запросов к БД.
+
+Когда БД отвечает медленно, запросы копятся в ожидании соединения из пула, пока не
+истечёт таймаут пула SQLAlchemy (30 секунд). К этому времени клиент уже не ждёт
+ответа, а работа, начатая для него, только добавляет нагрузки. Поэтому перед
+выдачей сессии в «get_db» запрос проходит через «AdmissionController»:
+    - одновременно с БД работают не больше «DB_ADMISSION_LIMIT» запросов воркера;
+    - остальные ждут в очереди не дольше «DB_ADMISSION_TIMEOUT» секунд;
+    - если очередь заполнена или время ожидания вышло, запрос сразу получает ответ
+      503 с «Retry-After», не дожидаясь таймаута пула.
+
+Очередь приоритетная: запросы, которые меняют заказы (создание, взятие и
+завершение заказа), помечены «admission_priority(WRITE_PRIORITY)» и получают
+место раньше чтений. Если очередь заполнена, запрос записи вытесняет из неё
+последнее чтение. Долгие соединения (SSE, WebSocket) проходят без контроля,
+иначе они занимали бы места всё время подписки.
+
+Метрики: время ожидания в очереди по приоритетам, количество выполняемых и
+ожидающих запросов и отклонённые запросы по причинам.
+"""
+
+import asyncio
+import heapq
+import itertools
+from time import perf_counter
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram
+from starlette.types import Scope
+
+F = TypeVar('F', bound=Callable)
+
+WRITE_PRIORITY = 0
+READ_PRIORITY = 1
+PRIORITY_ATTRIBUTE = 'admission_priority'
+
+QUEUE_FULL = 'queue_full'
+TIMEOUT = 'timeout'
+EVICTED = 'evicted'
+
+ADMISSION_QUEUE_TIME = Histogram(
+    'db_admission_queue_seconds', 'Время ожидания допуска к БД', ['priority'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    'db_admission_in_flight', 'Запросы, допущенные к БД', multiprocess_mode='livesum'
+)
+ADMISSION_QUEUED = Gauge(
+    'db_admission_queued', 'Запросы в очереди допуска к БД', multiprocess_mode='livesum'
+)
+ADMISSION_REJECTIONS = Counter(
+    'db_admission_rejections', 'Запросы, отклонённые контролем допуска к БД', ['reason']
+)
+
+Waiter = Tuple[int, int, 'asyncio.Future[None]']
+
+
+class Overloaded(Exception):
+    """Запрос не допущен к БД: очередь заполнена, время ожидания вышло или его вытеснили."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+def admission_priority(priority: Optional[int]) -> Callable[[F], F]:
+    """Декоратор эндпоинта, который задаёт приоритет в очереди допуска к БД.
+
+    Указывается под декоратором роутера, как «rate_limit_cost».
+
+    Args:
+        - priority (Optional[int]): «WRITE_PRIORITY», «READ_PRIORITY» или None для
+          долгих соединений, которые проходят без контроля.
+    """
+
+    def decorator(endpoint: F) -> F:
+        setattr(endpoint, PRIORITY_ATTRIBUTE, priority)
+        return endpoint
+
+    return decorator
+
+
+def endpoint_priority(scope: Scope) -> Optional[int]:
+    """Приоритет эндпоинта, который обрабатывает запрос, None — без контроля."""
+
+    if scope['type'] == 'websocket':
+        return None
+    return getattr(scope.get('endpoint'), PRIORITY_ATTRIBUTE, READ_PRIORITY)
+
+
+class AdmissionController:
+    """Ограничение количества запросов воркера, одновременно работающих с БД.
+
+    Args:
+        - limit (int): Сколько запросов допускается одновременно.
+        - queue_size (int): Сколько запросов может ждать в очереди.
+        - timeout (float): Сколько секунд запрос может ждать в очереди.
+    """
+
+    def __init__(self, limit: int, queue_size: int, timeout: float) -> None:
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.queued = 0
+        self._waiters: List[Waiter] = []
+        self._counter = itertools.count()
+
+    def _reject(self, reason: str) -> Overloaded:
+        ADMISSION_REJECTIONS.labels(reason).inc()
+        return Overloaded(reason)
+
+    def _dequeued(self) -> None:
+        self.queued -= 1
+        ADMISSION_QUEUED.dec()
+
+    def _evict(self, priority: int) -> bool:
+        # освобождаем место в очереди, вытесняя последний запрос с более низким приоритетом
+        candidates: List[Waiter] = [
+            waiter for waiter in self._waiters if not waiter[2].done() and waiter[0] > priority
+        ]
+        if not candidates:
+            return False
+        _, _, future = max(candidates, key=lambda waiter: (waiter[0], waiter[1]))
+        future.set_exception(self._reject(EVICTED))
+        self._dequeued()
+        return True
+
+    async def acquire(self, priority: int) -> None:
+        """Ждём места для запроса.
+
+        Args:
+            - priority (int): Приоритет запроса, меньше — раньше.
+
+        Raises:
+            - Overloaded: Запрос не допущен.
+        """
+
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            ADMISSION_IN_FLIGHT.inc()
+            ADMISSION_QUEUE_TIME.labels(priority).observe(0)
+            return
+
+        if self.queued >= self.queue_size and not self._evict(priority):
+            raise self._reject(QUEUE_FULL)
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self.queued += 1
+        ADMISSION_QUEUED.inc()
+        started: float = perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._dequeued()
+                raise self._reject(TIMEOUT)
+            if future.exception() is not None:
+                raise future.exception()
+            # место передано одновременно с истечением времени ожидания
+        except asyncio.CancelledError:
+            # клиент отключился, пока запрос ждал в очереди
+            if not future.done():
+                future.cancel()
+                self._dequeued()
+            elif future.exception() is None:
+                self.release()
+            raise
+        ADMISSION_QUEUE_TIME.labels(priority).observe(perf_counter() - started)
+
+    def release(self) -> None:
+        """Освобождаем место и передаём его первому запросу в очереди."""
+
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # место переходит к ожидающему запросу, «active» не меняется
+                future.set_result(None)
+                self._dequeued()
+                return
+        self.active -= 1
+        ADMISSION_IN_FLIGHT.dec()
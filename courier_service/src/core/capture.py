@@ -0,0 +1,194 @@
+"""Запись реального трафика API для воспроизведения в бенчмарке «benchmarks.replay».
+
+Если задан «CAPTURE_FILE», доля «CAPTURE_SAMPLE_RATE» запросов к «/api/...»
+дописывается в этот файл строкой JSON: время, метод, путь, шаблон маршрута, роль
+из токена, форма тела запроса, код ответа и время обработки. Файл ротируется
+при достижении «CAPTURE_MAX_BYTES», хранятся «CAPTURE_BACKUP_COUNT» старых файлов.
+
+Персональные данные не записываются:
+    - из токена берётся только роль, сам токен не сохраняется;
+    - в теле запроса и в параметрах строки запроса значения заменяются типами,
+      например «{"phone_number": "str"}», остаются только числа и логические значения
+      параметров строки запроса, например «?active=true»;
+    - заголовки не записываются.
+"""
+
+import base64
+import logging
+import random
+from logging.handlers import RotatingFileHandler
+from time import perf_counter, time
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+import orjson
+from src.configs import (CAPTURE_BACKUP_COUNT, CAPTURE_FILE, CAPTURE_MAX_BYTES,
+                         CAPTURE_SAMPLE_RATE)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import route_label
+
+CAPTURE_PATH_PREFIX = '/api/'
+BODY_MAX_SIZE = 64 * 1024
+ANONYMOUS_ROLE = 'anonymous'
+UNKNOWN_ROLE = 'unknown'
+# роль токенов покупателей, выданных до появления поля «role»
+DEFAULT_TOKEN_ROLE = 'user'
+
+_QUERY_LITERALS = {'true', 'false'}
+
+
+def shape(value: Any) -> Any:
+    """Форма значения JSON: ключи и вложенность сохраняются, значения заменяются типами."""
+
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        # форма первого элемента и длина списка
+        return [shape(value[0]), len(value)] if value else []
+    if value is None:
+        return None
+    return type(value).__name__
+
+
+def _query_value(value: str) -> str:
+    if value.isdigit() or value.lower() in _QUERY_LITERALS:
+        return value
+    return 'str'
+
+
+def _body_shape(body: bytes, content_type: str) -> Any:
+    if not body:
+        return None
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        return {key: 'str' for key, _ in parse_qsl(body.decode('latin-1'), keep_blank_values=True)}
+    try:
+        return shape(orjson.loads(body))
+    except orjson.JSONDecodeError:
+        return f'bytes[{len(body)}]'
+
+
+def token_role(authorization: Optional[bytes]) -> str:
+    """Роль из JWT-токена в заголовке «Authorization», без проверки подписи.
+
+    Подпись не проверяется: роль нужна только для воспроизведения трафика, а запрос
+    с поддельным токеном всё равно получит ответ 401.
+    """
+
+    if authorization is None:
+        return ANONYMOUS_ROLE
+    try:
+        scheme, token = authorization.decode('latin-1').split(' ', 1)
+        payload = token.split('.')[1]
+        claims: Dict[str, Any] = orjson.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (ValueError, IndexError, orjson.JSONDecodeError):
+        return UNKNOWN_ROLE
+    if scheme.lower() != 'bearer' or not isinstance(claims, dict):
+        return UNKNOWN_ROLE
+    return str(claims.get('role', DEFAULT_TOKEN_ROLE))
+
+
+class TrafficCapture:
+    """Файл с записанными запросами, с ротацией по размеру."""
+
+    def __init__(
+            self,
+            path: Optional[str] = CAPTURE_FILE,
+            sample_rate: float = CAPTURE_SAMPLE_RATE,
+            max_bytes: int = CAPTURE_MAX_BYTES,
+            backup_count: int = CAPTURE_BACKUP_COUNT,
+    ) -> None:
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._handler: Optional[RotatingFileHandler] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.sample_rate > 0
+
+    def sampled(self) -> bool:
+        """Записываем ли очередной запрос."""
+
+        return self.enabled and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Дописываем запрос в файл."""
+
+        if self._handler is None:
+            # RotatingFileHandler ротирует файл и защищает запись блокировкой
+            self._handler = RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8'
+            )
+        self._handler.handle(logging.makeLogRecord({'msg': orjson.dumps(record).decode()}))
+
+    def close(self) -> None:
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
+
+
+traffic_capture = TrafficCapture()
+
+
+class TrafficCaptureMiddleware:
+    """ASGI middleware, которое записывает выбранные запросы к API в «traffic_capture»."""
+
+    def __init__(self, app: ASGIApp, capture: TrafficCapture = traffic_capture) -> None:
+        self.app = app
+        self.capture = capture
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope['type'] != 'http' or not scope['path'].startswith(CAPTURE_PATH_PREFIX)
+                or not self.capture.sampled()):
+            await self.app(scope, receive, send)
+            return
+
+        body: List[bytes] = []
+        body_size = 0
+        status_code = 500
+
+        async def receive_with_body() -> Message:
+            nonlocal body_size
+            message: Message = await receive()
+            if message['type'] == 'http.request':
+                chunk: bytes = message.get('body', b'')
+                body_size += len(chunk)
+                if body_size <= BODY_MAX_SIZE:
+                    body.append(chunk)
+            return message
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        started_at: float = time()
+        started: float = perf_counter()
+        try:
+            await self.app(scope, receive_with_body, send_with_status)
+        finally:
+            duration: float = perf_counter() - started
+            headers: Dict[bytes, bytes] = dict(scope['headers'])
+            query: str = scope['query_string'].decode('latin-1')
+            content_type: str = headers.get(b'content-type', b'').decode('latin-1')
+            self.capture.write({
+                'ts': round(started_at, 6),
+                'method': scope['method'],
+                'path': scope['path'],
+                'route': route_label(scope),
+                'query': {
+                    key: _query_value(value)
+                    for key, value in parse_qsl(query, keep_blank_values=True)
+                },
+                'role': token_role(headers.get(b'authorization')),
+                'content_type': content_type.split(';')[0] or None,
+                'body': (
+                    _body_shape(b''.join(body), content_type) if body_size <= BODY_MAX_SIZE
+                    else f'bytes[{body_size}]'
+                ),
+                'status': status_code,
+                'duration_ms': round(duration * 1000, 3),
+            })
@@ -0,0 +1,41 @@
+"""Условные GET-запросы: ETag и заголовок «If-None-Match»."""
+
+from hashlib import blake2b
+from typing import Any, Optional
+
+from fastapi import Response, status
+
+
+def make_etag(*parts: Any) -> str:
+    """Создаём слабый ETag из частей, однозначно описывающих версию ресурса.
+
+    Args:
+        - parts (Any): ID и версии объектов, из которых собирается ответ.
+
+    Returns:
+        - str: Значение заголовка «ETag».
+    """
+
+    digest = blake2b('|'.join(map(str, parts)).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверяем, есть ли текущий ETag среди значений заголовка «If-None-Match».
+
+    Сравнение слабое: префикс «W/» при сравнении не учитывается.
+    """
+
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return etag.removeprefix('W/') in tags
+
+
+def not_modified(etag: str) -> Response:
+    """Ответ «304 Not Modified» без тела."""
+
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
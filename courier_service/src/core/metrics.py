@@ -0,0 +1,189 @@
+"""Метрики приложения в формате Prometheus.
+
+Собираются:
+    - время обработки и количество запросов по маршрутам и кодам ответа;
+    - количество и время запросов к БД по маршрутам, во время которых они выполнены;
+    - размер пула соединений с БД и количество выданных из него соединений;
+    - время хэширования и проверки паролей bcrypt;
+    - количество запросов, отклонённых ограничением частоты «src.core.rate_limit»;
+    - вызовы функций чтения с объединением одинаковых запросов «src.core.single_flight»;
+    - попадания и промахи кэша списков заказов ресторанов «src.delivery.restaurant_orders».
+
+Запросы к БД также передаются в профилировщик «src.core.profiler», в трассировку
+«src.core.tracing» и в журнал медленных запросов «src.core.slow_queries».
+
+Маршрут в метках — шаблон пути, например «/api/v1/couriers/orders/{order_id}»,
+поэтому количество рядов метрик не растёт вместе с количеством ID.
+
+Каждый воркер uvicorn — отдельный процесс со своими значениями метрик. Чтобы
+«/metrics» отдавал сумму по всем воркерам, перед запуском задайте переменную
+окружения «PROMETHEUS_MULTIPROC_DIR» с путём к пустой папке: воркеры будут
+записывать значения в файлы в этой папке, а «/metrics» — собирать их вместе.
+"""
+
+import os
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Optional
+
+from fastapi import Response
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .profiler import record_query
+from .slow_queries import slow_query_log
+from .tracing import record_sql_span
+
+METRICS_PATH = '/metrics'
+UNMATCHED_ROUTE = '<unmatched>'
+BACKGROUND_ROUTE = '<background>'
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ['method', 'route']
+)
+REQUESTS = Counter('http_requests', 'Количество обработанных запросов', ['method', 'route', 'status'])
+DB_QUERIES = Counter('db_queries', 'Количество запросов к БД', ['route'])
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'Время выполнения запроса к БД', ['route'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_POOL_SIZE = Gauge('db_pool_size', 'Размер пула соединений с БД', multiprocess_mode='livesum')
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out', 'Соединения с БД, выданные из пула', multiprocess_mode='livesum'
+)
+PASSWORD_HASH_DURATION = Histogram(
+    'password_hash_duration_seconds', 'Время хэширования и проверки паролей bcrypt', ['operation'],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0),
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    'rate_limit_rejections', 'Запросы, отклонённые ограничением частоты', ['route']
+)
+RATE_LIMIT_STORAGE_BUSY = Counter(
+    'rate_limit_storage_busy', 'Запросы, пропущенные без проверки частоты: файл счётчиков был занят'
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    'single_flight_calls',
+    'Вызовы функций чтения: выполнили запрос (leader), получили чужой результат (merged) или без объединения',
+    ['function', 'result'],
+)
+RESTAURANT_ORDERS_CACHE = Counter(
+    'restaurant_orders_cache', 'Списки заказов ресторанов: из кэша (hit) или из БД (miss)', ['result']
+)
+
+# ASGI scope текущего запроса, чтобы связать запросы к БД с маршрутом
+_current_scope: ContextVar[Optional[Scope]] = ContextVar('metrics_scope', default=None)
+
+
+def route_label(scope: Scope) -> str:
+    """Шаблон пути маршрута, который обрабатывает запрос."""
+
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+
+    # маршрут ещё не выбран, например запрос отклонён до роутера
+    for route in getattr(scope.get('app'), 'routes', ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, 'path', UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """ASGI middleware, которое считает время обработки и коды ответов по маршрутам."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['path'] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        token = _current_scope.set(scope)
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - started
+            _current_scope.reset(token)
+            route = route_label(scope)
+            REQUEST_DURATION.labels(scope['method'], route).observe(elapsed)
+            REQUESTS.labels(scope['method'], route, str(status_code)).inc()
+
+
+def current_route() -> str:
+    """Маршрут текущего запроса или «BACKGROUND_ROUTE» для фоновых задач."""
+
+    scope: Optional[Scope] = _current_scope.get()
+    return route_label(scope) if scope is not None else BACKGROUND_ROUTE
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context.metrics_started_at = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = perf_counter() - context.metrics_started_at
+    record_query(statement, elapsed)
+    record_sql_span(statement, context.metrics_started_at, elapsed)
+    route = current_route()
+    slow_query_log.record(statement, parameters, elapsed, route, executemany)
+    DB_QUERIES.labels(route).inc()
+    DB_QUERY_DURATION.labels(route).observe(elapsed)
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    DB_POOL_CHECKED_OUT.inc()
+
+
+def _on_checkin(dbapi_connection, connection_record) -> None:
+    DB_POOL_CHECKED_OUT.dec()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подключаем сбор метрик запросов к БД и пула соединений к движку SQLAlchemy."""
+
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(sync_engine.pool, 'checkout', _on_checkout)
+    event.listen(sync_engine.pool, 'checkin', _on_checkin)
+
+    size = getattr(sync_engine.pool, 'size', None)
+    if size is not None:
+        DB_POOL_SIZE.inc(size())
+
+
+def mark_worker_stopped() -> None:
+    """Убираем значения остановленного воркера из сумм при многопроцессном сборе."""
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def metrics_response() -> Response:
+    """Ответ с метриками в текстовом формате Prometheus."""
+
+    registry: Any = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
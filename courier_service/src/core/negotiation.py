@@ -0,0 +1,185 @@
+"""Согласование формата ответа для больших списков.
+
+Формат тела выбирается по заголовку «Accept»:
+    - application/json: обычный JSON (по умолчанию);
+    - application/msgpack: то же содержимое в MessagePack;
+    - application/vnd.courier.normalized+json: нормализованный ответ, в котором заказы
+      ссылаются на рестораны и пользователей по ID, а сами объекты передаются один раз;
+    - application/vnd.courier.normalized+msgpack: нормализованный ответ в MessagePack.
+
+Сжатие выбирается по заголовку «Accept-Encoding» (br или gzip).
+"""
+
+import gzip
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+
+import brotli
+import msgpack
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from .responses import get_type_adapter, orjson_dumps
+
+COMPRESSION_MINIMUM_SIZE = 1024
+
+
+class WireFormat(NamedTuple):
+    """Формат тела ответа."""
+
+    media_type: str
+    normalized: bool
+    msgpack: bool
+
+
+JSON = WireFormat('application/json', normalized=False, msgpack=False)
+MSGPACK = WireFormat('application/msgpack', normalized=False, msgpack=True)
+NORMALIZED_JSON = WireFormat('application/vnd.courier.normalized+json', normalized=True, msgpack=False)
+NORMALIZED_MSGPACK = WireFormat('application/vnd.courier.normalized+msgpack', normalized=True, msgpack=True)
+
+WIRE_FORMATS: Dict[str, WireFormat] = {
+    wire_format.media_type: wire_format
+    for wire_format in (JSON, MSGPACK, NORMALIZED_JSON, NORMALIZED_MSGPACK)
+}
+WIRE_FORMATS['application/x-msgpack'] = MSGPACK
+
+
+def _parse_header(value: str) -> Iterator[str]:
+    """Значения заголовков «Accept»/«Accept-Encoding» в порядке убывания параметра «q».
+
+    Значения с «q=0» пропускаются.
+    """
+
+    weighted = []
+    for position, item in enumerate(value.split(',')):
+        token, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if token and quality > 0:
+            weighted.append((-quality, position, token.lower()))
+
+    return (token for _, _, token in sorted(weighted))
+
+
+def negotiate_format(request: Request, normalized: bool = False) -> WireFormat:
+    """Выбираем формат ответа по заголовку «Accept».
+
+    Args:
+        - request (Request): Текущий запрос.
+        - normalized (bool): Поддерживает ли роутер нормализованный ответ.
+
+    Returns:
+        - WireFormat: Выбранный формат, по умолчанию обычный JSON.
+    """
+
+    for media_type in _parse_header(request.headers.get('Accept', '')):
+        wire_format: Optional[WireFormat] = WIRE_FORMATS.get(media_type)
+        if wire_format is not None and (normalized or not wire_format.normalized):
+            return wire_format
+        if media_type in ('*/*', 'application/*'):
+            return JSON
+    return JSON
+
+
+def negotiate_encoding(request: Request) -> Optional[str]:
+    """Выбираем алгоритм сжатия по заголовку «Accept-Encoding».
+
+    Returns:
+        - Optional[str]: «br», «gzip» или None, если клиент не поддерживает сжатие.
+    """
+
+    for encoding in _parse_header(request.headers.get('Accept-Encoding', '')):
+        if encoding in ('br', 'gzip'):
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Сжимаем тело ответа выбранным алгоритмом.
+
+    Короткие ответы не сжимаются.
+
+    Returns:
+        - Tuple[bytes, Optional[str]]: Тело ответа и значение заголовка «Content-Encoding».
+    """
+
+    if encoding is None or len(body) < COMPRESSION_MINIMUM_SIZE:
+        return body, None
+    if encoding == 'br':
+        return brotli.compress(body, quality=4), 'br'
+    return gzip.compress(body, compresslevel=5), 'gzip'
+
+
+def encode(wire_format: WireFormat, content: Any) -> bytes:
+    """Кодируем уже подготовленное содержимое в JSON или MessagePack.
+
+    Для MessagePack содержимое должно состоять только из JSON-совместимых типов.
+    """
+
+    if wire_format.msgpack:
+        return msgpack.packb(content)
+    return orjson_dumps(content)
+
+
+def negotiated_response(
+        body: bytes,
+        wire_format: WireFormat,
+        encoding: Optional[str],
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Ответ с уже закодированным и сжатым телом."""
+
+    response_headers = {**(headers or {}), 'Vary': 'Accept, Accept-Encoding'}
+    if encoding is not None:
+        response_headers['Content-Encoding'] = encoding
+
+    return Response(
+        body, status_code=status_code, headers=response_headers, media_type=wire_format.media_type
+    )
+
+
+def encode_content(wire_format: WireFormat, type_: Any, content: Any) -> bytes:
+    """Валидируем содержимое ответа по схеме и кодируем его в выбранном формате, без сжатия.
+
+    Args:
+        - wire_format (WireFormat): Формат, выбранный через «negotiate_format».
+        - type_ (Any): Схема ответа.
+        - content (Any): ORM-объекты, словари или уже готовые Pydantic модели.
+    """
+
+    adapter: TypeAdapter = get_type_adapter(type_)
+    validated = adapter.validate_python(content, from_attributes=True)
+    mode = 'json' if wire_format.msgpack else 'python'
+    return encode(wire_format, adapter.dump_python(validated, mode=mode))
+
+
+def render_negotiated(
+        request: Request,
+        wire_format: WireFormat,
+        type_: Any,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Валидируем содержимое ответа по схеме и кодируем его в выбранном формате.
+
+    Args:
+        - request (Request): Текущий запрос, из него берётся «Accept-Encoding».
+        - wire_format (WireFormat): Формат, выбранный через «negotiate_format».
+        - type_ (Any): Схема ответа.
+        - content (Any): ORM-объекты, словари или уже готовые Pydantic модели.
+        - status_code (int): Код ответа.
+        - headers (Optional[Dict[str, str]]): Дополнительные заголовки ответа.
+
+    Returns:
+        - Response: Закодированный и, при необходимости, сжатый ответ.
+    """
+
+    body, encoding = compress(encode_content(wire_format, type_, content), negotiate_encoding(request))
+
+    return negotiated_response(body, wire_format, encoding, status_code=status_code, headers=headers)
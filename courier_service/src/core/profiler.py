@@ -0,0 +1,148 @@
+"""Профилирование SQL-запросов, выполненных во время одного запроса к API.
+
+Связи моделей загружаются через «selectin», поэтому по коду роутера не видно,
+сколько запросов к БД он на самом деле выполняет. Профиль собирает все
+выполненные запросы: их количество, общее время и одинаковые запросы. Запрос,
+повторённый «N_PLUS_ONE_THRESHOLD» и больше раз, — кандидат в проблему N+1:
+скорее всего, его выполняют в цикле вместо одного общего запроса.
+
+В режиме отладки (переменная окружения «DEBUG») ответ на каждый запрос к API
+содержит заголовок «X-Query-Profile» с итогами профиля, а кандидаты в N+1
+пишутся в лог. В тестах «assert_max_queries» ограничивает количество запросов
+к БД, которые выполняет роутер.
+"""
+
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Tuple
+
+from src.configs import DEBUG
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = 3
+PROFILE_HEADER = 'X-Query-Profile'
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryProfile:
+    """Запросы к БД, выполненные за время профилирования."""
+
+    def __init__(self) -> None:
+        # текст запроса и время выполнения в секундах
+        self.statements: List[Tuple[str, float]] = []
+
+    @property
+    def count(self) -> int:
+        """Количество запросов."""
+
+        return len(self.statements)
+
+    @property
+    def duration(self) -> float:
+        """Общее время выполнения запросов в секундах."""
+
+        return sum(duration for _, duration in self.statements)
+
+    def duplicates(self) -> Counter:
+        """Запросы, выполненные больше одного раза, с количеством выполнений.
+
+        Параметры запросов передаются отдельно от текста, поэтому один и тот же
+        запрос с разными ID считается одинаковым.
+        """
+
+        counts = Counter(statement for statement, _ in self.statements)
+        return Counter({statement: count for statement, count in counts.items() if count > 1})
+
+    def n_plus_one(self) -> List[str]:
+        """Кандидаты в проблему N+1: запросы, повторённые не меньше «N_PLUS_ONE_THRESHOLD» раз."""
+
+        return [
+            statement for statement, count in self.duplicates().items() if count >= N_PLUS_ONE_THRESHOLD
+        ]
+
+    def summary(self) -> str:
+        """Итоги профиля в одну строку, для заголовка ответа."""
+
+        return (
+            f'count={self.count}, duration_ms={self.duration * 1000:.2f}, '
+            f'duplicates={sum(self.duplicates().values())}, n_plus_one={len(self.n_plus_one())}'
+        )
+
+
+# Профили, которые сейчас собираются: вложенные профили видят все запросы внешних
+_active_profiles: ContextVar[Tuple[QueryProfile, ...]] = ContextVar('query_profiles', default=())
+
+
+def record_query(statement: str, duration: float) -> None:
+    """Добавляем выполненный запрос во все активные профили."""
+
+    profiles = _active_profiles.get()
+    if profiles:
+        statement = _WHITESPACE.sub(' ', statement).strip()
+        for profile in profiles:
+            profile.statements.append((statement, duration))
+
+
+@contextmanager
+def profile_queries() -> Iterator[QueryProfile]:
+    """Собираем запросы к БД, выполненные внутри блока «with».
+
+    Yields:
+        - QueryProfile: Профиль, который заполняется по мере выполнения запросов.
+    """
+
+    profile = QueryProfile()
+    token = _active_profiles.set(_active_profiles.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        _active_profiles.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryProfile]:
+    """Проверяем, что внутри блока «with» выполнено не больше «limit» запросов к БД.
+
+    Используется в тестах, чтобы зафиксировать количество запросов роутера:
+        with assert_max_queries(3):
+            response = await async_client.get(...)
+    """
+
+    with profile_queries() as profile:
+        yield profile
+
+    if profile.count > limit:
+        statements = '\n'.join(f'  {statement}' for statement, _ in profile.statements)
+        raise AssertionError(
+            f'Выполнено {profile.count} запросов к БД, допустимо не больше {limit}:\n{statements}'
+        )
+
+
+class QueryProfilerMiddleware:
+    """ASGI middleware, которое в режиме отладки профилирует запросы к БД каждого запроса к API."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not DEBUG:
+            await self.app(scope, receive, send)
+            return
+
+        with profile_queries() as profile:
+            async def send_with_profile(message: Message) -> None:
+                if message['type'] == 'http.response.start':
+                    MutableHeaders(scope=message).append(PROFILE_HEADER, profile.summary())
+                await send(message)
+
+            await self.app(scope, receive, send_with_profile)
+
+        for statement in profile.n_plus_one():
+            logger.warning('Возможная проблема N+1 в %s %s: %s', scope['method'], scope['path'], statement)
@@ -0,0 +1,445 @@
+"""Ограничение частоты запросов ведрами токенов, общее для всех воркеров на одном сервере.
+
+Запросы стоят по-разному: вход по паролю или регистрация проверяют хэш bcrypt,
+а повторное чтение заказа почти ничего не стоит. Поэтому каждый маршрут объявляет
+стоимость декоратором «rate_limit_cost» (по умолчанию 1, 0 — маршрут не
+ограничивается), а каждый класс клиентов — аноним, покупатель, курьер —
+получает своё ведро («Bucket»): вместимость в токенах и скорость пополнения в
+токенах в секунду. Запрос проходит, если в ведре клиента хватает токенов на его
+стоимость. Дорогие маршруты так защищены от перебора паролей, а курьер, который
+часто опрашивает дешёвые маршруты, не упирается в лимит. Класс определяется только
+по токену: по маршруту его выбирать нельзя, иначе любой аноним получил бы ведро
+побольше, просто обратившись к другому пути.
+
+Ведро считается по алгоритму GCRA (generic cell rate algorithm): для каждого ключа
+хранится одно число, «теоретическое время прихода» (TAT). Запрос стоимостью c
+сдвигает TAT на c / r, где r — скорость пополнения, и отклоняется, если TAT ушёл
+вперёд больше чем на C / r, где C — вместимость ведра. Это то же ведро токенов,
+только без отдельного счётчика и таймера пополнения.
+
+Значения хранятся в файле, отображённом в память («mmap»), по умолчанию в
+«/dev/shm», то есть в общей памяти без записи на диск. Все воркеры uvicorn
+открывают один и тот же файл и меняют его под блокировкой «flock», поэтому лимит
+не умножается на количество воркеров. Файл — хэш-таблица с открытой адресацией из
+«RATE_LIMIT_SLOTS» ячеек по 16 байт: 64-битный хэш ключа и TAT. Ключ ищется не
+дальше чем в «PROBES» соседних ячейках, поэтому проверка занимает O(1) и не
+обращается к БД. Ячейка, TAT которой уже прошёл, считается свободной; если
+свободных нет, занимается ячейка с наименьшим TAT.
+
+Количество ячеек входит в имя файла: воркеры с другим «RATE_LIMIT_SLOTS» получают
+свой файл и не меняют размер файла, который уже отображён в память у других.
+Блокировка берётся без ожидания, с несколькими короткими повторами: если она так и
+не освободилась (например, завис воркер, который её держит), запрос пропускается
+без проверки, а не останавливает цикл событий.
+
+Ответы получают заголовки «RateLimit-Limit», «RateLimit-Remaining»,
+«RateLimit-Reset» и «RateLimit-Policy» (черновик IETF «RateLimit header fields
+for HTTP»), отклонённые запросы — ответ 429 с «Retry-After».
+"""
+
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from ipaddress import IPv4Network, IPv6Network, ip_address, ip_network
+from time import sleep, time
+from typing import (Callable, Dict, Iterator, List, NamedTuple, Optional,
+                    Tuple, TypeVar, Union)
+
+from fastapi import HTTPException, status
+from src.configs import RATE_LIMIT_REAL_IP_HEADER, RATE_LIMIT_TRUSTED_PROXIES
+from starlette.requests import Request
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import (RATE_LIMIT_REJECTIONS, RATE_LIMIT_STORAGE_BUSY,
+                      route_label)
+from .responses import ORJSONResponse
+
+T = TypeVar('T')
+F = TypeVar('F', bound=Callable)
+
+MAGIC = b'CSRLGCRA'
+HEADER = struct.Struct('<8sQ')
+SLOT = struct.Struct('<Qd')
+PROBES = 8
+LOCK_ATTEMPTS = 5
+LOCK_RETRY_DELAY = 0.0002  # секунды между попытками взять блокировку
+
+ANONYMOUS = 'anonymous'
+BUYER = 'buyer'
+COURIER = 'courier'
+
+IPNetwork = Union[IPv4Network, IPv6Network]
+
+DEFAULT_COST = 1
+COST_ATTRIBUTE = 'rate_limit_cost'
+# ключ ASGI scope, под которым middleware оставляет «Charge» запроса
+SCOPE_KEY = 'rate_limit'
+TOO_MANY_REQUESTS = 'Слишком много запросов, повторите позже.'
+
+
+def _trusted_proxies(value: str) -> Tuple[IPNetwork, ...]:
+    return tuple(ip_network(item.strip(), strict=False) for item in value.split(',') if item.strip())
+
+
+TRUSTED_PROXIES: Tuple[IPNetwork, ...] = _trusted_proxies(RATE_LIMIT_TRUSTED_PROXIES)
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def client_address(request: Request) -> str:
+    """Адрес клиента: из заголовка «RATE_LIMIT_REAL_IP_HEADER», который выставляет nginx,
+    или адрес соединения.
+
+    Без заголовка все клиенты за nginx выглядели бы как один адрес nginx. Заголовку
+    верим, только если соединение пришло с адреса из «RATE_LIMIT_TRUSTED_PROXIES»,
+    иначе клиент мог бы менять адрес в каждом запросе и обходить ограничение.
+    """
+
+    host: str = request.client.host if request.client else '127.0.0.1'
+    if RATE_LIMIT_REAL_IP_HEADER and _is_trusted_proxy(host):
+        address: Optional[str] = request.headers.get(RATE_LIMIT_REAL_IP_HEADER)
+        if address:
+            return address
+    return host
+
+
+def _key_hash(key: str) -> int:
+    # hash() для строк разный в каждом процессе, поэтому нужен свой хэш;
+    # 0 обозначает пустую ячейку
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+
+def rate_limit_cost(cost: int) -> Callable[[F], F]:
+    """Декоратор эндпоинта, который задаёт стоимость запроса в токенах.
+
+    Указывается под декоратором роутера, чтобы роутер получил уже помеченную функцию.
+
+    Args:
+        - cost (int): Стоимость запроса, 0 — запросы к маршруту не ограничиваются.
+    """
+
+    def decorator(endpoint: F) -> F:
+        setattr(endpoint, COST_ATTRIBUTE, cost)
+        return endpoint
+
+    return decorator
+
+
+def route_cost(scope: Scope) -> int:
+    """Стоимость запроса по эндпоинту маршрута, который его обработает."""
+
+    # middleware работает до роутера, поэтому маршрут ищется так же, как в роутере
+    for route in getattr(scope.get('app'), 'routes', ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(getattr(route, 'endpoint', None), COST_ATTRIBUTE, DEFAULT_COST)
+    return DEFAULT_COST
+
+
+class StorageBusy(Exception):
+    """Блокировка файла со счётчиками не освободилась за «LOCK_ATTEMPTS» попыток."""
+
+
+class SharedMemoryStorage:
+    """Хэш-таблица значений GCRA в общем для процессов файле, отображённом в память.
+
+    Хранит для ключа одно число — TAT, после которого запись можно удалить.
+    Файл называется «<path>.<slots>».
+
+    Raises:
+        - RuntimeError: Файл уже существует, но это не файл счётчиков с «slots» ячейками.
+    """
+
+    def __init__(self, path: str, slots: int = 65536) -> None:
+        self.slots = int(slots)
+        self.path = f'{path}.{self.slots}'
+        self._lock = threading.Lock()
+        self._fd: int = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size: int = HEADER.size + self.slots * SLOT.size
+        with self._locked_file(blocking=True):
+            header: bytes = HEADER.pack(MAGIC, self.slots)
+            if os.fstat(self._fd).st_size == 0:
+                # размер меняется только у нового файла, который ещё никто не отобразил в память
+                os.ftruncate(self._fd, size)
+            current: bytes = os.pread(self._fd, HEADER.size, 0)
+            if current == bytes(HEADER.size):
+                os.pwrite(self._fd, header, 0)
+            elif current != header or os.fstat(self._fd).st_size != size:
+                raise RuntimeError(f'Файл «{self.path}» не подходит для счётчиков ограничения частоты')
+        self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked_file(self, blocking: bool = False) -> Iterator[None]:
+        # flock исключает другие процессы, но не другие потоки этого процесса
+        with self._lock:
+            if blocking:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            else:
+                self._try_lock()
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _try_lock(self) -> None:
+        # критическая секция занимает микросекунды, поэтому ждём её без блокирующего flock
+        for attempt in range(LOCK_ATTEMPTS):
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if attempt + 1 < LOCK_ATTEMPTS:
+                    sleep(LOCK_RETRY_DELAY)
+        raise StorageBusy(self.path)
+
+    def _slot_offset(self, index: int) -> int:
+        return HEADER.size + (index % self.slots) * SLOT.size
+
+    def _find(self, key_hash: int, now: float) -> Tuple[int, float]:
+        # ячейка ключа и его значение (0, если ключа нет) или ячейка, которую можно занять
+        start: int = key_hash % self.slots
+        free: Optional[int] = None
+        oldest: Tuple[float, int] = (math.inf, start)
+        for index in range(start, start + PROBES):
+            offset: int = self._slot_offset(index)
+            slot_hash, value = SLOT.unpack_from(self._map, offset)
+            if slot_hash == key_hash:
+                return offset, value if value > now else 0.0
+            if free is None and (slot_hash == 0 or value <= now):
+                free = offset
+            oldest = min(oldest, (value, offset))
+        return (free if free is not None else oldest[1]), 0.0
+
+    def update(self, key: str, update: Callable[[float, float], Tuple[float, T]]) -> T:
+        """Атомарно меняем значение ключа.
+
+        Args:
+            - key (str): Ключ лимита.
+            - update (Callable[[float, float], Tuple[float, T]]): Функция от текущего
+              значения (0, если ключа нет) и текущего времени, которая возвращает новое
+              значение и результат для вызывающего кода.
+
+        Returns:
+            - T: Результат «update».
+
+        Raises:
+            - StorageBusy: Блокировка файла не освободилась.
+        """
+
+        key_hash: int = _key_hash(key)
+        with self._locked_file():
+            now: float = time()
+            offset, value = self._find(key_hash, now)
+            new_value, result = update(value, now)
+            if new_value != value:
+                SLOT.pack_into(self._map, offset, key_hash, new_value)
+            return result
+
+    def read(self, key: str) -> float:
+        """Текущее значение ключа, 0 если ключа нет."""
+
+        return self.update(key, lambda value, now: (value, value))
+
+    def reset(self) -> None:
+        with self._locked_file(blocking=True):
+            self._map[HEADER.size:] = bytes(self.slots * SLOT.size)
+
+
+class Bucket(NamedTuple):
+    """Ведро токенов класса клиентов."""
+
+    capacity: int  # сколько токенов можно потратить подряд
+    refill_rate: float  # сколько токенов возвращается в секунду
+
+    @property
+    def policy(self) -> str:
+        # квота и окно, за которое пустое ведро наполняется, для «RateLimit-Policy»
+        return f'{self.capacity};w={math.ceil(self.capacity / self.refill_rate)}'
+
+
+class Decision(NamedTuple):
+    """Результат проверки запроса."""
+
+    allowed: bool
+    remaining: int  # токенов в ведре после запроса
+    reset: float  # секунд до полного ведра
+    retry_after: float  # секунд до момента, когда токенов хватит на запрос, 0 если запрос прошёл
+
+
+def _take(bucket: Bucket, cost: int) -> Callable[[float, float], Tuple[float, Decision]]:
+    interval: float = 1 / bucket.refill_rate
+    burst: float = bucket.capacity * interval
+
+    def remaining(tat: float, now: float) -> int:
+        # небольшой допуск, чтобы ошибка округления не съедала целый токен
+        return max(0, math.floor((burst - (tat - now)) / interval + 1e-9))
+
+    def update(tat: float, now: float) -> Tuple[float, Decision]:
+        tat = max(tat, now)
+        new_tat: float = tat + cost * interval
+        if new_tat - now <= burst:
+            return new_tat, Decision(True, remaining(new_tat, now), new_tat - now, 0.0)
+        return tat, Decision(False, remaining(tat, now), tat - now, new_tat - now - burst)
+
+    return update
+
+
+class TokenBucketLimiter:
+    """Ведра токенов по классам клиентов в «SharedMemoryStorage».
+
+    Args:
+        - buckets (Dict[str, Bucket]): Ведро для каждого класса клиентов.
+        - principal (Callable[[Request], Tuple[str, str]]): Функция, которая
+          возвращает класс клиента и его ключ внутри класса.
+        - storage_path (str): Путь к файлу в общей памяти.
+        - slots (int): Количество ячеек хэш-таблицы.
+    """
+
+    def __init__(
+            self,
+            buckets: Dict[str, Bucket],
+            principal: Callable[[Request], Tuple[str, str]],
+            storage_path: str,
+            slots: int,
+    ) -> None:
+        self.buckets = buckets
+        self.principal = principal
+        self.storage = SharedMemoryStorage(storage_path, slots)
+        self.enabled = True
+
+    def hit(self, principal_class: str, key: str, cost: int) -> Decision:
+        """Забираем из ведра клиента «cost» токенов, если их хватает.
+
+        Если файл со счётчиками занят, запрос пропускается без списания токенов.
+        """
+
+        bucket: Bucket = self.buckets[principal_class]
+        try:
+            return self.storage.update(f'{principal_class}:{key}', _take(bucket, cost))
+        except StorageBusy:
+            RATE_LIMIT_STORAGE_BUSY.inc()
+            return Decision(True, bucket.capacity, 0.0, 0.0)
+
+    def reset(self) -> None:
+        """Наполняем все ведра."""
+
+        self.storage.reset()
+
+
+class Charge:
+    """Ведро, из которого оплачен запрос, и последнее решение по нему."""
+
+    def __init__(
+            self,
+            limiter: TokenBucketLimiter,
+            principal_class: str,
+            key: str,
+            decision: Decision,
+    ) -> None:
+        self.limiter = limiter
+        self.principal_class = principal_class
+        self.key = key
+        self.decision = decision
+
+    @property
+    def bucket(self) -> Bucket:
+        return self.limiter.buckets[self.principal_class]
+
+
+def rate_limit_charge(request: Request, cost: int) -> None:
+    """Списываем с клиента дополнительную стоимость, которая стала известна только в эндпоинте.
+
+    Например, стоимость пакета JSON-RPC зависит от методов в теле запроса. Если
+    маршрут не ограничивается или ограничение выключено, ничего не делаем.
+
+    Args:
+        - request (Request): Текущий запрос.
+        - cost (int): Сколько токенов списать сверх стоимости маршрута.
+
+    Raises:
+        - HTTPException: 429 с «Retry-After», если токенов не хватает; токены не списываются.
+    """
+
+    charge: Optional[Charge] = request.scope.get(SCOPE_KEY)
+    if charge is None or cost <= 0:
+        return
+
+    charge.decision = charge.limiter.hit(charge.principal_class, charge.key, cost)
+    if not charge.decision.allowed:
+        RATE_LIMIT_REJECTIONS.labels(route_label(request.scope)).inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=TOO_MANY_REQUESTS,
+            headers={'Retry-After': str(math.ceil(charge.decision.retry_after))},
+        )
+
+
+def rate_limit_headers(bucket: Bucket, decision: Decision) -> Dict[str, str]:
+    """Заголовки «RateLimit-*» для ответа."""
+
+    return {
+        'RateLimit-Limit': str(bucket.capacity),
+        'RateLimit-Remaining': str(decision.remaining),
+        'RateLimit-Reset': str(math.ceil(decision.reset)),
+        'RateLimit-Policy': bucket.policy,
+    }
+
+
+class RateLimitMiddleware:
+    """ASGI middleware, которое списывает стоимость запроса из ведра клиента.
+
+    Запросы, на которые не хватило токенов, получают ответ 429 и не доходят до
+    эндпоинта, остальные — заголовки «RateLimit-*». Заголовки берутся из последнего
+    решения, в том числе после «rate_limit_charge» в эндпоинте.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: TokenBucketLimiter) -> None:
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not self.limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        cost: int = route_cost(scope)
+        if cost == 0:
+            await self.app(scope, receive, send)
+            return
+
+        principal_class, key = self.limiter.principal(Request(scope))
+        decision: Decision = self.limiter.hit(principal_class, key, cost)
+        headers: Dict[str, str] = rate_limit_headers(self.limiter.buckets[principal_class], decision)
+
+        if not decision.allowed:
+            RATE_LIMIT_REJECTIONS.labels(route_label(scope)).inc()
+            headers['Retry-After'] = str(math.ceil(decision.retry_after))
+            response = ORJSONResponse({'detail': TOO_MANY_REQUESTS}, status_code=429, headers=headers)
+            await response(scope, receive, send)
+            return
+
+        charge = Charge(self.limiter, principal_class, key, decision)
+        scope[SCOPE_KEY] = charge
+
+        async def send_with_headers(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                raw_headers: List[Tuple[bytes, bytes]] = [
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in rate_limit_headers(charge.bucket, charge.decision).items()
+                ]
+                message['headers'] = list(message.get('headers', ())) + raw_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,193 @@
+"""Профилирование отдельных запросов к API по требованию.
+
+Запрос с заголовком «X-Profile-Token», равным секрету «PROFILE_TOKEN», выполняется
+под профилировщиком, без перезапуска воркера:
+    - отдельный поток с интервалом «PROFILE_INTERVAL» снимает стек потока
+      event loop и считает одинаковые стеки;
+    - «tracemalloc» сравнивает снимки памяти до запроса и перед отправкой ответа
+      и находит строки кода, которые выделили больше всего памяти.
+
+Отчёт сохраняется в памяти воркера (последние «PROFILE_BUFFER_SIZE» отчётов) и
+виден в админ панели, а ответ содержит заголовок «X-Profile-Id» с его ID. Стеки
+выгружаются в свёрнутом формате («folded»: «функция;функция;функция количество»),
+который понимают flamegraph.pl и speedscope.
+
+Профилировщик общий для процесса, поэтому одновременно профилируется только один
+запрос, а в стеки попадают и запросы, которые event loop обрабатывает в это же
+время. Код, который выполняется в пуле потоков, например bcrypt, в стеки не попадает.
+"""
+
+import hmac
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime, timezone
+from time import perf_counter
+from types import FrameType
+from typing import Any, Deque, Dict, List, Optional
+
+from src.configs import PROFILE_BUFFER_SIZE, PROFILE_INTERVAL, PROFILE_TOKEN
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_TOKEN_HEADER = b'x-profile-token'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+TOP_ALLOCATIONS = 20
+
+_ALLOCATION_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+]
+
+
+def _fold(frame: Optional[FrameType]) -> str:
+    # стек от внешней функции к внутренней, в свёрнутом формате flame graph
+    names: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Поток, который через равные интервалы снимает стек другого потока."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame: Optional[FrameType] = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_fold(frame)] += 1
+
+    def folded(self) -> str:
+        """Стеки в свёрнутом формате, по строке на стек."""
+
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Последние отчёты профилировщика."""
+
+    def __init__(self, buffer_size: int = PROFILE_BUFFER_SIZE) -> None:
+        self.reports: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+
+    def add(self, report: Dict[str, Any]) -> None:
+        self.reports.append(report)
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """Отчёты, сначала новые."""
+
+        return list(reversed(self.reports))
+
+    def find(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """Отчёт по ID."""
+
+        return next((report for report in self.reports if report['id'] == profile_id), None)
+
+
+profile_store = ProfileStore()
+
+
+def _top_allocations(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> List[Dict[str, Any]]:
+    # строки кода, которые выделили больше всего памяти за время запроса
+    before = before.filter_traces(_ALLOCATION_FILTERS)
+    after = after.filter_traces(_ALLOCATION_FILTERS)
+    return [
+        {
+            'site': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+            'size_kb': round(stat.size_diff / 1024, 1),
+            'count': stat.count_diff,
+        }
+        for stat in after.compare_to(before, 'lineno')[:TOP_ALLOCATIONS]
+        if stat.size_diff > 0
+    ]
+
+
+def _is_authorized(scope: Scope) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    for key, value in scope['headers']:
+        if key == PROFILE_TOKEN_HEADER:
+            return hmac.compare_digest(value, PROFILE_TOKEN.encode())
+    return False
+
+
+class RequestProfilerMiddleware:
+    """ASGI middleware, которое профилирует запрос с верным заголовком «X-Profile-Token»."""
+
+    def __init__(self, app: ASGIApp, store: ProfileStore = profile_store) -> None:
+        self.app = app
+        self.store = store
+        self._busy = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or self._busy or not _is_authorized(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            self._busy = False
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profile_id: str = os.urandom(8).hex()
+        snapshots: List[tracemalloc.Snapshot] = []
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                # снимок до отправки ответа: ORM-объекты запроса ещё в сессии, а не собраны GC
+                snapshots.append(tracemalloc.take_snapshot())
+                MutableHeaders(scope=message).append(PROFILE_ID_HEADER, profile_id)
+            await send(message)
+
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        snapshots.append(tracemalloc.take_snapshot())
+        memory_before, _ = tracemalloc.get_traced_memory()
+
+        sampler = StackSampler(threading.get_ident())
+        started_at: datetime = datetime.now(timezone.utc)
+        started: float = perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.stop()
+            duration: float = perf_counter() - started
+            _, memory_peak = tracemalloc.get_traced_memory()
+            if len(snapshots) == 1:
+                snapshots.append(tracemalloc.take_snapshot())
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+            self.store.add({
+                'id': profile_id,
+                'name': f'{scope["method"]} {scope["path"]}',
+                'start': started_at,
+                'duration_ms': round(duration * 1000, 3),
+                'samples': sum(sampler.stacks.values()),
+                'peak_kb': round((memory_peak - memory_before) / 1024, 1),
+                'allocations': _top_allocations(snapshots[0], snapshots[1]),
+                'folded': sampler.folded(),
+            })
@@ -0,0 +1,69 @@
+"""Быстрая сериализация ответов.
+
+Ответы собираются из ORM-объектов за одну валидацию Pydantic (from_attributes)
+и рендерятся через orjson, минуя повторную валидацию по «response_model» в FastAPI.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+from .tracing import span
+
+
+def _orjson_default(obj: Any) -> Any:
+    """Сериализация типов, которые orjson не умеет обрабатывать сам."""
+
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError
+
+
+def orjson_dumps(content: Any) -> bytes:
+    """Кодируем содержимое ответа в JSON через orjson."""
+
+    return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON-ответ, который рендерится через orjson.
+
+    Используется как класс ответа по умолчанию для всего приложения.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson_dumps(content)
+
+
+@lru_cache(maxsize=None)
+def get_type_adapter(type_: Any) -> TypeAdapter:
+    """Кэшируем TypeAdapter для схемы ответа, чтобы не собирать валидатор на каждый запрос."""
+
+    return TypeAdapter(type_)
+
+
+def render(
+        type_: Any,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+) -> ORJSONResponse:
+    """Валидируем содержимое ответа по схеме и рендерим его через orjson.
+
+    Args:
+        - type_ (Any): Схема ответа, например «List[CourierOrdersInfoPyd]».
+        - content (Any): ORM-объекты, словари или уже готовые Pydantic модели.
+        - status_code (int): Код ответа.
+        - headers (Optional[Dict[str, str]]): Дополнительные заголовки ответа.
+
+    Returns:
+        - ORJSONResponse: Готовый ответ, который FastAPI отдаёт без повторной валидации.
+    """
+
+    adapter: TypeAdapter = get_type_adapter(type_)
+    with span('render', schema=repr(type_)):
+        data = adapter.dump_python(adapter.validate_python(content, from_attributes=True))
+        return ORJSONResponse(data, status_code=status_code, headers=headers)
@@ -0,0 +1,178 @@
+"""Объединение одинаковых одновременных запросов на чтение (single flight).
+
+В часы пик экраны ресторана одновременно запрашивают заказы одного ресторана, а
+покупатели — один и тот же заказ, и каждый запрос выполняет один и тот же SQL.
+Функции чтения CRUD, помеченные «@single_flight», выполняют запрос к БД один раз
+на все одинаковые вызовы, которые пришлись на время его выполнения в воркере:
+первый вызов (ведущий) выполняет запрос, остальные ждут его результат.
+
+Вызовы одинаковые, если совпадают функция и аргументы после сессии; ORM-объекты
+в аргументах сравниваются по первичному ключу. Результат ведущего принадлежит его
+сессии, поэтому ORM-объекты копируются в сессию каждого ожидающего через
+«merge(load=False)» — без запросов к БД. Строки («Row») и числа передаются как есть.
+
+Вызов выполняет запрос сам, а не присоединяется к чужому, если:
+    - после начала запроса ведущего в воркере была зафиксирована транзакция с
+      изменениями или
+      пришло событие об изменении в другом воркере («mark_changed»): вызов, который
+      начался после изменения, должен его увидеть, а запрос ведущего мог его не
+      увидеть. Такой вызов сам становится ведущим;
+    - в его сессии есть изменения, в том числе уже записанные в БД в текущей
+      транзакции: чужой запрос их не увидит;
+    - аргументы нельзя сравнить, например ORM-объект ещё не сохранён в БД;
+    - запрос ведущего завершился ошибкой или ведущий успел изменить объекты.
+
+Счётчик «single_flight_calls» показывает долю объединённых вызовов по функциям.
+"""
+
+import asyncio
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Tuple, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
+
+from .metrics import SINGLE_FLIGHT_CALLS
+
+F = TypeVar('F', bound=Callable)
+
+LEADER = 'leader'
+MERGED = 'merged'
+BYPASSED = 'bypassed'
+
+FLUSHED_KEY = 'single_flight_flushed'
+
+# результат ведущего, который завершился ошибкой: ожидающие выполняют запрос сами
+_FAILED = object()
+
+# количество транзакций, зафиксированных в воркере, и изменений из других воркеров
+_commits = 0
+
+# выполняемые запросы: результат ведущего и значение «_commits» в момент начала запроса
+_in_flight: Dict[Hashable, Tuple['asyncio.Future[Any]', int]] = {}
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session: Session, flush_context: Any) -> None:
+    session.info[FLUSHED_KEY] = True
+
+
+def mark_changed() -> None:
+    """Отмечаем изменение данных, о котором воркер узнал не из своего коммита.
+
+    Вызовы после этого не присоединяются к запросам, которые начались раньше.
+    """
+
+    global _commits
+    _commits += 1
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session: Session) -> None:
+    # пустой коммит (например, в конце каждого запроса в «get_db») ничего не меняет;
+    # «after_commit» вызывается до «after_transaction_end», и отметка о записи ещё на месте
+    if session.info.get(FLUSHED_KEY):
+        mark_changed()
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _after_transaction_end(session: Session, transaction: SessionTransaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(FLUSHED_KEY, None)
+
+
+def _session_is_clean(db: AsyncSession) -> bool:
+    return not (db.new or db.dirty or db.deleted or db.info.get(FLUSHED_KEY))
+
+
+def _key_part(value: Any) -> Hashable:
+    state = getattr(value, '_sa_instance_state', None)
+    if state is None:
+        return value
+    if state.identity is None:
+        raise TypeError('ORM-объект без первичного ключа')
+    return type(value).__name__, state.identity
+
+
+def _call_key(func: Callable, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Hashable:
+    key: Hashable = (
+        func.__qualname__,
+        tuple(_key_part(arg) for arg in args),
+        tuple(sorted((name, _key_part(value)) for name, value in kwargs.items())),
+    )
+    hash(key)
+    return key
+
+
+async def _adopt(db: AsyncSession, result: Any) -> Any:
+    # копируем ORM-объекты из сессии ведущего в сессию ожидающего
+    if isinstance(result, list):
+        return [await _adopt(db, item) for item in result]
+    if hasattr(result, '_sa_instance_state'):
+        return await db.merge(result, load=False)
+    return result
+
+
+async def _follow(db: AsyncSession, leader: 'asyncio.Future[Any]') -> Any:
+    # результат ведущего в сессии «db» или «_FAILED», если его не получить
+    # shield: отмена ожидающего не должна отменять запрос ведущего
+    result: Any = await asyncio.shield(leader)
+    if result is _FAILED:
+        return _FAILED
+    try:
+        return await _adopt(db, result)
+    except InvalidRequestError:
+        # ведущий уже изменил объекты, «merge(load=False)» их не примет
+        return _FAILED
+
+
+def single_flight(func: F) -> F:
+    """Декоратор функции чтения CRUD: одинаковые одновременные вызовы выполняют один запрос к БД.
+
+    Первый аргумент функции — сессия «AsyncSession». Функция не должна ничего
+    менять в БД и в переданных объектах.
+    """
+
+    name: str = func.__name__
+
+    async def run_alone(db: AsyncSession, *args: Any, **kwargs: Any) -> Any:
+        SINGLE_FLIGHT_CALLS.labels(name, BYPASSED).inc()
+        return await func(db, *args, **kwargs)
+
+    @wraps(func)
+    async def wrapper(db: AsyncSession, *args: Any, **kwargs: Any) -> Any:
+        if not _session_is_clean(db):
+            return await run_alone(db, *args, **kwargs)
+        try:
+            key: Hashable = _call_key(func, args, kwargs)
+        except TypeError:
+            return await run_alone(db, *args, **kwargs)
+
+        in_flight = _in_flight.get(key)
+        # запрос, который начался до последнего коммита, мог его не увидеть:
+        # тогда вызов становится новым ведущим
+        if in_flight is not None and in_flight[1] == _commits:
+            result: Any = await _follow(db, in_flight[0])
+            if result is _FAILED:
+                return await run_alone(db, *args, **kwargs)
+            SINGLE_FLIGHT_CALLS.labels(name, MERGED).inc()
+            return result
+
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        _in_flight[key] = (future, _commits)
+        SINGLE_FLIGHT_CALLS.labels(name, LEADER).inc()
+        try:
+            result = await func(db, *args, **kwargs)
+        except BaseException:
+            future.set_result(_FAILED)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if _in_flight.get(key, (None,))[0] is future:
+                del _in_flight[key]
+
+    return wrapper  # type: ignore[return-value]
@@ -0,0 +1,143 @@
+"""Журнал медленных запросов к БД.
+
+Запрос, который выполнялся дольше «SLOW_QUERY_THRESHOLD» секунд, записывается
+в журнал вместе с параметрами и маршрутом API, во время которого он выполнен.
+Время запросов измеряют обработчики событий движка из «src.core.metrics».
+
+План запроса получается в фоне, отдельной задачей на отдельном соединении, чтобы
+не задерживать ответ: выполняется «EXPLAIN» с теми же параметрами, а если включён
+«SLOW_QUERY_EXPLAIN_ANALYZE», для SELECT — «EXPLAIN (ANALYZE, BUFFERS)» в транзакции,
+которая затем откатывается.
+
+Журнал хранит последние «SLOW_QUERY_BUFFER_SIZE» записей в памяти воркера и виден
+в админ панели.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import re
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence, Set
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from src.configs import (SLOW_QUERY_BUFFER_SIZE, SLOW_QUERY_EXPLAIN_ANALYZE,
+                         SLOW_QUERY_THRESHOLD)
+from src.database import engine
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING_EXPLAINS = 4
+PARAMETER_MAX_LENGTH = 200
+
+_WHITESPACE = re.compile(r'\s+')
+# хэши паролей не должны попадать в журнал
+_PASSWORD_HASH = re.compile(r'^\$2[aby]?\$')
+
+
+def _format_parameter(value: Any) -> str:
+    if isinstance(value, str) and _PASSWORD_HASH.match(value):
+        return '***'
+    text: str = repr(value)
+    return text if len(text) <= PARAMETER_MAX_LENGTH else text[:PARAMETER_MAX_LENGTH] + '…'
+
+
+def _values(parameters: Any) -> Sequence[Any]:
+    # параметры драйвера: последовательность для asyncpg, словарь для других драйверов
+    if parameters is None:
+        return ()
+    return list(parameters.values()) if isinstance(parameters, Mapping) else parameters
+
+
+class SlowQueryLog:
+    """Последние медленные запросы к БД и их планы."""
+
+    def __init__(
+            self,
+            engine: AsyncEngine,
+            threshold: float = SLOW_QUERY_THRESHOLD,
+            explain_analyze: bool = SLOW_QUERY_EXPLAIN_ANALYZE,
+            buffer_size: int = SLOW_QUERY_BUFFER_SIZE,
+    ) -> None:
+        self.engine = engine
+        self.threshold = threshold
+        self.explain_analyze = explain_analyze
+        self.entries: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+        self._pending: Set[asyncio.Task] = set()
+
+    def record(self, statement: str, parameters: Any, duration: float, route: str, executemany: bool) -> None:
+        """Записываем запрос, если он выполнялся дольше порога.
+
+        Вызывается из обработчика события «after_cursor_execute», то есть из
+        синхронного кода внутри event loop, поэтому план запрашивается отдельной задачей.
+        """
+
+        if not self.threshold or duration < self.threshold or statement.startswith('EXPLAIN'):
+            return
+
+        values: Sequence[Any] = () if executemany else _values(parameters)
+        entry: Dict[str, Any] = {
+            'id': os.urandom(8).hex(),
+            'start': datetime.now(timezone.utc),
+            'route': route,
+            'duration_ms': round(duration * 1000, 3),
+            'statement': _WHITESPACE.sub(' ', statement).strip(),
+            'parameters': [_format_parameter(value) for value in values],
+            'plan': None,
+        }
+        self.entries.append(entry)
+        logger.warning(
+            'Медленный запрос к БД (%s мс) в %s: %s', entry['duration_ms'], route, entry['statement']
+        )
+
+        if executemany or len(self._pending) >= MAX_PENDING_EXPLAINS:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # задача получает пустой контекст, чтобы запрос плана не попал в метрики,
+        # профиль и трассировку запроса к API
+        task: asyncio.Task = contextvars.Context().run(
+            loop.create_task, self._explain(entry, statement, parameters)
+        )
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _explain(self, entry: Dict[str, Any], statement: str, parameters: Any) -> None:
+        analyze: bool = self.explain_analyze and statement.lstrip().upper().startswith('SELECT')
+        prefix: str = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+        try:
+            async with self.engine.connect() as conn:
+                result = await conn.exec_driver_sql(prefix + statement, parameters or None)
+                entry['plan'] = '\n'.join(row[0] for row in result)
+                await conn.rollback()
+        except Exception as exc:
+            entry['plan'] = f'Не удалось получить план запроса: {exc}'
+
+    async def wait(self) -> None:
+        """Ждём, пока будут получены планы уже записанных запросов."""
+
+        await asyncio.gather(*self._pending, return_exceptions=True)
+
+    async def close(self) -> None:
+        """Отменяем получение планов при остановке приложения."""
+
+        for task in self._pending:
+            task.cancel()
+        await self.wait()
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """Записи журнала, сначала новые."""
+
+        return list(reversed(self.entries))
+
+    def find(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Запись журнала по ID."""
+
+        return next((entry for entry in self.entries if entry['id'] == entry_id), None)
+
+
+slow_query_log = SlowQueryLog(engine)
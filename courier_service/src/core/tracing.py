@@ -0,0 +1,282 @@
+"""Трассировка запросов к API.
+
+Трассировка запроса — дерево вложенных отрезков (span): сам запрос, зависимости
+аутентификации, функции CRUD, каждый SQL-запрос, хэширование паролей bcrypt и
+сборка ответа. По ней видно, на что ушло время медленного запроса.
+
+Идентификатор трассировки передаётся в формате W3C Trace Context: если клиент
+прислал заголовок «traceparent», трассировка продолжает его трассировку, а ответ
+всегда содержит заголовок «traceparent» с идентификатором трассировки запроса.
+
+Трассировки собираются не для всех запросов: для доли «TRACE_SAMPLE_RATE» и для
+запросов, в заголовке «traceparent» которых стоит флаг записи. Последние
+«TRACE_BUFFER_SIZE» трассировок хранятся в памяти воркера и видны в админ панели,
+а если задан «TRACE_FILE», каждая трассировка дописывается в этот файл строкой JSON.
+Без собранной трассировки отрезки ничего не делают, кроме проверки contextvar.
+"""
+
+import asyncio
+import os
+import random
+import re
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import wraps
+from time import perf_counter
+from typing import (Any, Callable, Deque, Dict, Iterator, List, Optional,
+                    Tuple, TypeVar)
+
+import orjson
+from src.configs import TRACE_BUFFER_SIZE, TRACE_FILE, TRACE_SAMPLE_RATE
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+TRACEPARENT_HEADER = 'traceparent'
+SQL_STATEMENT_MAX_LENGTH = 500
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_WHITESPACE = re.compile(r'\s+')
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+
+class Span:
+    """Отрезок трассировки."""
+
+    __slots__ = ('name', 'span_id', 'parent_id', 'depth', 'started', 'duration', 'attributes')
+
+    def __init__(
+            self,
+            name: str,
+            parent_id: Optional[str],
+            depth: int,
+            attributes: Dict[str, Any],
+            started: Optional[float] = None,
+    ) -> None:
+        self.name = name
+        self.span_id: str = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.depth = depth
+        self.started: float = perf_counter() if started is None else started
+        self.duration: float = 0.0
+        self.attributes = attributes
+
+
+class Trace:
+    """Трассировка одного запроса: все его отрезки в порядке начала."""
+
+    def __init__(self, trace_id: str) -> None:
+        self.trace_id = trace_id
+        self.started_at: datetime = datetime.now(timezone.utc)
+        self.spans: List[Span] = []
+
+    def start_span(self, name: str, parent: Optional[Span], **attributes: Any) -> Span:
+        """Начинаем отрезок внутри родительского отрезка."""
+
+        span = Span(name, parent.span_id if parent else None, parent.depth + 1 if parent else 0, attributes)
+        self.spans.append(span)
+        return span
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Трассировка в виде словаря для выгрузки в JSON.
+
+        Начало отрезка — смещение в миллисекундах от начала первого отрезка трассировки.
+        """
+
+        root: Span = self.spans[0]
+        return {
+            'trace_id': self.trace_id,
+            'name': root.name,
+            'start': self.started_at,
+            'duration_ms': round(root.duration * 1000, 3),
+            'spans': [
+                {
+                    'span_id': span.span_id,
+                    'parent_id': span.parent_id,
+                    'name': span.name,
+                    'depth': span.depth,
+                    'offset_ms': round((span.started - root.started) * 1000, 3),
+                    'duration_ms': round(span.duration * 1000, 3),
+                    'attributes': span.attributes,
+                }
+                for span in self.spans
+            ],
+        }
+
+
+class TraceExporter:
+    """Хранилище завершённых трассировок: кольцевой буфер в памяти и, по желанию, файл JSONL."""
+
+    def __init__(self, buffer_size: int = TRACE_BUFFER_SIZE, path: Optional[str] = TRACE_FILE) -> None:
+        self.traces: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+        self.path = path
+
+    def export(self, trace: Trace) -> None:
+        """Сохраняем завершённую трассировку."""
+
+        data: Dict[str, Any] = trace.to_dict()
+        self.traces.append(data)
+        if self.path:
+            with open(self.path, 'ab') as file:
+                file.write(orjson.dumps(data, option=orjson.OPT_UTC_Z | orjson.OPT_APPEND_NEWLINE))
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """Сохранённые в памяти трассировки, сначала новые."""
+
+        return list(reversed(self.traces))
+
+    def find(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """Трассировка из буфера по идентификатору."""
+
+        return next((trace for trace in self.traces if trace['trace_id'] == trace_id), None)
+
+
+trace_exporter = TraceExporter()
+
+# Собираемая трассировка и текущий отрезок в ней
+_current: ContextVar[Optional[Tuple[Trace, Span]]] = ContextVar('trace_span', default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    """Идентификатор собираемой трассировки, None если трассировка не собирается."""
+
+    current = _current.get()
+    return current[0].trace_id if current is not None else None
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Отрезок трассировки вокруг блока «with».
+
+    Args:
+        - name (str): Название отрезка, например «jwt.decode».
+        - attributes (Any): Дополнительные сведения об отрезке.
+
+    Yields:
+        - Optional[Span]: Отрезок, None если трассировка не собирается.
+    """
+
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+
+    trace, parent = current
+    child: Span = trace.start_span(name, parent, **attributes)
+    token = _current.set((trace, child))
+    try:
+        yield child
+    finally:
+        child.duration = perf_counter() - child.started
+        _current.reset(token)
+
+
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    """Декоратор: отрезок трассировки вокруг каждого вызова функции.
+
+    По умолчанию отрезок называется по модулю и имени функции, например
+    «delivery.crud.get_order_by_id». Подходит и для обычных, и для асинхронных
+    функций, в том числе для зависимостей FastAPI: сигнатура функции сохраняется.
+    """
+
+    def decorator(func: F) -> F:
+        span_name: str = name or f'{func.__module__.removeprefix("src.")}.{func.__name__}'
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if _current.get() is None:
+                    return await func(*args, **kwargs)
+                with span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def record_sql_span(statement: str, started: float, duration: float) -> None:
+    """Добавляем в трассировку уже выполненный SQL-запрос.
+
+    Args:
+        - statement (str): Текст запроса, без параметров.
+        - started (float): Время начала по «perf_counter».
+        - duration (float): Время выполнения в секундах.
+    """
+
+    current = _current.get()
+    if current is None:
+        return
+
+    trace, parent = current
+    statement = _WHITESPACE.sub(' ', statement).strip()[:SQL_STATEMENT_MAX_LENGTH]
+    sql = Span('sql', parent.span_id, parent.depth + 1, {'statement': statement}, started=started)
+    sql.duration = duration
+    trace.spans.append(sql)
+
+
+def _parse_traceparent(scope: Scope) -> Tuple[Optional[str], Optional[str], bool]:
+    # идентификатор трассировки, родительский отрезок и флаг записи из заголовка «traceparent»
+    for key, value in scope['headers']:
+        if key == b'traceparent':
+            match = _TRACEPARENT.match(value.decode('latin-1').strip().lower())
+            if match is not None and match.group(1) != '0' * 32:
+                return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+            break
+    return None, None, False
+
+
+class TracingMiddleware:
+    """ASGI middleware, которое собирает трассировки запросов к API и передаёт их идентификатор."""
+
+    def __init__(self, app: ASGIApp, exporter: TraceExporter = trace_exporter) -> None:
+        self.app = app
+        self.exporter = exporter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id, sampled = _parse_traceparent(scope)
+        trace_id = trace_id or os.urandom(16).hex()
+        sampled = sampled or random.random() < TRACE_SAMPLE_RATE
+
+        if not sampled:
+            header: str = f'00-{trace_id}-{os.urandom(8).hex()}-00'
+            await self.app(scope, receive, self._with_traceparent(send, header))
+            return
+
+        trace = Trace(trace_id)
+        root: Span = trace.start_span(f'{scope["method"]} {scope["path"]}', None)
+        root.parent_id = parent_id
+        token = _current.set((trace, root))
+        try:
+            await self.app(scope, receive, self._with_traceparent(send, f'00-{trace_id}-{root.span_id}-01'))
+        finally:
+            root.duration = perf_counter() - root.started
+            _current.reset(token)
+            route = scope.get('route')
+            if route is not None:
+                root.name = f'{scope["method"]} {route.path}'
+            self.exporter.export(trace)
+
+    @staticmethod
+    def _with_traceparent(send: Send, header: str) -> Send:
+        async def send_with_traceparent(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message).append(TRACEPARENT_HEADER, header)
+            await send(message)
+
+        return send_with_traceparent
@@ -0,0 +1,69 @@
+"""Прогрев воркера при запуске приложения.
+
+Вызывается из lifespan до того, как воркер начинает принимать запросы: uvicorn
+открывает приём соединений только после завершения startup, поэтому первые запросы
+к воркеру не платят за ленивую инициализацию:
+    - настраиваются все мапперы SQLAlchemy (иначе это происходит при первом запросе к БД);
+    - открываются «DB_POOL_SIZE» соединений пула с БД;
+    - загружаются кэши в памяти воркера;
+    - собирается схема OpenAPI для «/docs» и «/redoc».
+"""
+
+import asyncio
+import logging
+from time import perf_counter
+from typing import Awaitable, Callable, Sequence
+
+from fastapi import FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import configure_mappers
+
+logger = logging.getLogger(__name__)
+
+CacheLoader = Callable[[AsyncSession], Awaitable[None]]
+
+
+async def open_pool_connections(engine: AsyncEngine) -> int:
+    """Открываем соединения пула заранее, столько, сколько пул хранит постоянно.
+
+    Returns:
+        - int: Количество открытых соединений, 0 для движка без пула (NullPool).
+    """
+
+    size = getattr(engine.sync_engine.pool, 'size', None)
+    if size is None:
+        return 0
+
+    async def connect() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+
+    # соединения берутся одновременно, иначе пул отдавал бы одно и то же соединение
+    await asyncio.gather(*(connect() for _ in range(size())))
+    return size()
+
+
+async def warm_up(
+        app: FastAPI,
+        engine: AsyncEngine,
+        session_factory: Callable[[], AsyncSession],
+        loaders: Sequence[CacheLoader] = (),
+) -> None:
+    """Прогреваем воркер.
+
+    Args:
+        - app (FastAPI): Приложение, для которого собирается схема OpenAPI.
+        - engine (AsyncEngine): Движок, пул которого заполняется.
+        - session_factory (Callable[[], AsyncSession]): Фабрика сессий для загрузки кэшей.
+        - loaders (Sequence[CacheLoader]): Функции, которые загружают кэши из БД.
+    """
+
+    started: float = perf_counter()
+    configure_mappers()
+    connections: int = await open_pool_connections(engine)
+    async with session_factory() as db:
+        for load in loaders:
+            await load(db)
+    app.openapi()
+    logger.info('Воркер прогрет за %.3f с, соединений с БД: %s', perf_counter() - started, connections)
@@ -1,14 +1,25 @@
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Optional
+
+from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
                                     create_async_engine)
 from sqlalchemy.orm import declarative_base, sessionmaker
-from src.configs import (DB_HOST, DB_NAME, DB_PORT, POSTGRES_PASSWORD,
-                         POSTGRES_USER)
+from src.configs import (DB_ADMISSION_LIMIT, DB_ADMISSION_QUEUE_SIZE,
+                         DB_ADMISSION_RETRY_AFTER, DB_ADMISSION_TIMEOUT,
+                         DB_HOST, DB_MAX_OVERFLOW, DB_NAME, DB_POOL_SIZE,
+                         DB_PORT, POSTGRES_PASSWORD, POSTGRES_USER)
+from src.core.admission import (AdmissionController, Overloaded,
+                                endpoint_priority)
+from starlette.requests import HTTPConnection
 
 SQLALCHEMY_DATABASE_URL = (
     f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 )
 
-engine: AsyncEngine = create_async_engine(SQLALCHEMY_DATABASE_URL)
+engine: AsyncEngine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW
+)
 
 async_session_local = sessionmaker(
     bind=engine,
@@ -19,7 +30,41 @@ async_session_local = sessionmaker(
 Base = declarative_base()
 
 
-async def get_db():
-    async with async_session_local() as session:
-        yield session
-        await session.commit()
+db_admission = AdmissionController(DB_ADMISSION_LIMIT, DB_ADMISSION_QUEUE_SIZE, DB_ADMISSION_TIMEOUT)
+
+
+@asynccontextmanager
+async def db_admitted(priority: Optional[int]) -> AsyncIterator[None]:
+    """Место в «db_admission» на время блока; None — без контроля допуска.
+
+    Raises:
+        - HTTPException: 503 с «Retry-After», если место не выдано.
+    """
+
+    if priority is not None:
+        try:
+            await db_admission.acquire(priority)
+        except Overloaded:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Сервис перегружен, повторите запрос позже.',
+                headers={'Retry-After': str(DB_ADMISSION_RETRY_AFTER)},
+            )
+
+    try:
+        yield
+    finally:
+        if priority is not None:
+            db_admission.release()
+
+
+async def get_db(connection: HTTPConnection) -> AsyncGenerator[AsyncSession, None]:
+    """Сессия БД для запроса, выданная после допуска в «db_admission».
+
+    Если запрос не допущен, отвечаем 503 с «Retry-After».
+    """
+
+    async with db_admitted(endpoint_priority(connection.scope)):
+        async with async_session_local() as session:
+            yield session
+            await session.commit()
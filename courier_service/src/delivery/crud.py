@@ -1,17 +1,26 @@
 from datetime import datetime, time
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import pytz
 from fastapi import HTTPException, status
-from sqlalchemy import desc, select
+from sqlalchemy import Row, desc, func, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.configs import TIMEZONE
+from sqlalchemy.orm import joinedload, raiseload
+from sqlalchemy.orm.exc import StaleDataError
+from src.configs import COURIER_MAX_ORDERS, TIMEZONE
+from src.core.single_flight import single_flight
+from src.core.tracing import traced
+from src.users.models import User
 from src.users.security import get_password_hash
 
-from .models import Courier, Order, Restaurant
+from .events import publish_order_status, publish_order_statuses
+from .models import (Courier, CourierLocation, DeliveryEstimate, Order,
+                     Restaurant)
+from .restaurant_orders import restaurant_orders
 
 
+@traced()
 async def post_restaurant(
         db: AsyncSession,
         name: str,
@@ -52,6 +61,8 @@ async def post_restaurant(
     return new_restaurant
 
 
+@traced()
+@single_flight
 async def get_restaurant_by_id(db: AsyncSession, restaurant_id: int) -> Optional[Restaurant]:
     """Получаем один объект из таблицы SQLAlchemy «Restaurant» по полю «id».
 
@@ -67,6 +78,28 @@ async def get_restaurant_by_id(db: AsyncSession, restaurant_id: int) -> Optional
     return restaurant.scalars().one_or_none()
 
 
+@traced()
+@single_flight
+async def get_restaurant_address(db: AsyncSession, restaurant_id: int) -> Optional[Row]:
+    """Получаем только адрес ресторана, без загрузки заказов.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - restaurant_id (int): ID ресторана.
+
+    Returns:
+        - Optional[Row]: Строка с полями «city», «street» и «house_number», если ресторан найден, иначе None.
+    """
+
+    address = await db.execute(
+        select(Restaurant.city, Restaurant.street, Restaurant.house_number).
+        filter(Restaurant.id == restaurant_id)
+    )
+    return address.one_or_none()
+
+
+@traced()
+@single_flight
 async def get_order_by_id(db: AsyncSession, order_id: int) -> Optional[Order]:
     """Получаем объект из таблицы SQLAlchemy «Order» по полю «id».
 
@@ -82,6 +115,32 @@ async def get_order_by_id(db: AsyncSession, order_id: int) -> Optional[Order]:
     return order.scalars().one_or_none()
 
 
+@traced()
+@single_flight
+async def get_order_version(db: AsyncSession, order_id: int) -> Optional[Row]:
+    """Получаем версию заказа по полю «id», без загрузки связанных объектов.
+
+    Используется для ответа на условные GET-запросы: по версии заказа
+    строится ETag, а сам заказ загружается только если он изменился.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - order_id (int): ID заказа.
+
+    Returns:
+        - Optional[Row]: Строка с полями «version», «restaurant_id», «user_id» и «start_time»,
+                         если заказ найден, иначе None.
+    """
+
+    order = await db.execute(
+        select(Order.version, Order.restaurant_id, Order.user_id, Order.start_time).
+        filter(Order.id == order_id)
+    )
+    return order.one_or_none()
+
+
+@traced()
+@single_flight
 async def get_active_restaurant_orders(db: AsyncSession, restaurant_id: int) -> Optional[List[Order]]:
     """Все активные заказы в ресторане.
 
@@ -106,6 +165,7 @@ async def get_active_restaurant_orders(db: AsyncSession, restaurant_id: int) ->
     return active_orders.scalars().all()
 
 
+@traced()
 async def create_courier(
         db: AsyncSession,
         password: str,
@@ -144,9 +204,13 @@ async def create_courier(
     return new_courier
 
 
+@traced()
+@single_flight
 async def get_courier_by_phone_number(db: AsyncSession, phone_number: str) -> Optional[Courier]:
     """Получаем курьера из базы данных, по полю «phone_number».
 
+    Заказы курьера не загружаются, для них есть отдельные запросы.
+
     Args:
         - db (AsyncSession): Асинхронная сессия базы данных SQLAlchemy.
         - phone_number (str): Номер телефона курьера, которого необходимо найти.
@@ -155,10 +219,16 @@ async def get_courier_by_phone_number(db: AsyncSession, phone_number: str) -> Op
         - Optional[Courier]: Объект пользователя, если найден, иначе None.
     """
 
-    courier = await db.execute(select(Courier).filter(Courier.phone_number == phone_number))
+    courier = await db.execute(
+        select(Courier).
+        filter(Courier.phone_number == phone_number).
+        options(raiseload(Courier.orders))
+    )
     return courier.scalars().one_or_none()
 
 
+@traced()
+@single_flight
 async def get_all_available_couriers_orders(db: AsyncSession) -> Optional[List[Order]]:
     """Все свободные заказы для курьеров, из всех ресторанов.
 
@@ -180,6 +250,8 @@ async def get_all_available_couriers_orders(db: AsyncSession) -> Optional[List[O
     return active_orders.scalars().all()
 
 
+@traced()
+@single_flight
 async def get_active_courier_order(
         db: AsyncSession,
         current_courier: Courier
@@ -208,6 +280,91 @@ async def get_active_courier_order(
     return courier_order.scalars().all()
 
 
+@traced()
+@single_flight
+async def get_all_courier_orders(db: AsyncSession, current_courier: Courier) -> List[Order]:
+    """Все заказы курьера.
+
+    Получаем объекты из таблицы SQLAlchemy «Order», которые выполнял/выполняет текущий курьер.
+
+    Args:
+        - current_courier (Courier): Объект курьера.
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+
+    Returns:
+        - List[Order]: Список заказов курьера.
+    """
+
+    courier_orders = await db.execute(
+        select(Order).
+        filter(Order.courier_id == current_courier.id).
+        order_by(desc(Order.id))
+    )
+    return courier_orders.scalars().all()
+
+
+@traced()
+@single_flight
+async def get_courier_orders_versions(
+        db: AsyncSession,
+        current_courier: Courier,
+        all_orders: bool
+) -> List[Row]:
+    """Версии заказов курьера, без загрузки самих заказов и связанных объектов.
+
+    Args:
+        - current_courier (Courier): Объект курьера.
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - all_orders (bool): Все заказы курьера или только заказы в статусе «В пути».
+
+    Returns:
+        - List[Row]: Строки с полями «id» и «version».
+    """
+
+    query = select(Order.id, Order.version).filter(Order.courier_id == current_courier.id)
+    if not all_orders:
+        query = query.filter(Order.status == 'В пути')
+
+    versions = await db.execute(query.order_by(desc(Order.id)))
+    return versions.all()
+
+
+@traced()
+async def lock_courier(db: AsyncSession, courier_id: int) -> None:
+    """Блокируем строку курьера до конца транзакции.
+
+    Так взятие, завершение и автоматическое назначение заказов одного курьера
+    выполняются по очереди и не расходятся в подсчёте его активных заказов.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - courier_id (int): ID курьера.
+    """
+
+    await db.execute(select(Courier.id).filter(Courier.id == courier_id).with_for_update())
+
+
+@traced()
+async def count_active_courier_orders(db: AsyncSession, courier_id: int) -> int:
+    """Количество заказов курьера в статусе «В пути».
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - courier_id (int): ID курьера.
+
+    Returns:
+        - int: Количество активных заказов.
+    """
+
+    active_orders = await db.execute(
+        select(func.count()).
+        select_from(Order).
+        filter(Order.courier_id == courier_id, Order.status == 'В пути')
+    )
+    return active_orders.scalar_one()
+
+
+@traced()
 async def post_active_courier_order_by_id(
         db: AsyncSession,
         current_courier: Courier,
@@ -218,6 +375,9 @@ async def post_active_courier_order_by_id(
     - Получаем выбранный курьером заказ, меняем статус заказа на статус «В пути»
     и добавляем объект курьера в данный заказ.
     - Меняем статус работы курьера на статус «Выполняет заказ».
+    - Публикуем событие о смене статуса заказа.
+
+    Курьер может одновременно выполнять не больше «COURIER_MAX_ORDERS» заказов.
 
     Args:
         - current_courier (Courier): Объект курьера.
@@ -225,6 +385,14 @@ async def post_active_courier_order_by_id(
         - order_id (int): ID заказа.
     """
 
+    # строка курьера блокируется, чтобы ему одновременно не назначили заказ автоматически
+    await lock_courier(db, current_courier.id)
+    if await count_active_courier_orders(db, current_courier.id) >= COURIER_MAX_ORDERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='У вас уже максимальное количество заказов.',
+        )
+
     courier_order = await db.execute(
         select(Order).
         filter(
@@ -244,11 +412,24 @@ async def post_active_courier_order_by_id(
     courier_order.courier_id = current_courier.id
     current_courier.status = 'Выполняет заказ'
 
+    try:
+        await db.flush()
+    except StaleDataError:
+        # заказ уже успел взять другой курьер
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Заказ с таким ID не найден.'
+        )
+
+    await publish_order_status(db, courier_order)
     await db.commit()
+    restaurant_orders.bump(courier_order.restaurant_id)
     await db.refresh(courier_order)
     await db.refresh(current_courier)
 
 
+@traced()
 async def put_active_courier_order_by_id(
         db: AsyncSession,
         current_courier: Courier,
@@ -258,7 +439,9 @@ async def put_active_courier_order_by_id(
 
     - Получаем выбранный курьером заказ, меняем статус заказа на статус «Доставлен»,
     добавляем текущее время в поле «end_time».
-    - Меняем статус работы курьера на статус «Без заказа».
+    - Меняем статус работы курьера на статус «Без заказа», если других заказов
+    в статусе «В пути» у него не осталось.
+    - Публикуем событие о смене статуса заказа.
 
     Args:
         - current_courier (Courier): Объект курьера.
@@ -266,6 +449,7 @@ async def put_active_courier_order_by_id(
         - order_id (int): ID заказа.
     """
 
+    await lock_courier(db, current_courier.id)
     courier_order = await db.execute(
         select(Order).
         filter(
@@ -285,8 +469,162 @@ async def put_active_courier_order_by_id(
 
     courier_order.status = 'Доставлен'
     courier_order.end_time = datetime.now(pytz.timezone(TIMEZONE)).replace(microsecond=0)
-    current_courier.status = 'Без заказа'
+    await db.flush()
+
+    if not await count_active_courier_orders(db, current_courier.id):
+        current_courier.status = 'Без заказа'
+        await db.flush()
 
+    await publish_order_status(db, courier_order)
     await db.commit()
+    restaurant_orders.bump(courier_order.restaurant_id)
     await db.refresh(courier_order)
     await db.refresh(current_courier)
+
+
+@traced()
+async def get_free_couriers_for_update(db: AsyncSession, limit: int) -> List[Courier]:
+    """Свободные курьеры для автоматического распределения заказов.
+
+    Строки курьеров блокируются до конца транзакции, уже заблокированные
+    другими транзакциями строки пропускаются.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - limit (int): Максимальное количество курьеров.
+
+    Returns:
+        - List[Courier]: Курьеры в статусе «Без заказа».
+    """
+
+    couriers = await db.execute(
+        select(Courier).
+        filter(Courier.status == 'Без заказа').
+        options(raiseload(Courier.orders)).
+        order_by(Courier.id).
+        limit(limit).
+        with_for_update(skip_locked=True)
+    )
+    return couriers.scalars().all()
+
+
+@traced()
+async def get_searching_orders_for_update(db: AsyncSession, limit: int) -> List[Order]:
+    """Заказы в статусе «Поиск курьера» для автоматического распределения.
+
+    Вместе с заказом загружается только ресторан, строки заказов блокируются
+    до конца транзакции, уже заблокированные строки пропускаются.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - limit (int): Максимальное количество заказов, первыми идут самые старые.
+
+    Returns:
+        - List[Order]: Список заказов.
+    """
+
+    orders = await db.execute(
+        select(Order).
+        filter(Order.status == 'Поиск курьера').
+        options(
+            joinedload(Order.restaurant, innerjoin=True).raiseload('*'),
+            raiseload(Order.courier),
+            raiseload(Order.user),
+        ).
+        order_by(Order.id).
+        limit(limit).
+        with_for_update(skip_locked=True, of=Order)
+    )
+    return orders.scalars().all()
+
+
+@traced()
+async def get_couriers_last_drop_off(db: AsyncSession, courier_ids: Sequence[int]) -> Dict[int, Row]:
+    """Адреса, по которым курьеры доставили свой последний заказ.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - courier_ids (Sequence[int]): ID курьеров.
+
+    Returns:
+        - Dict[int, Row]: Строки с полями «city», «street» и «house_number» по ID курьера.
+    """
+
+    drop_offs = await db.execute(
+        select(Order.courier_id, User.city, User.street, User.house_number).
+        join(User, Order.user_id == User.id).
+        filter(Order.courier_id.in_(courier_ids), Order.status == 'Доставлен').
+        order_by(Order.courier_id, desc(Order.end_time)).
+        distinct(Order.courier_id)
+    )
+    return {row.courier_id: row for row in drop_offs}
+
+
+@traced()
+async def get_couriers_last_locations(
+        db: AsyncSession,
+        courier_ids: Sequence[int],
+        since: datetime,
+) -> Dict[int, Row]:
+    """Последние сохранённые геопозиции курьеров.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - courier_ids (Sequence[int]): ID курьеров.
+        - since (datetime): Более старые геопозиции не учитываются.
+
+    Returns:
+        - Dict[int, Row]: Строки с полями «latitude» и «longitude» по ID курьера.
+    """
+
+    locations = await db.execute(
+        select(CourierLocation.courier_id, CourierLocation.latitude, CourierLocation.longitude).
+        filter(CourierLocation.courier_id.in_(courier_ids), CourierLocation.recorded_at >= since).
+        order_by(CourierLocation.courier_id, desc(CourierLocation.recorded_at)).
+        distinct(CourierLocation.courier_id)
+    )
+    return {row.courier_id: row for row in locations}
+
+
+@traced()
+async def assign_orders_to_couriers(db: AsyncSession, assignments: Sequence[Tuple[Courier, Order]]) -> None:
+    """Назначаем заказы курьерам одной транзакцией.
+
+    Курьеры и заказы должны быть заблокированы в этой же транзакции, например через
+    «get_free_couriers_for_update» и «get_searching_orders_for_update».
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - assignments (Sequence[Tuple[Courier, Order]]): Пары «курьер, заказ».
+    """
+
+    for courier, order in assignments:
+        order.status = 'В пути'
+        order.courier_id = courier.id
+        courier.status = 'Выполняет заказ'
+
+    await db.flush()
+    await publish_order_statuses(db, [order for _, order in assignments])
+    await db.commit()
+
+
+@traced()
+async def get_delivery_estimates(db: AsyncSession) -> List[Row]:
+    """Сохранённые оценки времени доставки всех ресторанов.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+
+    Returns:
+        - List[Row]: Строки с полями «restaurant_id», «hour», «minutes» и «samples».
+    """
+
+    estimates = await db.execute(
+        select(
+            DeliveryEstimate.restaurant_id,
+            DeliveryEstimate.hour,
+            DeliveryEstimate.minutes,
+            DeliveryEstimate.samples,
+        )
+    )
+    return estimates.all()
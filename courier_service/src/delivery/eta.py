@@ -0,0 +1,259 @@
+"""Ожидаемое время доставки.
+
+Вместо постоянного «Restaurant.duration_delivery» время доставки оценивается по
+завершённым заказам: для каждой пары «ресторан, час создания заказа» хранится
+экспоненциально взвешенное среднее длительности «end_time - start_time».
+
+Статистика живёт в памяти воркера и обновляется по событиям канала «order_events»
+о доставленных заказах, поэтому все воркеры получают одни и те же обновления,
+а ответ пользователю не требует запроса к БД. Раз в «ETA_FLUSH_INTERVAL» секунд
+изменившиеся значения сохраняются в таблицу «delivery_estimates», откуда их
+загружает новый воркер.
+
+Пока доставленных заказов мало, оценка смещена к «duration_delivery» ресторана.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pytz
+from sqlalchemy import Float, Integer, SmallInteger, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from src.configs import TIMEZONE
+from src.database import engine
+
+from .crud import get_delivery_estimates
+from .events import OrderEventsBroker, order_events
+from .models import DeliveryEstimate
+
+logger = logging.getLogger(__name__)
+
+ETA_SMOOTHING = 0.1
+ETA_PRIOR_WEIGHT = 2
+ETA_FLUSH_INTERVAL = 60
+ETA_MAX_MINUTES = 24 * 60
+DELIVERED_STATUS = 'Доставлен'
+
+# ID ресторана и час создания заказа
+EstimateKey = Tuple[int, int]
+# Среднее время доставки в минутах и количество учтённых заказов
+EstimateStats = Tuple[float, int]
+
+_insert_estimates = insert(DeliveryEstimate).from_select(
+    ['restaurant_id', 'hour', 'minutes', 'samples'],
+    select(
+        func.unnest(
+            bindparam('restaurant_ids', type_=ARRAY(Integer)),
+            bindparam('hours', type_=ARRAY(SmallInteger)),
+            bindparam('minutes', type_=ARRAY(Float)),
+            bindparam('samples', type_=ARRAY(Integer)),
+        ).table_valued('restaurant_id', 'hour', 'minutes', 'samples').render_derived()
+    ),
+)
+# воркеры сохраняют одни и те же значения, остаётся то, в котором учтено больше заказов
+_UPSERT_ESTIMATES = _insert_estimates.on_conflict_do_update(
+    index_elements=[DeliveryEstimate.restaurant_id, DeliveryEstimate.hour],
+    set_={
+        'minutes': _insert_estimates.excluded.minutes,
+        'samples': _insert_estimates.excluded.samples,
+        'updated_at': func.now(),
+    },
+    where=DeliveryEstimate.samples < _insert_estimates.excluded.samples,
+)
+
+
+class DeliveryEstimator:
+    """Оценки времени доставки в памяти воркера с периодической записью в БД."""
+
+    def __init__(
+            self,
+            broker: OrderEventsBroker,
+            engine: AsyncEngine,
+            smoothing: float = ETA_SMOOTHING,
+            flush_interval: float = ETA_FLUSH_INTERVAL,
+    ) -> None:
+        self.engine = engine
+        self.smoothing = smoothing
+        self.flush_interval = flush_interval
+        self._broker = broker
+        self._stats: Dict[EstimateKey, EstimateStats] = {}
+        self._dirty: Set[EstimateKey] = set()
+        self._loaded = False
+        self._pending: Optional[List[Dict[str, Any]]] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        broker.add_handler(self._on_event)
+
+    @property
+    def is_loaded(self) -> bool:
+        """Загружена ли статистика из БД."""
+
+        return self._loaded
+
+    def observe(self, restaurant_id: int, hour: int, minutes: float) -> None:
+        """Учитываем время доставки завершённого заказа.
+
+        Пока заказов меньше, чем «1 / smoothing», считается обычное среднее,
+        дальше — экспоненциально взвешенное. Заведомо ошибочные значения
+        (например, у заказов, завершённых через админку) пропускаются.
+
+        Args:
+            - restaurant_id (int): ID ресторана.
+            - hour (int): Час создания заказа по местному времени.
+            - minutes (float): Время от создания заказа до доставки, в минутах.
+        """
+
+        if not 0 < minutes <= ETA_MAX_MINUTES:
+            return
+
+        key: EstimateKey = (restaurant_id, hour)
+        mean, samples = self._stats.get(key, (0.0, 0))
+        samples += 1
+        mean += (minutes - mean) * max(self.smoothing, 1 / samples)
+        self._stats[key] = (mean, samples)
+        self._dirty.add(key)
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._run())
+
+    def estimate(self, restaurant_id: int, hour: int, prior: int) -> int:
+        """Ожидаемое время доставки в минутах.
+
+        Args:
+            - restaurant_id (int): ID ресторана.
+            - hour (int): Час создания заказа по местному времени.
+            - prior (int): Время доставки, указанное рестораном, используется пока мало статистики.
+
+        Returns:
+            - int: Время доставки в минутах.
+        """
+
+        stats: Optional[EstimateStats] = self._stats.get((restaurant_id, hour))
+        if stats is None:
+            return prior
+
+        mean, samples = stats
+        weight: float = min(samples, 1 / self.smoothing)
+        return round((mean * weight + prior * ETA_PRIOR_WEIGHT) / (weight + ETA_PRIOR_WEIGHT))
+
+    def revision(self, restaurant_id: int, hour: int) -> int:
+        """Номер изменения оценки, чтобы учитывать её в ETag без расчёта самой оценки."""
+
+        return self._stats.get((restaurant_id, hour), (0.0, 0))[1]
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        """Загружаем сохранённую статистику из БД, если она ещё не загружена.
+
+        Соединение с LISTEN открывается до запроса, а события, пришедшие во время
+        загрузки, применяются после неё, поэтому доставленные заказы не теряются.
+        """
+
+        if self._loaded:
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._loaded:
+                return
+
+            await self._broker.listen()
+
+            self._pending = []
+            try:
+                rows = await get_delivery_estimates(db)
+            finally:
+                pending, self._pending = self._pending, None
+
+            for row in rows:
+                key: EstimateKey = (row.restaurant_id, row.hour)
+                if row.samples > self._stats.get(key, (0.0, 0))[1]:
+                    self._stats[key] = (row.minutes, row.samples)
+            self._loaded = True
+
+            for event in pending:
+                self._apply(event)
+
+    async def flush(self) -> int:
+        """Сохраняем изменившиеся оценки в БД одним запросом.
+
+        Returns:
+            - int: Количество сохранённых оценок.
+        """
+
+        dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+
+        keys: List[EstimateKey] = list(dirty)
+        try:
+            async with self.engine.begin() as connection:
+                await connection.execute(_UPSERT_ESTIMATES, {
+                    'restaurant_ids': [restaurant_id for restaurant_id, _ in keys],
+                    'hours': [hour for _, hour in keys],
+                    'minutes': [self._stats[key][0] for key in keys],
+                    'samples': [self._stats[key][1] for key in keys],
+                })
+        except IntegrityError:
+            # ресторан успели удалить, пакет повторять бессмысленно
+            logger.warning('Не удалось сохранить %s оценок времени доставки', len(keys), exc_info=True)
+            return 0
+        except Exception:
+            self._dirty.update(dirty)
+            raise
+
+        return len(keys)
+
+    async def close(self) -> None:
+        """Останавливаем фоновую запись и сохраняем оставшиеся оценки."""
+
+        task, self._flush_task = self._flush_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def _on_event(self, event: Dict[str, Any]) -> None:
+        if event.get('event') == 'resync':
+            # соединение с LISTEN потеряно: при следующем запросе оно откроется заново,
+            # а из БД подгрузятся оценки, сохранённые другими воркерами за это время
+            self._loaded = False
+            return
+        if event.get('event') != 'order_status' or event.get('status') != DELIVERED_STATUS:
+            return
+        if self._pending is not None:
+            self._pending.append(event)
+        elif self._loaded:
+            self._apply(event)
+
+    def _apply(self, event: Dict[str, Any]) -> None:
+        try:
+            # «start_time» хранится в местном времени без часового пояса
+            start_time = pytz.timezone(TIMEZONE).localize(datetime.fromisoformat(event['start_time']))
+            end_time = datetime.fromisoformat(event['end_time'].replace('Z', '+00:00'))
+            restaurant_id: int = event['restaurant_id']
+        except (KeyError, TypeError, ValueError):
+            logger.warning('В событии нет данных для оценки времени доставки: %s', event)
+            return
+
+        self.observe(restaurant_id, start_time.hour, (end_time - start_time).total_seconds() / 60)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Ошибка при сохранении оценок времени доставки')
+
+
+delivery_estimates = DeliveryEstimator(order_events, engine)
@@ -0,0 +1,249 @@
+"""События заказов через PostgreSQL LISTEN/NOTIFY.
+
+Смена статуса заказа публикуется командой NOTIFY в той же транзакции, что и само
+изменение, поэтому событие уходит только после успешного коммита. Каждый воркер
+держит одно соединение с LISTEN и раздаёт события своим подписчикам в памяти,
+а также обработчикам внутри воркера, например снимку свободных заказов.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import (Any, AsyncIterator, Callable, Dict, List, Optional,
+                    Sequence, Set)
+
+import asyncpg
+import orjson
+from sqlalchemy import Text, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.core.single_flight import mark_changed
+from src.database import engine
+
+from .models import Order
+from .schemas import CourierOrdersInfoPyd
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_CHANNEL = 'order_events'
+SUBSCRIBER_QUEUE_SIZE = 100
+RECONNECT_DELAY = 1
+RECONNECT_MAX_DELAY = 30
+HEARTBEAT_INTERVAL = 15
+
+RESYNC_EVENT = orjson.dumps({'event': 'resync'}).decode()
+
+EventHandler = Callable[[Dict[str, Any]], None]
+
+
+def courier_order_item(order: Order) -> Dict[str, Any]:
+    """Заказ в виде «CourierOrdersInfoPyd» из JSON-совместимых типов."""
+
+    return CourierOrdersInfoPyd.model_validate(order, from_attributes=True).model_dump(mode='json')
+
+
+def order_status_event(order: Order, details: bool = False) -> str:
+    """Событие о текущем статусе заказа, в виде JSON-строки.
+
+    Args:
+        - order (Order): Объект заказа.
+        - details (bool): Добавить в событие заказ целиком в виде «CourierOrdersInfoPyd»,
+                          чтобы воркеры могли обновить снимок свободных заказов без запроса к БД.
+    """
+
+    event: Dict[str, Any] = {
+        'event': 'order_status',
+        'order_id': order.id,
+        'user_id': order.user_id,
+        'restaurant_id': order.restaurant_id,
+        'courier_id': order.courier_id,
+        'status': order.status,
+        'version': order.version,
+        'start_time': order.start_time,
+        'end_time': order.end_time,
+    }
+    if details:
+        event['order'] = courier_order_item(order)
+
+    return orjson.dumps(event, option=orjson.OPT_UTC_Z).decode()
+
+
+async def publish_order_status(db: AsyncSession, order: Order, details: bool = False) -> None:
+    """Публикуем событие о смене статуса заказа.
+
+    NOTIFY выполняется в текущей транзакции и будет доставлен слушателям
+    только после её коммита. Изменения заказа должны быть уже отправлены
+    в БД через «flush», чтобы в событие попала новая версия заказа.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - order (Order): Объект заказа.
+        - details (bool): Передать в событии заказ целиком, см. «order_status_event».
+    """
+
+    await db.execute(select(func.pg_notify(ORDER_EVENTS_CHANNEL, order_status_event(order, details))))
+
+
+async def publish_order_statuses(db: AsyncSession, orders: Sequence[Order]) -> None:
+    """Публикуем события о смене статуса нескольких заказов одним запросом.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - orders (Sequence[Order]): Объекты заказов.
+    """
+
+    if not orders:
+        return
+
+    payloads = bindparam('payloads', [order_status_event(order) for order in orders], type_=ARRAY(Text))
+    payload = func.unnest(payloads).column_valued('payload')
+    await db.execute(select(func.pg_notify(ORDER_EVENTS_CHANNEL, payload)))
+
+
+class OrderEventsBroker:
+    """Раздача событий заказов подписчикам внутри одного воркера.
+
+    Соединение с LISTEN открывается при первой подписке. Очереди подписчиков
+    ограничены по размеру: если клиент не успевает читать события, самые
+    старые из них отбрасываются.
+    """
+
+    def __init__(self, url: URL, channel: str = ORDER_EVENTS_CHANNEL) -> None:
+        self.url = url
+        self.channel = channel
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._handlers: List[EventHandler] = []
+        self._connection: Optional[asyncpg.Connection] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+
+    @property
+    def subscribers_count(self) -> int:
+        """Количество активных подписок в этом воркере."""
+
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def add_handler(self, handler: EventHandler) -> None:
+        """Добавляем обработчик, который получает все события канала.
+
+        Обработчик вызывается синхронно в цикле событий, поэтому должен быть быстрым.
+        При потере соединения с LISTEN он получает событие «resync».
+        """
+
+        self._handlers.append(handler)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int) -> AsyncIterator[asyncio.Queue]:
+        """Подписываемся на события заказов пользователя.
+
+        Args:
+            - user_id (int): ID пользователя.
+
+        Yields:
+            - asyncio.Queue: Очередь с событиями в виде JSON-строк.
+        """
+
+        await self.listen()
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[user_id].add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    async def close(self) -> None:
+        """Закрываем соединение с LISTEN, например при остановке воркера."""
+
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+
+        connection, self._connection = self._connection, None
+        if connection is not None and not connection.is_closed():
+            await connection.close()
+
+    async def listen(self) -> None:
+        """Открываем соединение с LISTEN, если оно ещё не открыто."""
+
+        if self._connection is not None:
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._connection is None:
+                self._connection = await self._connect()
+
+    async def _connect(self) -> asyncpg.Connection:
+        connection: asyncpg.Connection = await asyncpg.connect(
+            self.url.set(drivername='postgresql').render_as_string(hide_password=False)
+        )
+        await connection.add_listener(self.channel, self._on_notification)
+        connection.add_termination_listener(self._on_termination)
+        return connection
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            event: Dict[str, Any] = orjson.loads(payload)
+            user_id: int = event['user_id']
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            logger.warning('Некорректное событие в канале %s: %s', channel, payload)
+            return
+
+        self._dispatch(event)
+        for queue in self._subscribers.get(user_id, ()):
+            self._put(queue, payload)
+
+    def _on_termination(self, connection) -> None:
+        if connection is not self._connection:
+            return
+
+        logger.warning('Соединение LISTEN для канала %s потеряно', self.channel)
+        self._connection = None
+        self._dispatch({'event': 'resync'})
+        if self._subscribers and self._reconnect_task is None:
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = RECONNECT_DELAY
+        try:
+            while self._subscribers and self._connection is None:
+                try:
+                    self._connection = await self._connect()
+                except (OSError, asyncpg.PostgresError):
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                    continue
+
+                # пока соединения не было, события могли потеряться
+                for queues in self._subscribers.values():
+                    for queue in queues:
+                        self._put(queue, RESYNC_EVENT)
+        finally:
+            self._reconnect_task = None
+
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        # обработчики сбрасывают кэши, и следующие запросы к БД должны увидеть изменение
+        mark_changed()
+        for handler in self._handlers:
+            try:
+                handler(event)
+            except Exception:
+                logger.exception('Ошибка в обработчике событий канала %s', self.channel)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, payload: str) -> None:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(payload)
+
+
+order_events = OrderEventsBroker(engine.url)
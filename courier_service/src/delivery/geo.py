@@ -0,0 +1,183 @@
+"""Геометрия для распределения заказов между курьерами.
+
+Расстояния считаются по формуле гаверсинусов, а для поиска ближайших точек
+используется сетка из квадратных ячеек: точка попадает в ячейку по своим координатам,
+и поиск идёт кольцами ячеек вокруг заданной точки, начиная с ближайших.
+"""
+
+import math
+from collections import defaultdict
+from hashlib import blake2b
+from typing import (Dict, Generic, Hashable, Iterator, List, NamedTuple,
+                    Optional, Set, Tuple, TypeVar)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Границы города по умолчанию (Тюмень): южная, западная, северная, восточная
+CITY_BOUNDS = (57.08, 65.43, 57.22, 65.70)
+
+Key = TypeVar('Key', bound=Hashable)
+Cell = Tuple[int, int]
+
+
+class Point(NamedTuple):
+    """Точка на карте."""
+
+    latitude: float
+    longitude: float
+
+
+def haversine_km(a: Point, b: Point) -> float:
+    """Расстояние между двумя точками по поверхности Земли, в километрах."""
+
+    lat_a, lat_b = math.radians(a.latitude), math.radians(b.latitude)
+    d_lat = lat_b - lat_a
+    d_lon = math.radians(b.longitude - a.longitude)
+    h = math.sin(d_lat / 2) ** 2 + math.cos(lat_a) * math.cos(lat_b) * math.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def address_point(city: Optional[str], street: str, house_number: str) -> Point:
+    """Приблизительная точка адреса.
+
+    Координаты адресов в БД пока не хранятся, поэтому точка вычисляется из хэша
+    адреса внутри границ «CITY_BOUNDS». Для одного и того же адреса точка всегда
+    одна и та же, чего достаточно, чтобы сравнивать расстояния между адресами.
+    """
+
+    digest = blake2b(f'{city}|{street}|{house_number}'.lower().encode(), digest_size=8).digest()
+    south, west, north, east = CITY_BOUNDS
+    lat_share = int.from_bytes(digest[:4], 'big') / 0xFFFFFFFF
+    lon_share = int.from_bytes(digest[4:], 'big') / 0xFFFFFFFF
+    return Point(south + (north - south) * lat_share, west + (east - west) * lon_share)
+
+
+class GridIndex(Generic[Key]):
+    """Индекс точек в ячейках сетки для поиска ближайших.
+
+    Размер ячейки по долготе рассчитывается для широты «reference_latitude», поэтому
+    индекс подходит для точек в пределах одного города или региона южнее этой широты.
+    """
+
+    def __init__(self, cell_size_km: float = 0.5, reference_latitude: float = CITY_BOUNDS[2]) -> None:
+        self.cell_size_km = cell_size_km
+        self._lat_step = cell_size_km / KM_PER_DEGREE
+        self._lon_step = cell_size_km / (KM_PER_DEGREE * math.cos(math.radians(reference_latitude)))
+        self._points: Dict[Key, Point] = {}
+        self._cells: Dict[Cell, Set[Key]] = defaultdict(set)
+        # границы занятых ячеек, только расширяются
+        self._bounds: Optional[Tuple[int, int, int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._points
+
+    def get(self, key: Key) -> Optional[Point]:
+        """Точка по ключу, если она есть в индексе."""
+
+        return self._points.get(key)
+
+    def insert(self, key: Key, point: Point) -> None:
+        """Добавляем точку или переносим уже добавленную в новое место."""
+
+        cell: Cell = self._cell(point)
+        previous: Optional[Point] = self._points.get(key)
+        if previous is not None:
+            previous_cell: Cell = self._cell(previous)
+            if previous_cell == cell:
+                self._points[key] = point
+                return
+            self._discard(previous_cell, key)
+
+        self._points[key] = point
+        self._cells[cell].add(key)
+
+        if self._bounds is None:
+            self._bounds = (cell[0], cell[1], cell[0], cell[1])
+        else:
+            min_row, min_column, max_row, max_column = self._bounds
+            self._bounds = (
+                min(min_row, cell[0]), min(min_column, cell[1]),
+                max(max_row, cell[0]), max(max_column, cell[1]),
+            )
+
+    def remove(self, key: Key) -> None:
+        """Удаляем точку из индекса, если она там есть."""
+
+        point: Optional[Point] = self._points.pop(key, None)
+        if point is not None:
+            self._discard(self._cell(point), key)
+
+    def nearest(
+            self,
+            point: Point,
+            limit: int = 1,
+            max_distance_km: Optional[float] = None,
+    ) -> List[Tuple[float, Key]]:
+        """Ближайшие к заданной точке ключи.
+
+        Args:
+            - point (Point): Точка, от которой ищем.
+            - limit (int): Сколько ближайших ключей вернуть.
+            - max_distance_km (Optional[float]): Не возвращать ключи дальше этого расстояния.
+
+        Returns:
+            - List[Tuple[float, Key]]: Пары «расстояние в километрах, ключ» по возрастанию расстояния.
+        """
+
+        if not self._points or limit <= 0:
+            return []
+
+        center: Cell = self._cell(point)
+        max_ring: int = self._max_ring(center, max_distance_km)
+        found: List[Tuple[float, Key]] = []
+
+        for ring in range(max_ring + 1):
+            # точки в этом и следующих кольцах не ближе, чем (ring - 1) ячеек
+            if len(found) >= limit and found[limit - 1][0] <= (ring - 1) * self.cell_size_km:
+                break
+
+            for cell in self._ring(center, ring):
+                for key in self._cells.get(cell, ()):
+                    distance = haversine_km(point, self._points[key])
+                    if max_distance_km is None or distance <= max_distance_km:
+                        found.append((distance, key))
+            found.sort(key=lambda item: item[0])
+
+        return found[:limit]
+
+    def _cell(self, point: Point) -> Cell:
+        return math.floor(point.latitude / self._lat_step), math.floor(point.longitude / self._lon_step)
+
+    def _discard(self, cell: Cell, key: Key) -> None:
+        keys = self._cells.get(cell)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def _max_ring(self, center: Cell, max_distance_km: Optional[float]) -> int:
+        # дальше границ занятых ячеек искать бессмысленно
+        min_row, min_column, max_row, max_column = self._bounds
+        farthest = max(
+            center[0] - min_row, max_row - center[0], center[1] - min_column, max_column - center[1], 0
+        )
+        if max_distance_km is None:
+            return farthest
+        return min(farthest, math.ceil(max_distance_km / self.cell_size_km) + 1)
+
+    @staticmethod
+    def _ring(center: Cell, ring: int) -> Iterator[Cell]:
+        row, column = center
+        if ring == 0:
+            yield center
+            return
+        for d_column in range(-ring, ring + 1):
+            yield row - ring, column + d_column
+            yield row + ring, column + d_column
+        for d_row in range(-ring + 1, ring):
+            yield row + d_row, column - ring
+            yield row + d_row, column + ring
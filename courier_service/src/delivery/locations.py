@@ -0,0 +1,177 @@
+"""Геопозиции курьеров.
+
+Приложение курьера присылает геопозицию каждые несколько секунд. Последние позиции
+хранятся в памяти воркера в сетке «GridIndex», по ней ищутся ближайшие курьеры.
+В БД позиции пишутся фоновой задачей раз в «LOCATIONS_FLUSH_INTERVAL» секунд одним
+запросом на пакет, причём от каждого курьера за интервал сохраняется только
+последняя позиция.
+
+Каждый воркер знает только о позициях, которые пришли в него самого. Приложение
+присылает позиции часто, а балансировщик распределяет запросы между воркерами,
+поэтому позиция в любом воркере отстаёт не больше, чем на несколько интервалов.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import (DateTime, Float, Integer, bindparam, func, insert,
+                        select)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from src.database import engine
+
+from .geo import GridIndex, Point
+from .models import CourierLocation
+
+logger = logging.getLogger(__name__)
+
+LOCATIONS_FLUSH_INTERVAL = 5
+LOCATION_TTL = 10 * 60
+
+# Последняя несохранённая позиция: широта, долгота, время получения
+PendingLocation = Tuple[float, float, datetime]
+
+_INSERT_LOCATIONS = insert(CourierLocation).from_select(
+    ['courier_id', 'latitude', 'longitude', 'recorded_at'],
+    select(
+        func.unnest(
+            bindparam('courier_ids', type_=ARRAY(Integer)),
+            bindparam('latitudes', type_=ARRAY(Float)),
+            bindparam('longitudes', type_=ARRAY(Float)),
+            bindparam('recorded_at', type_=ARRAY(DateTime(timezone=True))),
+        ).table_valued('courier_id', 'latitude', 'longitude', 'recorded_at').render_derived()
+    ),
+)
+
+
+class CourierLocationStore:
+    """Последние геопозиции курьеров в памяти воркера с пакетной записью в БД."""
+
+    def __init__(
+            self,
+            engine: AsyncEngine,
+            flush_interval: float = LOCATIONS_FLUSH_INTERVAL,
+            ttl: float = LOCATION_TTL,
+    ) -> None:
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._index: GridIndex[int] = GridIndex()
+        self._seen_at: Dict[int, float] = {}
+        self._pending: Dict[int, PendingLocation] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def pending_count(self) -> int:
+        """Количество позиций, которые ещё не записаны в БД."""
+
+        return len(self._pending)
+
+    def record(self, courier_id: int, point: Point) -> None:
+        """Сохраняем новую геопозицию курьера.
+
+        Запрос к БД не выполняется, позиция попадёт в БД при следующей записи пакета.
+        """
+
+        self._index.insert(courier_id, point)
+        self._seen_at[courier_id] = monotonic()
+        self._pending[courier_id] = (point.latitude, point.longitude, datetime.now(timezone.utc))
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._run())
+
+    def get(self, courier_id: int) -> Optional[Point]:
+        """Последняя известная позиция курьера, если она не устарела."""
+
+        seen_at: Optional[float] = self._seen_at.get(courier_id)
+        if seen_at is None or monotonic() - seen_at > self.ttl:
+            return None
+        return self._index.get(courier_id)
+
+    def nearest(
+            self,
+            point: Point,
+            limit: int = 1,
+            max_distance_km: Optional[float] = None,
+    ) -> List[Tuple[float, int]]:
+        """Ближайшие к точке курьеры.
+
+        Устаревшие позиции удаляются из индекса фоновой задачей.
+
+        Returns:
+            - List[Tuple[float, int]]: Пары «расстояние в километрах, ID курьера».
+        """
+
+        return self._index.nearest(point, limit, max_distance_km)
+
+    def evict_stale(self) -> None:
+        """Удаляем из индекса курьеров, которые давно не присылали геопозицию."""
+
+        deadline = monotonic() - self.ttl
+        for courier_id in [courier_id for courier_id, seen_at in self._seen_at.items() if seen_at < deadline]:
+            del self._seen_at[courier_id]
+            self._index.remove(courier_id)
+
+    async def flush(self) -> int:
+        """Записываем накопленные позиции в БД одним запросом.
+
+        Returns:
+            - int: Количество записанных строк.
+        """
+
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        courier_ids = list(pending)
+        latitudes, longitudes, recorded_at = (list(column) for column in zip(*pending.values()))
+        try:
+            async with self.engine.begin() as connection:
+                await connection.execute(_INSERT_LOCATIONS, {
+                    'courier_ids': courier_ids,
+                    'latitudes': latitudes,
+                    'longitudes': longitudes,
+                    'recorded_at': recorded_at,
+                })
+        except IntegrityError:
+            # курьера успели удалить, пакет повторять бессмысленно
+            logger.warning('Не удалось записать %s геопозиций курьеров', len(pending), exc_info=True)
+            return 0
+        except Exception:
+            # более новые позиции уже лежат в «_pending», старые возвращаем только для остальных
+            for courier_id, location in pending.items():
+                self._pending.setdefault(courier_id, location)
+            raise
+
+        return len(pending)
+
+    async def close(self) -> None:
+        """Останавливаем фоновую запись и сохраняем оставшиеся позиции."""
+
+        task, self._flush_task = self._flush_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.evict_stale()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Ошибка при записи геопозиций курьеров')
+
+
+courier_locations = CourierLocationStore(engine)
@@ -0,0 +1,300 @@
+"""Автоматическое распределение заказов между свободными курьерами.
+
+Раз в «MATCHING_INTERVAL» секунд движок собирает свободных курьеров и столько же
+самых старых заказов в статусе «Поиск курьера» и решает задачу о назначениях,
+где стоимость пары — расстояние от курьера до ресторана:
+    - небольшие пакеты решаются точно, венгерским алгоритмом;
+    - большие пакеты жадно: сначала выбираются самые короткие пары из нескольких
+      ближайших к каждому заказу курьеров, оставшиеся заказы получают ближайшего
+      из оставшихся курьеров. Ближайшие курьеры ищутся по сетке «GridIndex»,
+      поэтому полная матрица расстояний не строится.
+
+Позиция курьера — его последняя геопозиция из приложения, а если её нет,
+адрес последней доставки.
+
+Все назначения пакета сохраняются одной транзакцией. Строки курьеров и заказов
+блокируются на время раунда, а advisory-блокировка гарантирует, что одновременно
+раунд выполняет только один воркер.
+
+Задача о назначениях решается в пуле потоков, чтобы цикл событий воркера продолжал
+обслуживать запросы. Пока она решается, строки курьеров и заказов остаются
+заблокированными, поэтому размер пакета ограничен «MAX_BATCH_SIZE», а венгерский
+алгоритм применяется только к пакетам до «HUNGARIAN_MAX_CELLS» пар (около 0,2 с).
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import Row, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.configs import MATCHING_BATCH_SIZE, MATCHING_INTERVAL
+
+from .crud import (assign_orders_to_couriers, get_couriers_last_drop_off,
+                   get_couriers_last_locations, get_free_couriers_for_update,
+                   get_searching_orders_for_update)
+from .geo import GridIndex, Point, address_point, haversine_km
+from .locations import LOCATION_TTL
+from .models import Courier, Order
+
+logger = logging.getLogger(__name__)
+
+MATCHING_LOCK_KEY = 0x636F7572  # произвольный ключ advisory-блокировки
+HUNGARIAN_MAX_CELLS = 40_000
+MAX_BATCH_SIZE = 1000
+GREEDY_CANDIDATES = 8
+UNKNOWN_POSITION_COST_KM = 10.0
+
+# Пары «индекс курьера, индекс заказа»
+Assignment = List[Tuple[int, int]]
+
+
+def pickup_cost(courier: Optional[Point], pickup: Point) -> float:
+    """Стоимость пары: расстояние от курьера до ресторана в километрах."""
+
+    return UNKNOWN_POSITION_COST_KM if courier is None else haversine_km(courier, pickup)
+
+
+def hungarian(cost: Sequence[Sequence[float]]) -> Assignment:
+    """Назначения с минимальной суммарной стоимостью (венгерский алгоритм).
+
+    Работает за O(n²·m), где n — меньшая из сторон матрицы.
+
+    Args:
+        - cost (Sequence[Sequence[float]]): Матрица стоимостей, строки — курьеры, столбцы — заказы.
+
+    Returns:
+        - Assignment: Пары «строка, столбец», их количество равно меньшей из сторон матрицы.
+    """
+
+    rows = len(cost)
+    columns = len(cost[0]) if rows else 0
+    if rows == 0 or columns == 0:
+        return []
+    if rows > columns:
+        transposed = [[cost[row][column] for row in range(rows)] for column in range(columns)]
+        return [(row, column) for column, row in _hungarian(transposed, columns, rows)]
+    return _hungarian(cost, rows, columns)
+
+
+def _hungarian(cost: Sequence[Sequence[float]], rows: int, columns: int) -> Assignment:
+    # алгоритм с потенциалами для матрицы, в которой строк не больше, чем столбцов
+    infinity = float('inf')
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (columns + 1)
+    matched_row = [0] * (columns + 1)
+    way = [0] * (columns + 1)
+
+    for row in range(1, rows + 1):
+        matched_row[0] = row
+        column = 0
+        min_value = [infinity] * (columns + 1)
+        used = [False] * (columns + 1)
+
+        while matched_row[column] != 0:
+            used[column] = True
+            current_row = matched_row[column]
+            row_cost = cost[current_row - 1]
+            u_row = u[current_row]
+            delta = infinity
+            next_column = 0
+
+            for candidate in range(1, columns + 1):
+                if used[candidate]:
+                    continue
+                value = row_cost[candidate - 1] - u_row - v[candidate]
+                if value < min_value[candidate]:
+                    min_value[candidate] = value
+                    way[candidate] = column
+                if min_value[candidate] < delta:
+                    delta = min_value[candidate]
+                    next_column = candidate
+
+            for candidate in range(columns + 1):
+                if used[candidate]:
+                    u[matched_row[candidate]] += delta
+                    v[candidate] -= delta
+                else:
+                    min_value[candidate] -= delta
+
+            column = next_column
+
+        while column != 0:
+            previous_column = way[column]
+            matched_row[column] = matched_row[previous_column]
+            column = previous_column
+
+    return [(matched_row[column] - 1, column - 1) for column in range(1, columns + 1) if matched_row[column]]
+
+
+def greedy_assignment(couriers: Sequence[Optional[Point]], orders: Sequence[Point]) -> Assignment:
+    """Жадные назначения для больших пакетов.
+
+    Курьеры без известной позиции получают заказы, только когда закончились
+    курьеры с позицией.
+    """
+
+    index: GridIndex[int] = GridIndex()
+    unknown: List[int] = []
+    for courier, point in enumerate(couriers):
+        if point is None:
+            unknown.append(courier)
+        else:
+            index.insert(courier, point)
+
+    candidates: List[Tuple[float, int, int]] = [
+        (distance, order, courier)
+        for order, point in enumerate(orders)
+        for distance, courier in index.nearest(point, GREEDY_CANDIDATES)
+    ]
+    candidates.sort()
+
+    assignment: Assignment = []
+    assigned: Set[int] = set()
+    for _, order, courier in candidates:
+        if order not in assigned and courier in index:
+            index.remove(courier)
+            assigned.add(order)
+            assignment.append((courier, order))
+
+    unknown.reverse()
+    for order, point in enumerate(orders):
+        if order in assigned:
+            continue
+        nearest = index.nearest(point)
+        if nearest:
+            courier = nearest[0][1]
+            index.remove(courier)
+        elif unknown:
+            courier = unknown.pop()
+        else:
+            break
+        assignment.append((courier, order))
+
+    return assignment
+
+
+def match(couriers: Sequence[Optional[Point]], orders: Sequence[Point]) -> Assignment:
+    """Назначаем заказы курьерам, выбирая алгоритм по размеру пакета.
+
+    Args:
+        - couriers (Sequence[Optional[Point]]): Позиции курьеров, None если позиция неизвестна.
+        - orders (Sequence[Point]): Точки, откуда нужно забрать заказы.
+
+    Returns:
+        - Assignment: Пары «индекс курьера, индекс заказа».
+    """
+
+    if len(couriers) * len(orders) > HUNGARIAN_MAX_CELLS:
+        return greedy_assignment(couriers, orders)
+
+    return hungarian([[pickup_cost(courier, order) for order in orders] for courier in couriers])
+
+
+def courier_positions(
+        couriers: Sequence[Courier],
+        locations: Dict[int, Row],
+        drop_offs: Dict[int, Row],
+) -> List[Optional[Point]]:
+    """Позиции курьеров: последняя геопозиция из приложения, иначе адрес последней доставки."""
+
+    positions: List[Optional[Point]] = []
+    for courier in couriers:
+        location: Optional[Row] = locations.get(courier.id)
+        drop_off: Optional[Row] = drop_offs.get(courier.id)
+        if location is not None:
+            positions.append(Point(location.latitude, location.longitude))
+        elif drop_off is not None:
+            positions.append(address_point(drop_off.city, drop_off.street, drop_off.house_number))
+        else:
+            positions.append(None)
+    return positions
+
+
+class MatchingEngine:
+    """Периодическое распределение заказов внутри воркера."""
+
+    def __init__(
+            self,
+            session_factory: Callable[[], AsyncSession],
+            interval: float = MATCHING_INTERVAL,
+            batch_size: int = MATCHING_BATCH_SIZE,
+    ) -> None:
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Движок включается переменной окружения «MATCHING_INTERVAL»."""
+
+        return self.interval > 0
+
+    def start(self) -> None:
+        """Запускаем периодические раунды, если движок включён."""
+
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливаем раунды, например при остановке воркера."""
+
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def run_round(self) -> int:
+        """Один раунд распределения.
+
+        Returns:
+            - int: Количество назначенных заказов.
+        """
+
+        async with self.session_factory() as db:
+            locked = await db.execute(select(func.pg_try_advisory_xact_lock(MATCHING_LOCK_KEY)))
+            if not locked.scalar_one():
+                return 0
+
+            couriers: List[Courier] = await get_free_couriers_for_update(db, self.batch_size)
+            if not couriers:
+                return 0
+
+            # в раунд попадают самые старые заказы, чтобы дальние заказы не ждали бесконечно
+            orders: List[Order] = await get_searching_orders_for_update(db, len(couriers))
+            if not orders:
+                return 0
+
+            courier_ids: List[int] = [courier.id for courier in couriers]
+            since = datetime.now(timezone.utc) - timedelta(seconds=LOCATION_TTL)
+            locations: Dict[int, Row] = await get_couriers_last_locations(db, courier_ids, since)
+            drop_offs: Dict[int, Row] = await get_couriers_last_drop_off(db, courier_ids)
+            pickups: List[Point] = [
+                address_point(order.restaurant.city, order.restaurant.street, order.restaurant.house_number)
+                for order in orders
+            ]
+
+            positions = courier_positions(couriers, locations, drop_offs)
+            assignment: Assignment = await asyncio.get_running_loop().run_in_executor(
+                None, match, positions, pickups
+            )
+            await assign_orders_to_couriers(
+                db, [(couriers[courier], orders[order]) for courier, order in assignment]
+            )
+            return len(assignment)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                assigned = await self.run_round()
+            except Exception:
+                logger.exception('Ошибка при автоматическом распределении заказов')
+                continue
+            if assigned:
+                logger.info('Автоматически назначено заказов: %s', assigned)
@@ -1,5 +1,5 @@
 from sqlalchemy import CheckConstraint, Column, String
-from src.users.security import pwd_context
+from src.users.security import verify_password
 
 
 class AddressMixin:
@@ -41,7 +41,7 @@ class UserDataMixin:
         хранящегося в базе данных.
         """
 
-        return pwd_context.verify(password, self.hashed_password)
+        return verify_password(password, self.hashed_password)
 
     __table_args__ = (
         CheckConstraint(
@@ -1,5 +1,5 @@
-from sqlalchemy import (Column, DateTime, Enum, ForeignKey, Integer, String,
-                        Time, text)
+from sqlalchemy import (BigInteger, Column, DateTime, Enum, Float, ForeignKey,
+                        Index, Integer, SmallInteger, String, Time, func, text)
 from sqlalchemy.orm import relationship
 from src.configs import TIMEZONE
 from src.database import Base
@@ -58,7 +58,57 @@ class Order(Base):
     restaurant_id = Column(Integer, ForeignKey('restaurants.id'), comment='ID ресторана', nullable=False)
     courier_id = Column(Integer, ForeignKey('couriers.id'), comment='ID курьера')
     user_id = Column(Integer, ForeignKey('users.id'), comment='ID пользователя', nullable=False)
+    version = Column(
+        Integer, nullable=False, server_default='1',
+        comment='Версия заказа, увеличивается при каждом изменении статуса'
+    )
 
     restaurant = relationship('Restaurant', back_populates='orders', lazy='selectin')
     courier = relationship('Courier', back_populates='orders', lazy='selectin')
     user = relationship('User', back_populates='orders', lazy='selectin')
+
+    __mapper_args__ = {'version_id_col': version}
+
+
+class CourierLocation(Base):
+    """Таблица SQLAlchemy «Геопозиции курьеров».
+
+    Хранит историю геопозиций, которые присылает приложение курьера.
+    Строки добавляются пакетами, не чаще одной строки на курьера за интервал записи.
+    """
+
+    __tablename__ = 'courier_locations'
+
+    id = Column(BigInteger, primary_key=True)
+    courier_id = Column(
+        Integer, ForeignKey('couriers.id', ondelete='CASCADE'), comment='ID курьера', nullable=False
+    )
+    latitude = Column(Float, comment='Широта', nullable=False)
+    longitude = Column(Float, comment='Долгота', nullable=False)
+    recorded_at = Column(DateTime(timezone=True), comment='Время получения геопозиции', nullable=False)
+
+    __table_args__ = (
+        Index('ix_courier_locations_courier_id_recorded_at', 'courier_id', 'recorded_at'),
+    )
+
+
+class DeliveryEstimate(Base):
+    """Таблица SQLAlchemy «Оценки времени доставки».
+
+    Экспоненциально взвешенное среднее времени доставки заказов ресторана,
+    созданных в определённый час. Значения рассчитываются в памяти воркеров
+    и периодически сохраняются сюда, см. «src.delivery.eta».
+    """
+
+    __tablename__ = 'delivery_estimates'
+
+    restaurant_id = Column(
+        Integer, ForeignKey('restaurants.id', ondelete='CASCADE'), primary_key=True, comment='ID ресторана'
+    )
+    hour = Column(SmallInteger, primary_key=True, comment='Час создания заказа по местному времени')
+    minutes = Column(Float, nullable=False, comment='Среднее время доставки/в минутах')
+    samples = Column(Integer, nullable=False, comment='Количество учтённых заказов')
+    updated_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(),
+        comment='Время последнего сохранения'
+    )
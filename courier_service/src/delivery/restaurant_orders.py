@@ -0,0 +1,131 @@
+"""Кэш ответов со списками заказов ресторанов.
+
+Экраны ресторанов постоянно опрашивают «/api/v1/restaurants/{restaurant_id}/orders»,
+а список заказов одного ресторана меняется редко. Поэтому для каждого ресторана
+воркер хранит номер поколения, который увеличивается при каждом изменении заказов
+ресторана:
+    - сразу после коммита в «create_order», «post_active_courier_order_by_id» и
+      «put_active_courier_order_by_id», чтобы воркер, который изменил заказ, сразу
+      отдавал новый список;
+    - по событию канала «order_events» — так узнают об изменении остальные воркеры,
+      а также о назначении заказов в «MatchingEngine».
+
+Закодированные и сжатые тела ответов хранятся под ключом (ресторан, только активные,
+поколение, формат, сжатие) и вытесняются по LRU, если их больше
+«RESTAURANT_ORDERS_CACHE_SIZE». Пока заказы ресторана не менялись, список отдаётся
+из памяти без запросов к БД; после изменения ключ меняется, и старый ответ больше не
+используется. Если соединение с LISTEN теряется, события могли пропасть, поэтому
+кэш очищается целиком.
+
+Поколение меняется только после того, как изменение зафиксировано, а вызовы
+«@single_flight» после коммита или события не присоединяются к запросам, начатым
+раньше. Поэтому запрос, который уже видит новое поколение, загружает из БД список
+не старше этого изменения.
+
+Изменения, сделанные в обход API (например, через админку), событий не публикуют и
+попадут в кэш только после следующего изменения заказов ресторана.
+"""
+
+from collections import OrderedDict
+from typing import (Any, Awaitable, Callable, Dict, List, Optional, Sequence,
+                    Tuple)
+
+from fastapi import Request, Response
+from src.configs import RESTAURANT_ORDERS_CACHE_SIZE
+from src.core.metrics import RESTAURANT_ORDERS_CACHE
+from src.core.negotiation import (WireFormat, compress, encode_content,
+                                  negotiate_encoding, negotiate_format,
+                                  negotiated_response)
+
+from .events import OrderEventsBroker, order_events
+from .models import Order
+from .schemas import SummaryRestaurantOrderPyd
+
+# ресторан, только активные заказы, сброс всего кэша, поколение ресторана, формат и сжатие
+CacheKey = Tuple[int, bool, int, int, WireFormat, Optional[str]]
+
+HIT = 'hit'
+MISS = 'miss'
+
+
+class RestaurantOrdersCache:
+    """LRU-кэш тел ответов со списками заказов по поколениям ресторанов."""
+
+    def __init__(self, broker: OrderEventsBroker, max_entries: int = RESTAURANT_ORDERS_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._broker = broker
+        self._generations: Dict[int, int] = {}
+        self._epoch = 0
+        self._entries: 'OrderedDict[CacheKey, Tuple[bytes, Optional[str]]]' = OrderedDict()
+
+        broker.add_handler(self._on_event)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def bump(self, restaurant_id: int) -> None:
+        """Отмечаем, что заказы ресторана изменились."""
+
+        self._generations[restaurant_id] = self._generations.get(restaurant_id, 0) + 1
+
+    def clear(self) -> None:
+        """Сбрасываем весь кэш."""
+
+        self._epoch += 1
+        self._entries.clear()
+
+    async def response(
+            self,
+            request: Request,
+            restaurant_id: int,
+            active: bool,
+            load: Callable[[], Awaitable[Sequence[Order]]],
+    ) -> Response:
+        """Ответ со списком заказов ресторана из кэша или из «load».
+
+        Args:
+            - request (Request): Текущий запрос, из него берутся «Accept» и «Accept-Encoding».
+            - restaurant_id (int): ID ресторана.
+            - active (bool): Только активные заказы.
+            - load (Callable[[], Awaitable[Sequence[Order]]]): Загрузка заказов из БД
+              при промахе, может выбросить HTTPException.
+
+        Returns:
+            - Response: Закодированный и, при необходимости, сжатый ответ.
+        """
+
+        # без LISTEN изменения в других воркерах не сбросят кэш
+        await self._broker.listen()
+
+        wire_format: WireFormat = negotiate_format(request)
+        encoding: Optional[str] = negotiate_encoding(request)
+        # поколение берётся до запроса к БД: если заказы изменятся во время запроса,
+        # ответ сохранится под старым поколением и больше не будет использован
+        key: CacheKey = (
+            restaurant_id, active, self._epoch, self._generations.get(restaurant_id, 0), wire_format, encoding
+        )
+
+        rendered = self._entries.get(key)
+        if rendered is not None:
+            RESTAURANT_ORDERS_CACHE.labels(HIT).inc()
+            self._entries.move_to_end(key)
+        else:
+            RESTAURANT_ORDERS_CACHE.labels(MISS).inc()
+            orders: Sequence[Order] = await load()
+            body: bytes = encode_content(wire_format, List[SummaryRestaurantOrderPyd], orders)
+            rendered = compress(body, encoding)
+            self._entries[key] = rendered
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        body, content_encoding = rendered
+        return negotiated_response(body, wire_format, content_encoding)
+
+    def _on_event(self, event: Dict[str, Any]) -> None:
+        if event.get('event') == 'resync':
+            self.clear()
+        elif event.get('event') == 'order_status' and 'restaurant_id' in event:
+            self.bump(event['restaurant_id'])
+
+
+restaurant_orders = RestaurantOrdersCache(order_events)
@@ -1,30 +1,46 @@
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
+from fastapi import (APIRouter, Depends, HTTPException, Path, Query, Request,
+                     Response, status)
+from sqlalchemy import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from src.core.admission import WRITE_PRIORITY, admission_priority
+from src.core.etag import etag_matches, make_etag, not_modified
+from src.core.negotiation import (WireFormat, negotiate_format,
+                                  render_negotiated)
+from src.core.rate_limit import rate_limit_cost
+from src.core.responses import render
 from src.database import get_db
-from src.users.dependencies import get_current_courier
-from src.users.models import User
+from src.users.dependencies import (get_current_courier,
+                                    get_current_courier_id,
+                                    get_current_courier_phone_number)
 from src.users.schemas import CreateTokenPyd, ResponseTokenPyd, UserInfoPyd
-from src.users.security import create_access_token
+from src.users.security import COURIER_ROLE, create_access_token
 
 from .crud import (create_courier, get_active_courier_order,
-                   get_active_restaurant_orders,
-                   get_all_available_couriers_orders,
-                   get_courier_by_phone_number, get_order_by_id,
+                   get_active_restaurant_orders, get_all_courier_orders,
+                   get_courier_by_phone_number, get_courier_orders_versions,
+                   get_order_by_id, get_order_version, get_restaurant_address,
                    get_restaurant_by_id, post_active_courier_order_by_id,
                    post_restaurant, put_active_courier_order_by_id)
-from .exceptions import raise_forbidden_if_not_courier
+from .geo import Point, address_point, haversine_km
+from .locations import courier_locations
 from .models import Courier, Order, Restaurant
-from .schemas import (CourierOrdersInfoPyd, CreateCourierPyd,
-                      DetailedRestaurantInfoPyd, DetailedRestaurantOrderPyd,
-                      ResponseRestaurantPyd, SummaryRestaurantOrderPyd)
+from .restaurant_orders import restaurant_orders
+from .routing import PICKUP, Stop, plan_route
+from .schemas import (CourierLocationPyd, CourierOrdersInfoPyd,
+                      CreateCourierPyd, DetailedRestaurantInfoPyd,
+                      DetailedRestaurantOrderPyd, NearestCourierPyd,
+                      NormalizedCourierOrdersPyd, ResponseRestaurantPyd,
+                      RouteStopPyd, SummaryRestaurantOrderPyd)
+from .snapshot import available_orders
 
 delivery_router = APIRouter()
 
 
 @delivery_router.post('/api/v1/restaurants', response_model=ResponseRestaurantPyd,
                       summary='Добавить ресторан', tags=['Рестораны'],  status_code=201)
+@rate_limit_cost(5)
 async def create_restaurant(
     restaurant: DetailedRestaurantInfoPyd,
     db: AsyncSession = Depends(get_db),
@@ -39,38 +55,62 @@ async def create_restaurant(
                      response_model=List[SummaryRestaurantOrderPyd],
                      summary='Заказы ресторана', tags=['Рестораны'])
 async def get_restaurant_orders(
+    request: Request,
     db: AsyncSession = Depends(get_db),
     restaurant_id: int = Path(..., description='ID ресторана'),
     active: Optional[str] = Query(None, description='Выводим только активные заказы ресторана.')
-) -> Optional[List[Order]]:
+) -> Response:
     """
     По умолчанию выводятся все заказы ресторана, но вы можете передать параметр запроса «active»,
     что-бы получить список только активных заказов, у которых статус заказа находится в
     состоянии «Поиск курьера» или «В пути».
+
+    Список можно получить в формате MessagePack («Accept: application/msgpack»)
+    и в сжатом виде («Accept-Encoding: br» или «gzip»).
+
+    Ответы кэшируются в памяти воркера до следующего изменения заказов ресторана.
     """
 
-    restaurant: Optional[Restaurant] = await get_restaurant_by_id(db, restaurant_id)
+    async def load() -> List[Order]:
+        restaurant: Optional[Restaurant] = await get_restaurant_by_id(db, restaurant_id)
 
-    if restaurant is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='Ресторан с таким ID не найден.',
+        if restaurant is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Ресторан с таким ID не найден.',
+            )
+
+        return (
+            await get_active_restaurant_orders(db, restaurant_id) if active is not None
+            else restaurant.orders
         )
 
-    if active is not None:
-        return await get_active_restaurant_orders(db, restaurant_id)
-    return restaurant.orders
+    return await restaurant_orders.response(request, restaurant_id, active is not None, load)
 
 
 @delivery_router.get('/api/v1/restaurants/{restaurant_id}/orders/{order_id}',
                      response_model=DetailedRestaurantOrderPyd,
                      summary='Информация о заказе', tags=['Рестораны'])
 async def get_restaurant_order(
+    request: Request,
     db: AsyncSession = Depends(get_db),
     restaurant_id: int = Path(..., description='ID ресторана'),
     order_id: int = Path(..., description='ID заказа'),
-) -> DetailedRestaurantOrderPyd:
-    """Подробная информация об одном выбранном заказе ресторана."""
+) -> Response:
+    """
+    Подробная информация об одном выбранном заказе ресторана.
+
+    Ответ содержит заголовок «ETag». Если передать его в заголовке «If-None-Match»
+    и заказ с тех пор не менялся, вернётся ответ 304 без тела.
+    """
+
+    if_none_match: Optional[str] = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        order_version: Optional[Row] = await get_order_version(db, order_id)
+        if order_version is not None and order_version.restaurant_id == restaurant_id:
+            etag = make_etag(order_id, order_version.version)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
 
     order: Optional[Order] = await get_order_by_id(db, order_id)
 
@@ -80,23 +120,39 @@ async def get_restaurant_order(
             detail='Заказ с такими значениями «restaurant_id» и «order_id» не найден.',
         )
 
-    user: User = order.user
-    courier: Courier = order.courier
-    courier_data: Optional[Dict] = courier.__dict__ if courier else None
-
-    return DetailedRestaurantOrderPyd(
-        id=order.id,
-        status=order.status,
-        start_time=order.start_time,
-        restaurant_id=order.restaurant_id,
-        end_time=order.end_time,
-        courier=courier_data,
-        user=user.__dict__
-    )
+    return render(DetailedRestaurantOrderPyd, order, headers={'ETag': make_etag(order.id, order.version)})
+
+
+@delivery_router.get('/api/v1/restaurants/{restaurant_id}/nearest_couriers',
+                     response_model=List[NearestCourierPyd],
+                     summary='Ближайшие курьеры', tags=['Рестораны'])
+async def get_nearest_couriers(
+    db: AsyncSession = Depends(get_db),
+    restaurant_id: int = Path(..., description='ID ресторана'),
+    limit: int = Query(5, ge=1, le=50, description='Количество курьеров'),
+) -> List[Dict[str, Any]]:
+    """
+    Курьеры, которые недавно присылали геопозицию, в порядке удаления от ресторана.
+    """
+
+    address: Optional[Row] = await get_restaurant_address(db, restaurant_id)
+
+    if address is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Ресторан с таким ID не найден.',
+        )
+
+    point: Point = address_point(address.city, address.street, address.house_number)
+    return [
+        {'courier_id': courier_id, 'distance_km': round(distance, 3)}
+        for distance, courier_id in courier_locations.nearest(point, limit)
+    ]
 
 
 @delivery_router.post('/api/v1/couriers', response_model=UserInfoPyd,  status_code=201,
                       summary='Регистрация курьера', tags=['Курьеры'])
+@rate_limit_cost(5)
 async def register_couriers(
     courier: CreateCourierPyd,
     db: AsyncSession = Depends(get_db)
@@ -109,6 +165,7 @@ async def register_couriers(
 
 @delivery_router.post('/api/v1/couriers/token', response_model=ResponseTokenPyd,
                       summary='Получение токена для курьеров', tags=['Курьеры'])
+@rate_limit_cost(5)
 async def login_for_courier_access_token(
     login_request: CreateTokenPyd,
     db: AsyncSession = Depends(get_db)
@@ -122,44 +179,135 @@ async def login_for_courier_access_token(
             detail='Неверный номер телефона или пароль.',
         )
 
-    access_token: str = create_access_token({'sub': courier.phone_number})
+    access_token: str = create_access_token(
+        {'sub': courier.phone_number, 'role': COURIER_ROLE, 'id': courier.id}
+    )
     return {'access_token': access_token, 'token_type': 'Bearer'}
 
 
 @delivery_router.get('/api/v1/couriers/available_orders', response_model=List[CourierOrdersInfoPyd],
                      summary='Свободные заказы', tags=['Курьеры'])
 async def available_couriers_orders(
-    current_courier: Courier = Depends(get_current_courier),
+    request: Request,
+    phone_number: str = Depends(get_current_courier_phone_number),
     db: AsyncSession = Depends(get_db),
-) -> Optional[List[Order]]:
-    """Выводим список всех заказов, из всех рестаранов, которые могут взять курьеры."""
+) -> Response:
+    """
+    Выводим список всех заказов, из всех рестаранов, которые могут взять курьеры.
 
-    raise_forbidden_if_not_courier(current_courier)
+    С заголовком «Accept: application/vnd.courier.normalized+json» заказы ссылаются
+    на рестораны и пользователей по ID, а сами рестораны и пользователи передаются
+    один раз в полях «restaurants» и «users». Также поддерживаются форматы
+    «application/msgpack», «application/vnd.courier.normalized+msgpack»
+    и сжатие через «Accept-Encoding: br» или «gzip».
 
-    return await get_all_available_couriers_orders(db)
+    Список отдаётся из снимка в памяти воркера, который обновляется по событиям
+    создания и взятия заказов, поэтому обычно запрос не обращается к БД.
+    """
+
+    return await available_orders.response(request, db)
+
+
+@delivery_router.post('/api/v1/couriers/location', status_code=204,
+                      summary='Обновить геопозицию', tags=['Курьеры'])
+@rate_limit_cost(0)
+async def update_courier_location(
+    location: CourierLocationPyd,
+    courier_id: int = Depends(get_current_courier_id),
+) -> None:
+    """
+    Приложение курьера присылает текущую геопозицию каждые несколько секунд.
+
+    Геопозиция сразу учитывается при поиске ближайших курьеров,
+    а в БД записывается пакетами в фоне.
+    """
+
+    courier_locations.record(courier_id, Point(location.latitude, location.longitude))
 
 
 @delivery_router.get('/api/v1/couriers/orders',
                      response_model=List[CourierOrdersInfoPyd],
                      summary='Заказы курьера', tags=['Курьеры'])
 async def courier_orders(
+    request: Request,
     current_courier: Courier = Depends(get_current_courier),
     db: AsyncSession = Depends(get_db),
     all_orders: Optional[str] = Query(None, description='Выводим все заказы курьера.')
-) -> List[Optional[Order]]:
+) -> Response:
     """
     По умолчанию выводится только активный заказ курьера, у которого статус
     заказа «В пути». Но вы можете передать параметр запроса «all_orders»,
     что-бы получить список всех заказов, которые выполнял/выполняет курьер.
+
+    Ответ содержит заголовок «ETag», который можно передать в заголовке «If-None-Match».
+    Форматы ответа и сжатие такие же, как у списка свободных заказов.
     """
 
-    if all_orders is not None:
-        return current_courier.orders
-    return await get_active_courier_order(db, current_courier)
+    wire_format: WireFormat = negotiate_format(request, normalized=True)
+    response_type = NormalizedCourierOrdersPyd if wire_format.normalized else List[CourierOrdersInfoPyd]
+
+    if_none_match: Optional[str] = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        versions: List[Row] = await get_courier_orders_versions(db, current_courier, all_orders is not None)
+        etag = make_etag(wire_format.media_type, *(f'{order.id}-{order.version}' for order in versions))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    orders: List[Order] = (
+        await get_all_courier_orders(db, current_courier) if all_orders is not None
+        else await get_active_courier_order(db, current_courier)
+    )
+
+    etag = make_etag(wire_format.media_type, *(f'{order.id}-{order.version}' for order in orders))
+    return render_negotiated(request, wire_format, response_type, orders, headers={'ETag': etag})
+
+
+@delivery_router.get('/api/v1/couriers/route', response_model=List[RouteStopPyd],
+                     summary='Маршрут курьера', tags=['Курьеры'])
+async def courier_route(
+    current_courier: Courier = Depends(get_current_courier),
+    db: AsyncSession = Depends(get_db),
+) -> List[Dict[str, Any]]:
+    """
+    Порядок, в котором курьеру забирать и доставлять активные заказы.
+
+    Маршрут начинается с последней геопозиции курьера, и каждый заказ в нём
+    сначала забирается в ресторане, а потом доставляется пользователю.
+    """
+
+    orders: List[Order] = await get_active_courier_order(db, current_courier)
+    places = [(order.restaurant, order.user) for order in orders]
+    start: Optional[Point] = courier_locations.get(current_courier.id)
+
+    route: List[Stop] = plan_route(start, [
+        (
+            address_point(restaurant.city, restaurant.street, restaurant.house_number),
+            address_point(user.city, user.street, user.house_number),
+        )
+        for restaurant, user in places
+    ])
+
+    stops: List[Dict[str, Any]] = []
+    previous: Optional[Point] = start
+    for stop in route:
+        place = places[stop.order][0 if stop.action == PICKUP else 1]
+        stops.append({
+            'order_id': orders[stop.order].id,
+            'action': stop.action,
+            'city': place.city,
+            'street': place.street,
+            'house_number': place.house_number,
+            'distance_km': round(haversine_km(previous, stop.point), 3) if previous is not None else 0.0,
+        })
+        previous = stop.point
+
+    return stops
 
 
 @delivery_router.post('/api/v1/couriers/orders/{order_id}', status_code=204,
                       summary='Взять заказ', tags=['Курьеры'])
+@rate_limit_cost(2)
+@admission_priority(WRITE_PRIORITY)
 async def courier_accepts_order(
     current_courier: Courier = Depends(get_current_courier),
     db: AsyncSession = Depends(get_db),
@@ -167,17 +315,13 @@ async def courier_accepts_order(
 ) -> None:
     """Курьер берёт в работу выбранный заказ."""
 
-    if await get_active_courier_order(db, current_courier):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail='У вас уже есть один заказ.',
-        )
-
     await post_active_courier_order_by_id(db, current_courier, order_id)
 
 
 @delivery_router.put('/api/v1/couriers/orders/{order_id}', status_code=204,
                      summary='Завершить заказ', tags=['Курьеры'])
+@rate_limit_cost(2)
+@admission_priority(WRITE_PRIORITY)
 async def courier_completes_order(
     current_courier: Courier = Depends(get_current_courier),
     db: AsyncSession = Depends(get_db),
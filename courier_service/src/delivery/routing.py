@@ -0,0 +1,164 @@
+"""Порядок точек маршрута курьера с несколькими заказами.
+
+Каждый заказ нужно забрать в ресторане и отвезти пользователю, причём забрать
+раньше, чем отвезти. Маршрут начинается с позиции курьера и заканчивается
+последней доставкой, возвращаться никуда не нужно.
+
+Пока заказов не больше «EXACT_MAX_ORDERS», порядок ищется точно, динамическим
+программированием по подмножествам точек. Для большего количества заказов маршрут
+строится эвристикой ближайшего соседа и улучшается 2-opt: участок маршрута
+разворачивается, если маршрут становится короче, а каждый заказ по-прежнему
+сначала забирается и только потом доставляется.
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .geo import Point, haversine_km
+
+EXACT_MAX_ORDERS = 4
+PICKUP = 'pickup'
+DROP_OFF = 'drop_off'
+
+# Точки заказа: откуда забрать и куда отвезти
+OrderStops = Tuple[Point, Point]
+
+
+class Stop(NamedTuple):
+    """Точка маршрута."""
+
+    order: int  # индекс заказа в исходном списке
+    action: str  # «PICKUP» или «DROP_OFF»
+    point: Point
+
+
+def route_length(start: Optional[Point], route: Sequence[Stop]) -> float:
+    """Длина маршрута в километрах, от позиции курьера, если она известна."""
+
+    points: List[Point] = ([start] if start is not None else []) + [stop.point for stop in route]
+    return sum(haversine_km(a, b) for a, b in zip(points, points[1:]))
+
+
+def plan_route(start: Optional[Point], orders: Sequence[OrderStops]) -> List[Stop]:
+    """Порядок, в котором курьеру забирать и доставлять заказы.
+
+    Args:
+        - start (Optional[Point]): Позиция курьера, None если она неизвестна.
+        - orders (Sequence[OrderStops]): Пары точек «ресторан, адрес доставки» для каждого заказа.
+
+    Returns:
+        - List[Stop]: Точки маршрута по порядку, по две на каждый заказ.
+    """
+
+    if not orders:
+        return []
+
+    stops: List[Stop] = [
+        stop
+        for order, (pickup, drop_off) in enumerate(orders)
+        for stop in (Stop(order, PICKUP, pickup), Stop(order, DROP_OFF, drop_off))
+    ]
+    distances: List[List[float]] = [[haversine_km(a.point, b.point) for b in stops] for a in stops]
+    from_start: List[float] = [
+        haversine_km(start, stop.point) if start is not None else 0.0 for stop in stops
+    ]
+
+    if len(orders) <= EXACT_MAX_ORDERS:
+        sequence = _exact(distances, from_start)
+    else:
+        sequence = _two_opt(_nearest_neighbour(distances, from_start), distances, from_start)
+
+    return [stops[index] for index in sequence]
+
+
+# Во вспомогательных функциях точка с индексом 2k — ресторан заказа k, 2k + 1 — адрес доставки.
+
+def _is_available(stop: int, visited: int) -> bool:
+    # доставить заказ можно только после того, как его забрали
+    return stop % 2 == 0 or bool(visited >> (stop - 1) & 1)
+
+
+def _exact(distances: List[List[float]], from_start: List[float]) -> List[int]:
+    count = len(distances)
+    # лучшая длина и предыдущая точка для пары «посещённые точки, последняя точка»
+    best: Dict[Tuple[int, int], Tuple[float, int]] = {
+        (1 << stop, stop): (from_start[stop], -1) for stop in range(0, count, 2)
+    }
+
+    for visited in range(1, 1 << count):
+        for last in range(count):
+            state = best.get((visited, last))
+            if state is None:
+                continue
+            length = state[0]
+            for stop in range(count):
+                if visited >> stop & 1 or not _is_available(stop, visited):
+                    continue
+                key = (visited | 1 << stop, stop)
+                candidate = length + distances[last][stop]
+                if key not in best or candidate < best[key][0]:
+                    best[key] = (candidate, last)
+
+    full = (1 << count) - 1
+    last = min(
+        (stop for stop in range(count) if (full, stop) in best), key=lambda stop: best[(full, stop)][0]
+    )
+    sequence: List[int] = []
+    visited = full
+    while last != -1:
+        sequence.append(last)
+        previous = best[(visited, last)][1]
+        visited &= ~(1 << last)
+        last = previous
+
+    sequence.reverse()
+    return sequence
+
+
+def _nearest_neighbour(distances: List[List[float]], from_start: List[float]) -> List[int]:
+    count = len(distances)
+    sequence: List[int] = []
+    visited = 0
+    costs: List[float] = from_start
+
+    while len(sequence) < count:
+        stop = min(
+            (stop for stop in range(count) if not visited >> stop & 1 and _is_available(stop, visited)),
+            key=lambda stop: costs[stop],
+        )
+        sequence.append(stop)
+        visited |= 1 << stop
+        costs = distances[stop]
+
+    return sequence
+
+
+def _two_opt(sequence: List[int], distances: List[List[float]], from_start: List[float]) -> List[int]:
+    count = len(sequence)
+    improved = True
+
+    while improved:
+        improved = False
+        for i in range(count - 1):
+            for j in range(i + 1, count):
+                # длина внутри участка при развороте не меняется, меняются только его концы
+                before = from_start[sequence[i]] if i == 0 else distances[sequence[i - 1]][sequence[i]]
+                after = from_start[sequence[j]] if i == 0 else distances[sequence[i - 1]][sequence[j]]
+                if j + 1 < count:
+                    before += distances[sequence[j]][sequence[j + 1]]
+                    after += distances[sequence[i]][sequence[j + 1]]
+
+                if after < before - 1e-9 and _can_reverse(sequence, i, j):
+                    sequence[i:j + 1] = reversed(sequence[i:j + 1])
+                    improved = True
+
+    return sequence
+
+
+def _can_reverse(sequence: List[int], i: int, j: int) -> bool:
+    # разворот нарушит порядок, если внутри участка есть обе точки одного заказа
+    orders = set()
+    for stop in sequence[i:j + 1]:
+        if stop // 2 in orders:
+            return False
+        orders.add(stop // 2)
+    return True
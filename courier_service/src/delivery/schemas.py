@@ -1,9 +1,9 @@
 """Pydantic models."""
 
 from datetime import datetime, time
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from src.users.schemas import BaseAddressPyd, BaseUserDataPyd, UserInfoPyd
 
 
@@ -148,3 +148,92 @@ class CourierOrdersInfoPyd(BaseModel):
     start_time: datetime = Field(description='Время создания заказа')
     restaurant: DetailedRestaurantInfoPyd = Field(description='Ресторан из которого сделан заказ')
     user: DetailedUserInfoPyd = Field(description='Пользователь который сделал заказ')
+
+
+class NormalizedCourierOrderPyd(BaseOrderPyd):
+    """Pydantic модель заказа для нормализованного ответа, с ID вместо вложенных объектов.
+
+    Fields:
+        - id: int
+        - status: str
+        - start_time: datetime
+        - restaurant_id: int
+        - user_id: int
+    """
+
+    user_id: int = Field(description='ID пользователя, который сделал заказ')
+
+
+class NormalizedCourierOrdersPyd(BaseModel):
+    """Pydantic модель нормализованного списка заказов для курьера.
+
+    Каждый ресторан и пользователь передаётся один раз, а заказы ссылаются на них по ID.
+    При валидации списка ORM-объектов «Order» рестораны и пользователи собираются автоматически.
+
+    Fields:
+        - orders: List[NormalizedCourierOrderPyd]
+        - restaurants: Dict[int, DetailedRestaurantInfoPyd]
+        - users: Dict[int, DetailedUserInfoPyd]
+    """
+
+    orders: List[NormalizedCourierOrderPyd] = Field(description='Заказы')
+    restaurants: Dict[int, DetailedRestaurantInfoPyd] = Field(description='Рестораны по ID')
+    users: Dict[int, DetailedUserInfoPyd] = Field(description='Пользователи по ID')
+
+    @model_validator(mode='before')
+    @classmethod
+    def normalize_orders(cls, data: Any) -> Any:
+        """Собираем рестораны и пользователей из списка заказов, без повторов."""
+
+        if not isinstance(data, (list, tuple)):
+            return data
+
+        restaurants, users = {}, {}
+        for order in data:
+            restaurants.setdefault(order.restaurant_id, order.restaurant)
+            users.setdefault(order.user_id, order.user)
+
+        return {'orders': data, 'restaurants': restaurants, 'users': users}
+
+
+class CourierLocationPyd(BaseModel):
+    """Pydantic модель для геопозиции курьера.
+
+    Fields:
+        - latitude: float
+        - longitude: float
+    """
+
+    latitude: float = Field(ge=-90, le=90, description='Широта')
+    longitude: float = Field(ge=-180, le=180, description='Долгота')
+
+
+class NearestCourierPyd(BaseModel):
+    """Pydantic модель для вывода ближайшего к ресторану курьера.
+
+    Fields:
+        - courier_id: int
+        - distance_km: float
+    """
+
+    courier_id: int = Field(description='ID курьера')
+    distance_km: float = Field(description='Расстояние до ресторана/в километрах')
+
+
+class RouteStopPyd(BaseAddressPyd):
+    """Pydantic модель для точки маршрута курьера.
+
+    Fields:
+        - order_id: int
+        - action: str
+        - city: Optional[str]
+        - street: str
+        - house_number: str
+        - distance_km: float
+    """
+
+    order_id: int = Field(description='ID заказа')
+    action: str = Field(
+        description='«pickup» — забрать заказ в ресторане, «drop_off» — доставить пользователю'
+    )
+    distance_km: float = Field(description='Расстояние от предыдущей точки маршрута/в километрах')
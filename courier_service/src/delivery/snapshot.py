@@ -0,0 +1,166 @@
+"""Снимок свободных заказов в памяти воркера.
+
+Лента свободных заказов нужна всем курьерам сразу и читается намного чаще, чем
+меняется. Поэтому каждый воркер один раз загружает заказы в статусе «Поиск курьера»
+из БД, а дальше поддерживает снимок по событиям канала «order_events»: новый заказ
+добавляется, взятый курьером удаляется. Закодированные и сжатые тела ответа
+кэшируются для каждой пары формат/сжатие и сбрасываются при любом изменении снимка.
+
+Изменения, сделанные в обход API (например, через админку), попадут в снимок при
+следующей полной перезагрузке, раз в «RESYNC_INTERVAL» секунд.
+"""
+
+import asyncio
+import logging
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.core.negotiation import (WireFormat, compress, encode,
+                                  negotiate_encoding, negotiate_format,
+                                  negotiated_response)
+
+from .crud import get_all_available_couriers_orders
+from .events import OrderEventsBroker, courier_order_item, order_events
+
+logger = logging.getLogger(__name__)
+
+RESYNC_INTERVAL = 60
+SEARCHING_STATUS = 'Поиск курьера'
+
+# ID ресторана, ID пользователя и заказ в виде JSON-совместимого словаря
+SnapshotItem = Tuple[int, int, Dict[str, Any]]
+
+
+class AvailableOrdersSnapshot:
+    """Свободные заказы и готовые тела ответа для ленты курьеров."""
+
+    def __init__(self, broker: OrderEventsBroker, resync_interval: float = RESYNC_INTERVAL) -> None:
+        self.resync_interval = resync_interval
+        self._broker = broker
+        self._orders: Dict[int, SnapshotItem] = {}
+        self._rendered: Dict[Tuple[WireFormat, Optional[str]], Tuple[bytes, Optional[str]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._pending: Optional[List[Dict[str, Any]]] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+        broker.add_handler(self._on_event)
+
+    @property
+    def is_fresh(self) -> bool:
+        """Загружен ли снимок и не пора ли его перезагрузить."""
+
+        return self._loaded_at is not None and monotonic() - self._loaded_at < self.resync_interval
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    async def response(self, request: Request, db: AsyncSession) -> Response:
+        """Ответ со списком свободных заказов в формате, который запросил клиент.
+
+        Args:
+            - request (Request): Текущий запрос, из него берутся «Accept» и «Accept-Encoding».
+            - db (AsyncSession): Сессия, которая используется только если снимок нужно загрузить.
+
+        Returns:
+            - Response: Готовый ответ из кэша снимка.
+        """
+
+        if not self.is_fresh:
+            await self.load(db)
+
+        wire_format: WireFormat = negotiate_format(request, normalized=True)
+        encoding: Optional[str] = negotiate_encoding(request)
+
+        rendered = self._rendered.get((wire_format, encoding))
+        if rendered is None:
+            rendered = compress(encode(wire_format, self._content(wire_format)), encoding)
+            self._rendered[(wire_format, encoding)] = rendered
+
+        body, content_encoding = rendered
+        return negotiated_response(body, wire_format, content_encoding)
+
+    async def load(self, db: AsyncSession) -> None:
+        """Загружаем свободные заказы из БД.
+
+        Соединение с LISTEN открывается до запроса, а события, пришедшие во время
+        загрузки, применяются после неё, поэтому изменения не теряются.
+        """
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self.is_fresh:
+                return
+
+            await self._broker.listen()
+
+            self._pending = []
+            try:
+                orders = await get_all_available_couriers_orders(db)
+                loaded: Dict[int, SnapshotItem] = {
+                    order.id: (order.restaurant_id, order.user_id, courier_order_item(order))
+                    for order in orders
+                }
+            finally:
+                pending, self._pending = self._pending, None
+
+            self._orders = loaded
+            self._rendered.clear()
+            self._loaded_at = monotonic()
+
+            for event in pending:
+                self._apply(event)
+
+    def _on_event(self, event: Dict[str, Any]) -> None:
+        if event.get('event') not in ('order_status', 'resync'):
+            return
+        if self._pending is not None:
+            self._pending.append(event)
+        elif self._loaded_at is not None:
+            self._apply(event)
+
+    def _apply(self, event: Dict[str, Any]) -> None:
+        if event['event'] == 'resync':
+            self._loaded_at = None
+            return
+
+        try:
+            order_id: int = event['order_id']
+            if event['status'] == SEARCHING_STATUS:
+                self._orders[order_id] = (event['restaurant_id'], event['user_id'], event['order'])
+            elif self._orders.pop(order_id, None) is None:
+                return
+        except KeyError:
+            logger.warning('В событии нет данных для снимка свободных заказов: %s', event)
+            self._loaded_at = None
+            return
+
+        self._rendered.clear()
+
+    def _content(self, wire_format: WireFormat) -> Any:
+        items: List[SnapshotItem] = [self._orders[order_id] for order_id in sorted(self._orders)]
+
+        if not wire_format.normalized:
+            return [order for _, _, order in items]
+
+        orders: List[Dict[str, Any]] = []
+        restaurants: Dict[str, Dict[str, Any]] = {}
+        users: Dict[str, Dict[str, Any]] = {}
+        for restaurant_id, user_id, order in items:
+            orders.append({
+                'id': order['id'],
+                'status': order['status'],
+                'start_time': order['start_time'],
+                'restaurant_id': restaurant_id,
+                'user_id': user_id,
+            })
+            restaurants[str(restaurant_id)] = order['restaurant']
+            users[str(user_id)] = order['user']
+
+        return {'orders': orders, 'restaurants': restaurants, 'users': users}
+
+
+available_orders = AvailableOrdersSnapshot(order_events)
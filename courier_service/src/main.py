@@ -1,23 +1,86 @@
-from fastapi import FastAPI
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
-from slowapi.util import get_remote_address
-from src.admin.admin import setup_admin
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+from src.admin.lazy import LazyAdmin
+from src.configs import (ADMIN_ENABLED, ADMIN_PRELOAD, RATE_LIMIT_SLOTS,
+                         RATE_LIMIT_STORAGE)
+from src.core.capture import TrafficCaptureMiddleware, traffic_capture
+from src.core.metrics import (MetricsMiddleware, instrument_engine,
+                              mark_worker_stopped, metrics_response)
+from src.core.profiler import QueryProfilerMiddleware
+from src.core.rate_limit import (ANONYMOUS, BUYER, COURIER, Bucket,
+                                 RateLimitMiddleware, TokenBucketLimiter,
+                                 rate_limit_cost)
+from src.core.request_profiling import RequestProfilerMiddleware
+from src.core.responses import ORJSONResponse
+from src.core.slow_queries import slow_query_log
+from src.core.tracing import TracingMiddleware
+from src.core.warmup import warm_up
+from src.delivery.eta import delivery_estimates
+from src.delivery.events import order_events
+from src.delivery.locations import courier_locations
+from src.delivery.matching import MatchingEngine
 from src.delivery.routers import delivery_router
+from src.delivery.snapshot import available_orders
+from src.rpc.routers import rpc_router
+from src.users.dependencies import rate_limit_principal
 from src.users.routers import user_router
 
-from .database import engine
+from .database import async_session_local, engine
+
+matching_engine = MatchingEngine(async_session_local)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up(app, engine, async_session_local, [delivery_estimates.ensure_loaded, available_orders.load])
+    if ADMIN_ENABLED and ADMIN_PRELOAD:
+        admin.load()
+    matching_engine.start()
+    yield
+    await matching_engine.stop()
+    await courier_locations.close()
+    await delivery_estimates.close()
+    await order_events.close()
+    await slow_query_log.close()
+    traffic_capture.close()
+    await engine.dispose()
+    mark_worker_stopped()
+
 
-app = FastAPI(title='Courier Service API', description='Прототип API сервиса курьерской доставки.')
+app = FastAPI(title='Courier Service API', description='Прототип API сервиса курьерской доставки.',
+              default_response_class=ORJSONResponse, lifespan=lifespan)
 
-setup_admin(app, engine)
+instrument_engine(engine)
+admin = LazyAdmin(engine)
+if ADMIN_ENABLED:
+    app.mount('/admin', admin, name='admin')
 app.include_router(user_router)
 app.include_router(delivery_router)
+app.include_router(rpc_router)
+
+
+@app.get('/metrics', include_in_schema=False)
+@rate_limit_cost(0)
+async def metrics() -> Response:
+    """Метрики приложения для Prometheus."""
+
+    return metrics_response()
+
 
-limits = ['10/minute']
-limiter = Limiter(key_func=get_remote_address, default_limits=limits)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# стоимость запросов задаётся у эндпоинтов декоратором «rate_limit_cost»:
+# вход и регистрация с bcrypt стоят 5 токенов, чтение — 1;
+# у анонима ведро не больше, чем у покупателя, чтобы вход не уменьшал лимит
+buckets = {
+    ANONYMOUS: Bucket(capacity=60, refill_rate=1),
+    BUYER: Bucket(capacity=60, refill_rate=1),
+    COURIER: Bucket(capacity=120, refill_rate=2),
+}
+limiter = TokenBucketLimiter(buckets, rate_limit_principal, RATE_LIMIT_STORAGE, RATE_LIMIT_SLOTS)
 
-app.add_middleware(SlowAPIMiddleware)
+app.add_middleware(RateLimitMiddleware, limiter=limiter)
+app.add_middleware(QueryProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(TrafficCaptureMiddleware)
+app.add_middleware(RequestProfilerMiddleware)
@@ -0,0 +1,184 @@
+"""Методы JSON-RPC поверх операций CRUD.
+
+Метод регистрируется декоратором «rpc_method» и получает сессию БД, текущего
+пользователя или курьера (если методу нужна роль) и проверенные параметры. Каждый
+вызов получает свою сессию: методы чтения выполняются параллельно, методы записи —
+по очереди. Ошибки, которые REST API вернул бы через HTTPException, методы
+выбрасывают так же, они превращаются в ошибки JSON-RPC с кодом HTTP в «data.status».
+"""
+
+from typing import (Any, Awaitable, Callable, Dict, List, NamedTuple, Optional,
+                    Type)
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.core.rate_limit import DEFAULT_COST
+from src.core.responses import get_type_adapter
+from src.delivery.crud import (get_active_courier_order,
+                               get_active_restaurant_orders,
+                               get_all_courier_orders, get_order_by_id,
+                               get_restaurant_by_id,
+                               post_active_courier_order_by_id,
+                               put_active_courier_order_by_id)
+from src.delivery.eta import delivery_estimates
+from src.delivery.schemas import (BaseOrderPyd, CourierOrdersInfoPyd,
+                                  DetailedRestaurantOrderPyd,
+                                  ResponseUserCreateOrderPyd,
+                                  SummaryRestaurantOrderPyd)
+from src.users.crud import (create_order, get_active_user_orders,
+                            get_all_user_orders)
+from src.users.routers import detailed_user_order, shipping_cost
+from src.users.security import COURIER_ROLE, USER_ROLE
+
+from .schemas import (CourierOrdersParamsPyd, OrderParamsPyd,
+                      RestaurantOrderParamsPyd, RestaurantOrdersParamsPyd,
+                      RestaurantParamsPyd, UserOrdersParamsPyd)
+
+MethodFunc = Callable[[AsyncSession, Any, Any], Awaitable[Any]]
+
+
+class Method(NamedTuple):
+    """Зарегистрированный метод JSON-RPC."""
+
+    func: MethodFunc
+    params: Type[BaseModel]
+    role: Optional[str]  # USER_ROLE, COURIER_ROLE или None, если метод доступен всем
+    write: bool
+    cost: int  # стоимость для ограничения частоты, как у такого же запроса к REST API
+
+
+METHODS: Dict[str, Method] = {}
+
+
+def rpc_method(
+        name: str,
+        params: Type[BaseModel],
+        role: Optional[str] = None,
+        write: bool = False,
+        cost: int = DEFAULT_COST,
+) -> Callable[[MethodFunc], MethodFunc]:
+    """Регистрируем функцию как метод JSON-RPC.
+
+    Args:
+        - name (str): Имя метода.
+        - params (Type[BaseModel]): Схема параметров.
+        - role (Optional[str]): Роль, которая нужна для вызова.
+        - write (bool): Метод меняет данные, такие вызовы выполняются по очереди.
+        - cost (int): Стоимость вызова в токенах ограничения частоты.
+    """
+
+    def decorator(func: MethodFunc) -> MethodFunc:
+        METHODS[name] = Method(func, params, role, write, cost)
+        return func
+
+    return decorator
+
+
+def validate(type_: Any, content: Any) -> Any:
+    """Проверяем результат по схеме ответа, как это делают роутеры REST API."""
+
+    return get_type_adapter(type_).validate_python(content, from_attributes=True)
+
+
+@rpc_method('users.orders.list', UserOrdersParamsPyd, role=USER_ROLE)
+async def user_orders(db: AsyncSession, user: Any, params: UserOrdersParamsPyd) -> Any:
+    """Заказы пользователя, все или только активные."""
+
+    orders = await (get_active_user_orders(db, user) if params.active else get_all_user_orders(db, user))
+    return validate(List[BaseOrderPyd], orders)
+
+
+@rpc_method('users.orders.get', OrderParamsPyd, role=USER_ROLE)
+async def user_order(db: AsyncSession, user: Any, params: OrderParamsPyd) -> Any:
+    """Подробная информация о заказе пользователя."""
+
+    await delivery_estimates.ensure_loaded(db)
+    order = await get_order_by_id(db, params.order_id)
+
+    if order is None or order.user_id != user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='В вашем списке заказов нет заказа с таким значением «order_id».',
+        )
+
+    return detailed_user_order(order)
+
+
+@rpc_method('users.shipping_cost', RestaurantParamsPyd, role=USER_ROLE)
+async def user_shipping_cost(db: AsyncSession, user: Any, params: RestaurantParamsPyd) -> Any:
+    """Стоимость доставки из ресторана."""
+
+    return await shipping_cost(params.restaurant_id, user, db)
+
+
+@rpc_method('users.orders.create', RestaurantParamsPyd, role=USER_ROLE, write=True, cost=3)
+async def user_create_order(db: AsyncSession, user: Any, params: RestaurantParamsPyd) -> Any:
+    """Заказ из ресторана."""
+
+    order = await create_order(db, user.id, params.restaurant_id)
+    cost: Dict[str, int] = await shipping_cost(params.restaurant_id, user, db)
+
+    return ResponseUserCreateOrderPyd(
+        id=order.id,
+        status=order.status,
+        start_time=order.start_time,
+        restaurant_id=order.restaurant_id,
+        **cost
+    )
+
+
+@rpc_method('restaurants.orders.list', RestaurantOrdersParamsPyd)
+async def restaurant_orders(db: AsyncSession, _: Any, params: RestaurantOrdersParamsPyd) -> Any:
+    """Заказы ресторана, все или только активные."""
+
+    restaurant = await get_restaurant_by_id(db, params.restaurant_id)
+
+    if restaurant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Ресторан с таким ID не найден.')
+
+    orders = (
+        await get_active_restaurant_orders(db, params.restaurant_id) if params.active
+        else restaurant.orders
+    )
+    return validate(List[SummaryRestaurantOrderPyd], orders)
+
+
+@rpc_method('restaurants.orders.get', RestaurantOrderParamsPyd)
+async def restaurant_order(db: AsyncSession, _: Any, params: RestaurantOrderParamsPyd) -> Any:
+    """Подробная информация о заказе ресторана."""
+
+    order = await get_order_by_id(db, params.order_id)
+
+    if order is None or order.restaurant_id != params.restaurant_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Заказ с такими значениями «restaurant_id» и «order_id» не найден.',
+        )
+
+    return validate(DetailedRestaurantOrderPyd, order)
+
+
+@rpc_method('couriers.orders.list', CourierOrdersParamsPyd, role=COURIER_ROLE)
+async def courier_orders(db: AsyncSession, courier: Any, params: CourierOrdersParamsPyd) -> Any:
+    """Активный заказ курьера или все его заказы."""
+
+    orders = await (
+        get_all_courier_orders(db, courier) if params.all_orders
+        else get_active_courier_order(db, courier)
+    )
+    return validate(List[CourierOrdersInfoPyd], orders)
+
+
+@rpc_method('couriers.orders.accept', OrderParamsPyd, role=COURIER_ROLE, write=True, cost=2)
+async def courier_accept_order(db: AsyncSession, courier: Any, params: OrderParamsPyd) -> None:
+    """Курьер берёт заказ."""
+
+    await post_active_courier_order_by_id(db, courier, params.order_id)
+
+
+@rpc_method('couriers.orders.complete', OrderParamsPyd, role=COURIER_ROLE, write=True, cost=2)
+async def courier_complete_order(db: AsyncSession, courier: Any, params: OrderParamsPyd) -> None:
+    """Курьер завершает заказ."""
+
+    await put_active_courier_order_by_id(db, courier, params.order_id)
@@ -0,0 +1,79 @@
+"""Протокол JSON-RPC 2.0: разбор вызовов, ответы и коды ошибок."""
+
+from typing import Any, Dict, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+JSONRPC_VERSION = '2.0'
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+# ошибка, которую REST API вернул бы с кодом HTTP из «data.status»
+SERVER_ERROR = -32000
+
+
+class RpcError(Exception):
+    """Ошибка вызова, которая возвращается клиенту в поле «error»."""
+
+    def __init__(self, code: int, message: str, data: Optional[Any] = None) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+    @classmethod
+    def from_http_exception(cls, exc: HTTPException) -> 'RpcError':
+        return cls(SERVER_ERROR, str(exc.detail), {'status': exc.status_code})
+
+
+class Call(NamedTuple):
+    """Один вызов из запроса или пакета."""
+
+    id: Any
+    method: str
+    params: Dict[str, Any]
+    notification: bool
+
+
+def request_id(item: Any) -> Any:
+    """ID вызова для ответа с ошибкой, None если его не удалось прочитать."""
+
+    call_id = item.get('id') if isinstance(item, dict) else None
+    return call_id if isinstance(call_id, (str, int)) and not isinstance(call_id, bool) else None
+
+
+def parse_call(item: Any) -> Call:
+    """Проверяем вызов по спецификации JSON-RPC 2.0.
+
+    Параметры передаются только по именам, в виде объекта.
+
+    Raises:
+        - RpcError: Некорректный вызов или параметры.
+    """
+
+    if not isinstance(item, dict) or item.get('jsonrpc') != JSONRPC_VERSION:
+        raise RpcError(INVALID_REQUEST, 'Invalid Request')
+    if not isinstance(item.get('method'), str):
+        raise RpcError(INVALID_REQUEST, 'Invalid Request')
+    if 'id' in item and item['id'] is not None and request_id(item) is None:
+        raise RpcError(INVALID_REQUEST, 'Invalid Request')
+
+    params: Any = item.get('params', {})
+    if not isinstance(params, dict):
+        raise RpcError(INVALID_PARAMS, 'Параметры передаются только по именам, в виде объекта.')
+
+    return Call(item.get('id'), item['method'], params, notification='id' not in item)
+
+
+def result_response(call_id: Any, result: Any) -> Dict[str, Any]:
+    return {'jsonrpc': JSONRPC_VERSION, 'result': result, 'id': call_id}
+
+
+def error_response(call_id: Any, error: RpcError) -> Dict[str, Any]:
+    body: Dict[str, Any] = {'code': error.code, 'message': error.message}
+    if error.data is not None:
+        body['data'] = error.data
+    return {'jsonrpc': JSONRPC_VERSION, 'error': body, 'id': call_id}
@@ -0,0 +1,225 @@
+"""Эндпоинт JSON-RPC 2.0.
+
+Пакет вызовов заменяет несколько запросов к REST API одним: токен проверяется и
+пользователь или курьер загружается один раз на пакет, а методы чтения выполняются
+параллельно. Для ограничения частоты пакет стоит столько же, сколько те же вызовы
+через REST API: сумму стоимостей методов, но не меньше стоимости самого запроса. Одна сессия
+«AsyncSession» не выполняет запросы одновременно, поэтому каждый вызов чтения
+получает свою короткую сессию того же движка, что и запрос; одновременно
+выполняется не больше «RPC_READ_CONCURRENCY» вызовов чтения. Методы записи
+выполняются по очереди, тоже каждый в своей сессии, чтобы ошибка одного вызова
+не откатывала остальные. Запись идёт параллельно с чтением: спецификация
+JSON-RPC не гарантирует порядок выполнения вызовов пакета.
+
+Каждый вызов, как и отдельный запрос к REST API, занимает своё место в
+«db_admission» на время своей сессии, поэтому пакет не открывает соединений
+больше, чем допускает контроль допуска. Сам запрос получает место только на
+время проверки токена и возвращает соединение в пул до выполнения вызовов, чтобы
+не держать одно место, ожидая другие. Пакет, в котором есть методы записи,
+допускается с приоритетом записи.
+
+Пользователь и курьер загружаются в сессии запроса, а каждый вызов получает их
+копию в своей сессии через «merge(load=False)», без запроса к БД. Так изменения,
+которые метод записи делает в объекте (например, статус курьера), сохраняются в той
+же транзакции, что и остальные изменения вызова.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import orjson
+from fastapi import (APIRouter, Depends, HTTPException, Request, Response,
+                     status)
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from src.configs import RPC_MAX_BATCH_SIZE, RPC_READ_CONCURRENCY
+from src.core.admission import (READ_PRIORITY, WRITE_PRIORITY,
+                                admission_priority)
+from src.core.rate_limit import rate_limit_charge, rate_limit_cost
+from src.core.responses import ORJSONResponse
+from src.database import db_admitted, get_db
+from src.delivery.exceptions import raise_forbidden_if_not_courier
+from src.users.dependencies import (get_current_courier, get_current_user,
+                                    oauth2_scheme)
+from src.users.security import COURIER_ROLE, USER_ROLE
+
+from .methods import METHODS, Method
+from .protocol import (INTERNAL_ERROR, INVALID_PARAMS, INVALID_REQUEST,
+                       METHOD_NOT_FOUND, PARSE_ERROR, Call, RpcError,
+                       error_response, parse_call, request_id, result_response)
+
+logger = logging.getLogger(__name__)
+
+rpc_router = APIRouter()
+
+# стоимость запроса, которую middleware списывает до разбора тела
+RPC_REQUEST_COST = 1
+
+# результат проверки роли: объект пользователя/курьера или ошибка для всех вызовов с этой ролью
+Principal = Union[Any, HTTPException]
+
+
+async def _authenticate(request: Request, db: AsyncSession, methods: List[Method]) -> Dict[str, Principal]:
+    # проверяем токен один раз на пакет и только для ролей, которые нужны вызовам
+    principals: Dict[str, Principal] = {}
+    for role in (USER_ROLE, COURIER_ROLE):
+        if not any(method.role == role for method in methods):
+            continue
+        try:
+            token: str = await oauth2_scheme(request)
+            if role == USER_ROLE:
+                principal = await get_current_user(token=token, db=db)
+                if principal is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_403_FORBIDDEN,
+                        detail='Только пользователи имеют доступ к этому ресурсу',
+                    )
+            else:
+                principal = await get_current_courier(token=token, db=db)
+                raise_forbidden_if_not_courier(principal)
+        except HTTPException as exc:
+            principal = exc
+        principals[role] = principal
+    return principals
+
+
+async def _execute(method: Method, call: Call, db: AsyncSession, principal: Optional[Principal]) -> Any:
+    # выполняем вызов и переводим исключения в ошибки JSON-RPC
+    try:
+        if isinstance(principal, HTTPException):
+            raise principal
+        params = method.params.model_validate(call.params)
+        return await method.func(db, principal, params)
+    except ValidationError as exc:
+        raise RpcError(INVALID_PARAMS, 'Invalid params', exc.errors(include_url=False, include_context=False))
+    except HTTPException as exc:
+        raise RpcError.from_http_exception(exc)
+    except RpcError:
+        raise
+    except Exception:
+        logger.exception('Ошибка метода JSON-RPC «%s»', call.method)
+        raise RpcError(INTERNAL_ERROR, 'Internal error')
+
+
+Plan = Tuple[List[Call], List[Union[Any, RpcError]], List[Tuple[int, Method]], List[Tuple[int, Method]]]
+
+
+def _plan(items: List[Any]) -> Plan:
+    # разбираем вызовы пакета: ошибки разбора и неизвестные методы сразу становятся ответами,
+    # остальные вызовы делятся на чтение и запись
+    calls: List[Call] = []
+    outcomes: List[Union[Any, RpcError]] = [None] * len(items)
+    reads: List[Tuple[int, Method]] = []
+    writes: List[Tuple[int, Method]] = []
+    for index, item in enumerate(items):
+        try:
+            call: Call = parse_call(item)
+        except RpcError as exc:
+            calls.append(Call(request_id(item), '', {}, notification=False))
+            outcomes[index] = exc
+            continue
+        calls.append(call)
+        method: Optional[Method] = METHODS.get(call.method)
+        if method is None:
+            outcomes[index] = RpcError(METHOD_NOT_FOUND, 'Method not found')
+        else:
+            (writes if method.write else reads).append((index, method))
+    return calls, outcomes, reads, writes
+
+
+async def _run_calls(
+        bind: Any,
+        calls: List[Call],
+        outcomes: List[Union[Any, RpcError]],
+        reads: List[Tuple[int, Method]],
+        writes: List[Tuple[int, Method]],
+        principals: Dict[str, Principal],
+        priority: int,
+) -> None:
+    # чтение — параллельно, не больше «RPC_READ_CONCURRENCY» вызовов, запись — по очереди;
+    # каждый вызов получает своё место в «db_admission» и свою сессию
+    call_session = async_sessionmaker(bind, class_=AsyncSession, expire_on_commit=False)
+    semaphore = asyncio.Semaphore(RPC_READ_CONCURRENCY)
+
+    async def run(index: int, method: Method) -> None:
+        try:
+            async with db_admitted(priority), call_session() as session:
+                principal: Optional[Principal] = principals.get(method.role)
+                if principal is not None and not isinstance(principal, HTTPException):
+                    principal = await session.merge(principal, load=False)
+                outcomes[index] = await _execute(method, calls[index], session, principal)
+        except RpcError as exc:
+            outcomes[index] = exc
+        except HTTPException as exc:
+            # вызов не допущен к БД
+            outcomes[index] = RpcError.from_http_exception(exc)
+
+    async def run_read(index: int, method: Method) -> None:
+        async with semaphore:
+            await run(index, method)
+
+    async def run_writes() -> None:
+        for index, method in writes:
+            await run(index, method)
+
+    await asyncio.gather(run_writes(), *(run_read(index, method) for index, method in reads))
+
+
+def _respond(call: Call, outcome: Union[Any, RpcError]) -> Optional[Dict[str, Any]]:
+    if call.notification:
+        return None
+    if isinstance(outcome, RpcError):
+        return error_response(call.id, outcome)
+    return result_response(call.id, outcome)
+
+
+@rpc_router.post('/api/v1/rpc', summary='Пакет вызовов JSON-RPC', tags=['JSON-RPC'])
+@rate_limit_cost(RPC_REQUEST_COST)
+@admission_priority(None)
+async def rpc(request: Request, db: AsyncSession = Depends(get_db)) -> Response:
+    """
+    Вызов методов по спецификации JSON-RPC 2.0, по одному или пакетом до
+    «RPC_MAX_BATCH_SIZE» вызовов. Параметры передаются только по именам.
+
+    Методы: «users.orders.list», «users.orders.get», «users.shipping_cost»,
+    «users.orders.create», «restaurants.orders.list», «restaurants.orders.get»,
+    «couriers.orders.list», «couriers.orders.accept», «couriers.orders.complete».
+
+    Ошибки, на которые REST API ответил бы кодом HTTP, возвращаются с кодом -32000,
+    а код HTTP передаётся в поле «data.status».
+
+    Пакет стоит столько же токенов ограничения частоты, сколько те же запросы к
+    REST API. Если токенов не хватает на весь пакет, возвращается ответ 429,
+    и ни один вызов не выполняется.
+    """
+
+    try:
+        payload: Any = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        return ORJSONResponse(error_response(None, RpcError(PARSE_ERROR, 'Parse error')))
+
+    batch: bool = isinstance(payload, list)
+    items: List[Any] = payload if batch else [payload]
+    if not items or len(items) > RPC_MAX_BATCH_SIZE:
+        message = 'Invalid Request' if not items else f'Пакет больше {RPC_MAX_BATCH_SIZE} вызовов.'
+        return ORJSONResponse(error_response(None, RpcError(INVALID_REQUEST, message)))
+
+    calls, outcomes, reads, writes = _plan(items)
+    methods: List[Method] = [method for _, method in reads + writes]
+    rate_limit_charge(request, sum(method.cost for method in methods) - RPC_REQUEST_COST)
+
+    priority: int = WRITE_PRIORITY if writes else READ_PRIORITY
+    async with db_admitted(priority):
+        principals: Dict[str, Principal] = await _authenticate(request, db, methods)
+        # соединение возвращается в пул, объекты пользователя и курьера остаются загруженными
+        await db.commit()
+    await _run_calls(db.bind, calls, outcomes, reads, writes, principals, priority)
+
+    responses = [
+        response for response in (_respond(call, outcome) for call, outcome in zip(calls, outcomes))
+        if response is not None
+    ]
+    if not responses:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    return ORJSONResponse(responses if batch else responses[0])
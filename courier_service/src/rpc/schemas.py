@@ -0,0 +1,69 @@
+"""Pydantic models."""
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class BaseParamsPyd(BaseModel):
+    """Базовая Pydantic модель параметров метода JSON-RPC: лишние параметры — ошибка."""
+
+    model_config = ConfigDict(extra='forbid')
+
+
+class UserOrdersParamsPyd(BaseParamsPyd):
+    """Параметры метода «users.orders.list».
+
+    Fields:
+        - active: bool
+    """
+
+    active: bool = Field(False, description='Только активные заказы')
+
+
+class OrderParamsPyd(BaseParamsPyd):
+    """Параметры методов, которые работают с одним заказом.
+
+    Fields:
+        - order_id: int
+    """
+
+    order_id: int = Field(description='ID заказа')
+
+
+class RestaurantParamsPyd(BaseParamsPyd):
+    """Параметры методов, которые работают с одним рестораном.
+
+    Fields:
+        - restaurant_id: int
+    """
+
+    restaurant_id: int = Field(description='ID ресторана')
+
+
+class RestaurantOrdersParamsPyd(RestaurantParamsPyd):
+    """Параметры метода «restaurants.orders.list».
+
+    Fields:
+        - restaurant_id: int
+        - active: bool
+    """
+
+    active: bool = Field(False, description='Только активные заказы')
+
+
+class RestaurantOrderParamsPyd(RestaurantParamsPyd, OrderParamsPyd):
+    """Параметры метода «restaurants.orders.get».
+
+    Fields:
+        - restaurant_id: int
+        - order_id: int
+    """
+
+
+class CourierOrdersParamsPyd(BaseParamsPyd):
+    """Параметры метода «couriers.orders.list».
+
+    Fields:
+        - all_orders: bool
+    """
+
+    all_orders: bool = Field(False, description='Все заказы курьера, а не только активный')
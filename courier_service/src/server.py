@@ -0,0 +1,84 @@
+"""Запуск API в нескольких воркерах uvicorn.
+
+    ~$ python -m src.server
+
+Количество воркеров задаётся «SERVER_WORKERS», по умолчанию — по количеству ядер,
+доступных процессу: учитываются привязка к ядрам и квота CPU контейнера (cgroup).
+Event loop и парсер HTTP выбираются uvicorn: uvloop и httptools, если они
+установлены, иначе asyncio и h11.
+
+Каждый воркер прогревается в lifespan («src.core.warmup») и начинает принимать
+соединения только после прогрева. При остановке (SIGTERM, SIGINT) воркер перестаёт
+принимать новые соединения, ждёт завершения начатых запросов не дольше
+«SERVER_GRACEFUL_TIMEOUT» секунд, затем выполняет shutdown lifespan: фоновые задачи
+останавливаются, накопленные данные записываются в БД, пул соединений закрывается.
+
+Метрики Prometheus при нескольких воркерах собираются через файлы: если
+«PROMETHEUS_MULTIPROC_DIR» не задана, для них создаётся временная папка.
+"""
+
+import math
+import os
+import tempfile
+from typing import Optional
+
+import uvicorn
+from src.configs import (SERVER_GRACEFUL_TIMEOUT, SERVER_HOST, SERVER_PORT,
+                         SERVER_WORKERS)
+
+CGROUP_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CGROUP_V1_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    # квота CPU контейнера в ядрах, None если квоты нет
+    cpu_max: Optional[str] = _read(CGROUP_CPU_MAX)
+    if cpu_max is not None:
+        quota, period = cpu_max.split()
+        return None if quota == 'max' else int(quota) / int(period)
+
+    quota_v1: Optional[str] = _read(CGROUP_V1_QUOTA)
+    period_v1: Optional[str] = _read(CGROUP_V1_PERIOD)
+    if quota_v1 is None or period_v1 is None or int(quota_v1) <= 0:
+        return None
+    return int(quota_v1) / int(period_v1)
+
+
+def available_cpus() -> int:
+    """Количество ядер, доступных процессу, с учётом привязки к ядрам и квоты cgroup."""
+
+    cpus: int = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    limit: Optional[float] = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(cpus, 1)
+
+
+def main() -> None:
+    workers: int = SERVER_WORKERS or available_cpus()
+    if workers > 1 and 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        # воркеры наследуют окружение, поэтому папка задаётся до их запуска
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='prometheus-')
+
+    uvicorn.run(
+        'src.main:app',
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=workers,
+        loop='auto',
+        http='auto',
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,18 @@ from fastapi import HTTPException, status
 from sqlalchemy import desc, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+from src.core.single_flight import single_flight
+from src.core.tracing import traced
+from src.delivery.events import publish_order_status
 from src.delivery.models import Order
+from src.delivery.restaurant_orders import restaurant_orders
 
 from .models import User
 from .security import get_password_hash
 
 
+@traced()
 async def create_user(
         db: AsyncSession,
         password: str,
@@ -54,9 +60,13 @@ async def create_user(
     return new_user
 
 
+@traced()
+@single_flight
 async def get_user_by_phone_number(db: AsyncSession, phone_number: str) -> Optional[User]:
     """Получаем пользователя из базы данных, по полю «phone_number».
 
+    Заказы пользователя не загружаются, для них есть отдельные запросы.
+
     Args:
         - db (AsyncSession): Асинхронная сессия базы данных SQLAlchemy.
         - phone_number (str): Номер телефона пользователя, которого необходимо найти.
@@ -65,13 +75,21 @@ async def get_user_by_phone_number(db: AsyncSession, phone_number: str) -> Optio
         - Optional[User]: Объект пользователя, если найден, иначе None.
     """
 
-    user = await db.execute(select(User).filter(User.phone_number == phone_number))
+    user = await db.execute(
+        select(User).
+        filter(User.phone_number == phone_number).
+        options(raiseload(User.orders))
+    )
     return user.scalars().one_or_none()
 
 
+@traced()
 async def create_order(db: AsyncSession, user_id: int, restaurant_id: int) -> Order:
     """Создаём новый объект в таблице SQLAlchemy «Order».
 
+    В той же транзакции публикуется событие с заказом целиком,
+    по нему воркеры добавляют заказ в снимок свободных заказов.
+
     Args:
         - db (AsyncSession): Асинхронная сессия базы данных SQLAlchemy.
         - user_id (int): ID текущего пользователя.
@@ -85,17 +103,23 @@ async def create_order(db: AsyncSession, user_id: int, restaurant_id: int) -> Or
 
     try:
         db.add(new_order)
-        await db.commit()
-        await db.refresh(new_order)
+        await db.flush()
     except IntegrityError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail='Нельзя сделать заказ. Ресторан с таким ID не найден.',
         )
 
+    await db.refresh(new_order)
+    await publish_order_status(db, new_order, details=True)
+    await db.commit()
+    restaurant_orders.bump(restaurant_id)
+
     return new_order
 
 
+@traced()
+@single_flight
 async def get_active_user_orders(db: AsyncSession, current_user: User) -> Optional[List[Order]]:
     """Все активные заказы пользователя.
 
@@ -118,3 +142,24 @@ async def get_active_user_orders(db: AsyncSession, current_user: User) -> Option
         order_by(desc(Order.id))
     )
     return active_orders.scalars().all()
+
+
+@traced()
+@single_flight
+async def get_all_user_orders(db: AsyncSession, current_user: User) -> List[Order]:
+    """Все заказы пользователя.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - current_user (User): Объект пользователя.
+
+    Returns:
+        - List[Order]: Список заказов пользователя.
+    """
+
+    user_orders = await db.execute(
+        select(Order).
+        filter(Order.user_id == current_user.id).
+        order_by(desc(Order.id))
+    )
+    return user_orders.scalars().all()
@@ -1,19 +1,99 @@
-from typing import Annotated, Optional
+from functools import lru_cache
+from time import time
+from typing import Annotated, Any, Dict, Optional, Tuple
 
-from fastapi import Depends, HTTPException, status
+from fastapi import (Depends, HTTPException, Query, Request, WebSocket,
+                     WebSocketException, status)
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt
 from sqlalchemy.ext.asyncio import AsyncSession
+from src.core.rate_limit import ANONYMOUS, BUYER, COURIER, client_address
+from src.core.tracing import span, traced
 from src.database import get_db
 from src.delivery.crud import get_courier_by_phone_number
+from src.delivery.exceptions import raise_forbidden_if_not_courier
 from src.delivery.models import Courier
 
 from .crud import get_user_by_phone_number
 from .models import User
-from .security import ALGORITHM, SECRET_KEY
+from .security import ALGORITHM, COURIER_ROLE, SECRET_KEY, USER_ROLE
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
+TOKEN_CACHE_SIZE = 10_000
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail='Не удалось проверить учётные данные.',
+        headers={'WWW-Authenticate': 'Bearer'},
+    )
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def _decode_jwt(token: str) -> Dict[str, Any]:
+    from jose import jwt  # python-jose импортируется при первом использовании
+
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """Проверяем JWT-токен и получаем его содержимое.
+
+    Проверка подписи кэшируется для недавно встречавшихся токенов, поэтому частые
+    запросы одного клиента не декодируют токен заново. Срок действия токена
+    проверяется при каждом вызове.
+
+    Args:
+        - token (str): JWT-токен для аутентификации пользователя.
+
+    Returns:
+        - Dict[str, Any]: Содержимое токена, в котором точно есть поле «sub».
+    """
+
+    from jose import JWTError
+
+    try:
+        with span('jwt.decode'):
+            payload: Dict[str, Any] = _decode_jwt(token)
+    except JWTError:
+        raise _credentials_exception()
+
+    if payload.get('sub') is None or payload.get('exp', 0) <= time():
+        raise _credentials_exception()
+
+    return payload
+
+
+def rate_limit_principal(request: Request) -> Tuple[str, str]:
+    """Класс клиента и ключ его ведра для ограничения частоты запросов.
+
+    Запросы с действующим токеном считаются по роли и номеру телефона из токена,
+    поэтому клиенты за одним NAT не делят ведро. Токен проверяется той же
+    кэшированной функцией, что и в зависимостях, без запросов к БД. У ресторанов и
+    админ панели своих токенов нет, поэтому их запросы, как и все запросы без
+    действующего токена, считаются анонимными по адресу клиента.
+
+    Args:
+        - request (Request): Текущий запрос.
+
+    Returns:
+        - Tuple[str, str]: Класс клиента и номер телефона или адрес клиента.
+    """
+
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        try:
+            payload: Dict[str, Any] = decode_access_token(token)
+        except HTTPException:
+            pass
+        else:
+            # токены без поля «role» выдавались только покупателям
+            role: str = payload.get('role', USER_ROLE)
+            return (COURIER if role == COURIER_ROLE else BUYER), payload['sub']
+
+    return ANONYMOUS, client_address(request)
+
 
 async def get_current_phone_number(token: Annotated[str, Depends(oauth2_scheme)]) -> str:
     """Получаем номер телефона текущего пользователя на основе JWT-токена.
@@ -26,23 +106,10 @@ async def get_current_phone_number(token: Annotated[str, Depends(oauth2_scheme)]
                               соответствующий переданному токену.
     """
 
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail='Не удалось проверить учётные данные.',
-        headers={'WWW-Authenticate': 'Bearer'},
-    )
-
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        phone_number: Optional[str] = payload.get('sub')
-        if phone_number is None:
-            raise credentials_exception
-    except jwt.JWTError:
-        raise credentials_exception
-
-    return phone_number
+    return decode_access_token(token)['sub']
 
 
+@traced()
 async def get_current_user(
         token=Depends(oauth2_scheme),
         db: AsyncSession = Depends(get_db)
@@ -53,6 +120,7 @@ async def get_current_user(
     return await get_user_by_phone_number(db, phone_number)
 
 
+@traced()
 async def get_current_courier(
         token=Depends(oauth2_scheme),
         db: AsyncSession = Depends(get_db)
@@ -61,3 +129,70 @@ async def get_current_courier(
 
     phone_number: str = await get_current_phone_number(token)
     return await get_courier_by_phone_number(db, phone_number)
+
+
+@traced()
+async def get_current_courier_phone_number(
+        token=Depends(oauth2_scheme),
+        db: AsyncSession = Depends(get_db)
+) -> str:
+    """Получаем номер телефона текущего курьера без запроса к БД.
+
+    Роль берётся из поля «role» токена. Курьер ищется в БД только для токенов,
+    выданных до появления этого поля.
+    """
+
+    payload: Dict[str, Any] = decode_access_token(token)
+    role: Optional[str] = payload.get('role')
+
+    if role is None:
+        raise_forbidden_if_not_courier(await get_courier_by_phone_number(db, payload['sub']))
+    elif role != COURIER_ROLE:
+        raise_forbidden_if_not_courier(None)
+
+    return payload['sub']
+
+
+@traced()
+async def get_current_courier_id(token: Annotated[str, Depends(oauth2_scheme)]) -> int:
+    """Получаем ID текущего курьера из токена, без запроса к БД.
+
+    Используется для частых запросов от приложения курьера. Токены, выданные
+    до появления полей «role» и «id», не подходят: курьеру нужно получить новый токен.
+    """
+
+    payload: Dict[str, Any] = decode_access_token(token)
+    role: Optional[str] = payload.get('role')
+
+    if role is None or payload.get('id') is None:
+        raise _credentials_exception()
+    if role != COURIER_ROLE:
+        raise_forbidden_if_not_courier(None)
+
+    return payload['id']
+
+
+async def get_current_user_ws(
+        websocket: WebSocket,
+        token: Optional[str] = Query(None, description='JWT-токен пользователя'),
+        db: AsyncSession = Depends(get_db)
+) -> User:
+    """Получаем объект текущего пользователя для WebSocket-соединения.
+
+    Браузеры не позволяют передать заголовок «Authorization» при открытии WebSocket,
+    поэтому токен можно передать в параметре запроса «token».
+    """
+
+    if token is None:
+        _, _, token = websocket.headers.get('Authorization', '').partition(' ')
+
+    try:
+        phone_number: str = await get_current_phone_number(token)
+    except HTTPException:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+
+    user: Optional[User] = await get_user_by_phone_number(db, phone_number)
+    if user is None:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+
+    return user
@@ -1,27 +1,40 @@
+import asyncio
 from random import randrange
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
+from fastapi import (APIRouter, Depends, HTTPException, Path, Query, Request,
+                     Response, WebSocket, WebSocketDisconnect, status)
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from src.core.admission import WRITE_PRIORITY, admission_priority
+from src.core.etag import etag_matches, make_etag, not_modified
+from src.core.rate_limit import rate_limit_cost
+from src.core.responses import ORJSONResponse, render
 from src.database import get_db
-from src.delivery.crud import get_order_by_id, get_restaurant_by_id
+from src.delivery.crud import (get_order_by_id, get_order_version,
+                               get_restaurant_by_id)
+from src.delivery.eta import delivery_estimates
+from src.delivery.events import (HEARTBEAT_INTERVAL, order_events,
+                                 order_status_event)
 from src.delivery.models import Order, Restaurant
 from src.delivery.schemas import (BaseOrderPyd, ResponseUserCreateOrderPyd,
                                   ShippingCostPyd)
 
 from .crud import (create_order, create_user, get_active_user_orders,
-                   get_user_by_phone_number)
-from .dependencies import get_current_user
+                   get_all_user_orders, get_user_by_phone_number)
+from .dependencies import get_current_user, get_current_user_ws
 from .models import User
 from .schemas import (CreateTokenPyd, CreateUserPyd, DetailedUserOrderPyd,
                       ResponseTokenPyd, UserInfoPyd)
-from .security import create_access_token
+from .security import USER_ROLE, create_access_token
 
 user_router = APIRouter()
 
 
 @user_router.post('/api/v1/users', response_model=UserInfoPyd, status_code=201,
                   summary='Регистрация пользователя/покупателя', tags=['Пользователи'])
+@rate_limit_cost(5)
 async def register_user(user: CreateUserPyd, db: AsyncSession = Depends(get_db)) -> User:
 
     user_data = user.model_dump()
@@ -31,6 +44,7 @@ async def register_user(user: CreateUserPyd, db: AsyncSession = Depends(get_db))
 
 @user_router.post('/api/v1/users/token', response_model=ResponseTokenPyd,
                   summary='Получение токена для пользователей', tags=['Пользователи'])
+@rate_limit_cost(5)
 async def login_for_user_access_token(
     login_request: CreateTokenPyd,
     db: AsyncSession = Depends(get_db)
@@ -44,7 +58,7 @@ async def login_for_user_access_token(
             detail='Неверный номер телефона или пароль.',
         )
 
-    access_token: str = create_access_token({'sub': user.phone_number})
+    access_token: str = create_access_token({'sub': user.phone_number, 'role': USER_ROLE, 'id': user.id})
     return {'access_token': access_token, 'token_type': 'Bearer'}
 
 
@@ -54,7 +68,7 @@ async def get_user_orders(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
     active: Optional[str] = Query(None, description='Выводим только активные заказы пользователя.')
-) -> Optional[List[Order]]:
+) -> ORJSONResponse:
     """
     По умолчанию выводятся все заказы пользователя, но вы можете передать параметр запроса «active»,
     что-бы получить список только активных заказов, у которых статус заказа находится в
@@ -62,18 +76,51 @@ async def get_user_orders(
     """
 
     if active is not None:
-        return await get_active_user_orders(db, current_user)
-    return current_user.orders
+        return render(List[BaseOrderPyd], await get_active_user_orders(db, current_user))
+    return render(List[BaseOrderPyd], await get_all_user_orders(db, current_user))
+
+
+def detailed_user_order(order: Order) -> DetailedUserOrderPyd:
+    """Подробная информация о заказе пользователя с оценкой времени доставки.
+
+    Оценки должны быть уже загружены через «delivery_estimates.ensure_loaded».
+    """
+
+    order_data = DetailedUserOrderPyd.model_validate(order, from_attributes=True)
+    order_data.duration_delivery = delivery_estimates.estimate(
+        order.restaurant_id, order.start_time.hour, order.restaurant.duration_delivery
+    )
+    return order_data
 
 
 @user_router.get('/api/v1/users/orders/get/{order_id}', response_model=DetailedUserOrderPyd,
                  summary='Информация о заказе', tags=['Пользователи'])
 async def get_user_order(
     order_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
-) -> DetailedUserOrderPyd:
-    """Подробная информация об одном выбранном заказе пользователя."""
+) -> Response:
+    """
+    Подробная информация об одном выбранном заказе пользователя.
+
+    Время доставки — оценка по уже доставленным заказам ресторана в тот же час.
+
+    Ответ содержит заголовок «ETag». Если передать его в заголовке «If-None-Match»
+    и заказ с тех пор не менялся, вернётся ответ 304 без тела.
+    """
+
+    await delivery_estimates.ensure_loaded(db)
+
+    if_none_match: Optional[str] = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        order_version: Optional[Row] = await get_order_version(db, order_id)
+        if order_version is not None and order_version.user_id == current_user.id:
+            hour: int = order_version.start_time.hour
+            revision: int = delivery_estimates.revision(order_version.restaurant_id, hour)
+            etag = make_etag(order_id, order_version.version, revision)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
 
     user_order: Optional[Order] = await get_order_by_id(db, order_id)
 
@@ -83,18 +130,92 @@ async def get_user_order(
             detail='В вашем списке заказов нет заказа с таким значением «order_id».',
         )
 
-    courier = user_order.courier
-    courier_name: Optional[str] = user_order.courier.__dict__.get('name') if courier else None
-
-    return DetailedUserOrderPyd(
-        id=user_order.id,
-        status=user_order.status,
-        restaurant_name=user_order.restaurant.__dict__.get('name'),
-        start_time=user_order.start_time,
-        end_time=user_order.end_time,
-        courier_name=courier_name,
-        duration_delivery=user_order.restaurant.__dict__.get('duration_delivery'),
-    )
+    revision = delivery_estimates.revision(user_order.restaurant_id, user_order.start_time.hour)
+    order_data: DetailedUserOrderPyd = detailed_user_order(user_order)
+
+    etag = make_etag(user_order.id, user_order.version, revision)
+    return render(DetailedUserOrderPyd, order_data, headers={'ETag': etag})
+
+
+@user_router.get('/api/v1/users/orders/stream', response_class=StreamingResponse,
+                 summary='Статусы заказов (SSE)', tags=['Пользователи'])
+@admission_priority(None)
+async def stream_user_orders(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> StreamingResponse:
+    """
+    Поток событий Server-Sent Events со статусами заказов пользователя.
+
+    Сразу после подключения приходят текущие статусы активных заказов, затем
+    события о каждой смене статуса. Каждое событие содержит поле «event»:
+    «order_status» со статусом и версией заказа, или «resync», если часть событий
+    могла потеряться и заказы нужно перезапросить.
+    """
+
+    user_id: int = current_user.id
+
+    async def event_stream() -> AsyncIterator[str]:
+        async with order_events.subscribe(user_id) as queue:
+            for order in await get_active_user_orders(db, current_user):
+                yield f'data: {order_status_event(order)}\n\n'
+
+            # соединение с БД не нужно держать всё время подписки
+            await db.close()
+
+            while True:
+                try:
+                    payload: str = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                yield f'data: {payload}\n\n'
+
+    return StreamingResponse(event_stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@user_router.websocket('/api/v1/users/orders/ws')
+async def websocket_user_orders(
+    websocket: WebSocket,
+    current_user: User = Depends(get_current_user_ws),
+    db: AsyncSession = Depends(get_db),
+) -> None:
+    """
+    Статусы заказов пользователя через WebSocket.
+
+    Токен передаётся в параметре запроса «token» или в заголовке «Authorization».
+    Сообщения такие же, как в потоке «/api/v1/users/orders/stream».
+    """
+
+    user_id: int = current_user.id
+    await websocket.accept()
+
+    async with order_events.subscribe(user_id) as queue:
+        for order in await get_active_user_orders(db, current_user):
+            await websocket.send_text(order_status_event(order))
+        await db.close()
+
+        sender: asyncio.Task = asyncio.create_task(_send_order_events(websocket, queue))
+        try:
+            # входящие сообщения не нужны, ждём только отключения клиента
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+
+
+async def _send_order_events(websocket: WebSocket, queue: asyncio.Queue) -> None:
+    """Отправляем события из очереди подписки в WebSocket, с периодическим ping."""
+
+    while True:
+        try:
+            payload: str = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+        except asyncio.TimeoutError:
+            payload = '{"event":"ping"}'
+        await websocket.send_text(payload)
 
 
 @user_router.get('/api/v1/users/shipping_cost/{restaurant_id}', response_model=ShippingCostPyd,
@@ -122,14 +243,23 @@ async def shipping_cost(
 
 @user_router.post('/api/v1/users/orders/post/{restaurant_id}', response_model=ResponseUserCreateOrderPyd,
                   summary='Сделать заказ', tags=['Пользователи'], status_code=201)
+@rate_limit_cost(3)
+@admission_priority(WRITE_PRIORITY)
 async def new_order(
     restaurant_id: int = Path(..., description='ID ресторана'),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
-) -> ResponseUserCreateOrderPyd:
+) -> ORJSONResponse:
     """Сделать заказ из выбранного ресторана."""
 
     order_info: Order = await create_order(db, current_user.id, restaurant_id)
     shipping_cost_value: Dict[str, int] = await shipping_cost(restaurant_id, current_user, db)
 
-    return ResponseUserCreateOrderPyd.model_validate({**order_info.__dict__, **shipping_cost_value})
+    order_data = ResponseUserCreateOrderPyd(
+        id=order_info.id,
+        status=order_info.status,
+        start_time=order_info.start_time,
+        restaurant_id=order_info.restaurant_id,
+        **shipping_cost_value
+    )
+    return render(ResponseUserCreateOrderPyd, order_data, status_code=status.HTTP_201_CREATED)
@@ -3,7 +3,7 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel, Field
+from pydantic import AliasPath, BaseModel, ConfigDict, Field
 
 
 class CreateTokenPyd(BaseModel):
@@ -98,11 +98,27 @@ class DetailedUserOrderPyd(BaseModel):
         - end_time: Optional[datetime]
         - courier_name: Optional[str]
         - duration_delivery: int
+
+    Поля «restaurant_name», «courier_name» и «duration_delivery» заполняются
+    из связанных объектов заказа при валидации ORM-объекта «Order». Затем
+    «duration_delivery» заменяется оценкой по доставленным заказам ресторана.
     """
+
+    model_config = ConfigDict(populate_by_name=True)
+
     id: int = Field(description='ID заказа в БД')
     status: str = Field(description='Статус заказа')
-    restaurant_name: str = Field(description='Название ресторана, из которого сделан заказ')
+    restaurant_name: str = Field(
+        description='Название ресторана, из которого сделан заказ',
+        validation_alias=AliasPath('restaurant', 'name')
+    )
     start_time: datetime = Field(description='Время создания заказа')
     end_time: Optional[datetime] = Field(None, description='Время завершения доставки')
-    courier_name: Optional[str] = Field(None, description='Имя курьера')
-    duration_delivery: int = Field(description='Примерное время доставки заказа/в минутах')
+    courier_name: Optional[str] = Field(
+        None, description='Имя курьера',
+        validation_alias=AliasPath('courier', 'name')
+    )
+    duration_delivery: int = Field(
+        description='Ожидаемое время доставки заказа/в минутах',
+        validation_alias=AliasPath('restaurant', 'duration_delivery')
+    )
@@ -1,26 +1,53 @@
 from datetime import datetime, timedelta
-from typing import Dict
+from functools import lru_cache
+from typing import Any, Dict
 
-from jose import jwt
-from passlib.context import CryptContext
 from src.configs import SECRET_KEY
+from src.core.metrics import PASSWORD_HASH_DURATION
+from src.core.tracing import traced
 
 ALGORITHM = 'HS256'
 SECRET_KEY = SECRET_KEY
 ACCESS_TOKEN_EXPIRE_MINUTES = 240
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+USER_ROLE = 'user'
+COURIER_ROLE = 'courier'
 
 
+@lru_cache(maxsize=None)
+def pwd_context() -> Any:
+    """Контекст passlib для bcrypt.
+
+    passlib и python-jose импортируются при первом использовании, а не при запуске
+    приложения, чтобы воркеры и тесты запускались быстрее.
+    """
+
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=['bcrypt'], deprecated='auto')
+
+
+@traced('bcrypt.hash')
 def get_password_hash(password: str) -> str:
     """Создаём хэш пароля."""
 
-    return pwd_context.hash(password)
+    with PASSWORD_HASH_DURATION.labels('hash').time():
+        return pwd_context().hash(password)
 
 
-def create_access_token(data: Dict[str, str]) -> str:
+@traced('bcrypt.verify')
+def verify_password(password: str, hashed_password: str) -> bool:
+    """Проверяем пароль по хэшу."""
+
+    with PASSWORD_HASH_DURATION.labels('verify').time():
+        return pwd_context().verify(password, hashed_password)
+
+
+def create_access_token(data: Dict[str, Any]) -> str:
     """Создаём JWT-токен."""
 
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({'exp': expire})
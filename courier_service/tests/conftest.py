@@ -8,8 +8,14 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 from src.configs import (DB_HOST_TEST, DB_NAME, DB_PORT, POSTGRES_PASSWORD,
                          POSTGRES_USER)
+from src.core.metrics import instrument_engine
+from src.core.rate_limit import Bucket
+from src.core.slow_queries import slow_query_log
 from src.database import Base, get_db
-from src.main import app
+from src.delivery.eta import delivery_estimates
+from src.delivery.events import order_events
+from src.delivery.locations import courier_locations
+from src.main import app, limiter
 
 DATABASE_URL_TEST = (
     f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{DB_HOST_TEST}:{DB_PORT}/{DB_NAME}'
@@ -26,13 +32,27 @@ async def override_get_db() -> AsyncGenerator[AsyncSession, None]:
 
 
 app.dependency_overrides[get_db] = override_get_db
+instrument_engine(engine_test)
+order_events.url = engine_test.url
+courier_locations.engine = engine_test
+delivery_estimates.engine = engine_test
+slow_query_log.engine = engine_test
 
 
 @pytest.fixture(autouse=True, scope='session')
 async def prepare_database():
+    # счётчики ограничения частоты общие для процессов и переживают прошлый запуск тестов
+    limiter.reset()
+    # все тесты приходят с одного адреса и получают десятки токенов за несколько секунд
+    for principal_class in limiter.buckets:
+        limiter.buckets[principal_class] = Bucket(capacity=10_000, refill_rate=1_000)
     async with engine_test.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     yield
+    await courier_locations.close()
+    await delivery_estimates.close()
+    await order_events.close()
+    await slow_query_log.close()
     async with engine_test.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
 
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from src.core.admission import (EVICTED, QUEUE_FULL, READ_PRIORITY, TIMEOUT,
+                                WRITE_PRIORITY, AdmissionController,
+                                Overloaded)
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_admission_write_priority():
+    """Тестируем очередь допуска: запись получает место раньше чтения и вытесняет его из полной очереди."""
+
+    admission = AdmissionController(limit=1, queue_size=2, timeout=1)
+    admitted = []
+
+    async def request(name, priority):
+        await admission.acquire(priority)
+        admitted.append(name)
+
+    await admission.acquire(READ_PRIORITY)
+    first_read = asyncio.create_task(request('first read', READ_PRIORITY))
+    second_read = asyncio.create_task(request('second read', READ_PRIORITY))
+    await asyncio.sleep(0)
+    write = asyncio.create_task(request('write', WRITE_PRIORITY))
+    await asyncio.sleep(0)
+
+    with pytest.raises(Overloaded) as error:
+        await second_read
+    assert error.value.reason == EVICTED
+    with pytest.raises(Overloaded) as error:
+        await admission.acquire(READ_PRIORITY)
+    assert error.value.reason == QUEUE_FULL
+
+    admission.release()
+    await write
+    admission.release()
+    await first_read
+    admission.release()
+
+    assert admitted == ['write', 'first read']
+    assert (admission.active, admission.queued) == (0, 0)
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_admission_timeout():
+    """Тестируем очередь допуска: запрос не ждёт дольше «timeout» и не занимает место после отказа."""
+
+    admission = AdmissionController(limit=1, queue_size=10, timeout=0.01)
+    await admission.acquire(READ_PRIORITY)
+
+    with pytest.raises(Overloaded) as error:
+        await admission.acquire(WRITE_PRIORITY)
+    assert error.value.reason == TIMEOUT
+
+    admission.release()
+    assert (admission.active, admission.queued) == (0, 0)
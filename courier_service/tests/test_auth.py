@@ -3,6 +3,7 @@ from datetime import datetime
 import pytest
 from httpx import AsyncClient
 from sqlalchemy import insert, select
+from src.core.profiler import assert_max_queries
 from src.delivery.models import Order, Restaurant
 
 from .conftest import async_session_maker
@@ -12,14 +13,15 @@ from .conftest import async_session_maker
 async def test_register_user(async_client: AsyncClient):
     """Тестируем роутер для регистрации пользователей."""
 
-    response = await async_client.post('/api/v1/users', json={
-        "street": "Ленина",
-        "house_number": "string",
-        "phone_number": "+79999999999",
-        "name": "string",
-        "surname": "string",
-        "password": "string"
-    })
+    with assert_max_queries(3):
+        response = await async_client.post('/api/v1/users', json={
+            "street": "Ленина",
+            "house_number": "string",
+            "phone_number": "+79999999999",
+            "name": "string",
+            "surname": "string",
+            "password": "string"
+        })
 
     assert response.status_code == 201
     assert response.json() == {
@@ -51,10 +53,11 @@ async def test_error_register_user(async_client: AsyncClient):
 async def test_login_for_user_access_token(async_client: AsyncClient):
     """Тестируем роутер для авторизации пользователей. Возвращаем токен тестового пользователя."""
 
-    response = await async_client.post('/api/v1/users/token', json={
-        "phone_number": "+79999999999",
-        "password": "string"
-    })
+    with assert_max_queries(1):
+        response = await async_client.post('/api/v1/users/token', json={
+            "phone_number": "+79999999999",
+            "password": "string"
+        })
 
     assert response.status_code == 200
 
@@ -80,12 +83,13 @@ async def test_error_login_for_user_access_token(async_client: AsyncClient):
 async def test_register_couriers(async_client: AsyncClient):
     """Тестируем роутер для регистрации курьеров."""
 
-    response = await async_client.post('/api/v1/couriers', json={
-        "phone_number": "+79999999992",
-        "name": "string",
-        "surname": "string",
-        "password": "string"
-    })
+    with assert_max_queries(3):
+        response = await async_client.post('/api/v1/couriers', json={
+            "phone_number": "+79999999992",
+            "name": "string",
+            "surname": "string",
+            "password": "string"
+        })
 
     assert response.status_code == 201
     assert response.json() == {
@@ -115,10 +119,11 @@ async def test_error_register_couriers(async_client: AsyncClient):
 async def test_login_for_courier_access_token(async_client: AsyncClient):
     """Тестируем роутер для авторизации курьеров. Возвращаем токен тестового курьера."""
 
-    response = await async_client.post('/api/v1/couriers/token', json={
-        "phone_number": "+79999999992",
-        "password": "string"
-    })
+    with assert_max_queries(1):
+        response = await async_client.post('/api/v1/couriers/token', json={
+            "phone_number": "+79999999992",
+            "password": "string"
+        })
 
     assert response.status_code == 200
 
@@ -0,0 +1,40 @@
+import orjson
+import pytest
+from httpx import AsyncClient
+from src.core.capture import traffic_capture
+from src.users.security import COURIER_ROLE, create_access_token
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_capture_traffic(async_client: AsyncClient, monkeypatch: pytest.MonkeyPatch, tmp_path):
+    """Тестируем запись запросов к API в файл без персональных данных."""
+
+    path = tmp_path / 'capture.jsonl'
+    monkeypatch.setattr(traffic_capture, 'path', str(path))
+    token = create_access_token({'sub': '+79990000000', 'role': COURIER_ROLE, 'id': 1})
+
+    response = await async_client.post('/api/v1/couriers/location',
+                                       json={'latitude': 100.0, 'longitude': 60.6, 'comment': 'secret'},
+                                       headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 422
+
+    response = await async_client.get('/api/v1/users/orders/get',
+                                      params={'active': 'true', 'phone': 'secret'},
+                                      headers={'Authorization': 'Bearer not-a-token'})
+
+    assert response.status_code == 401
+
+    await async_client.get('/metrics')
+    traffic_capture.close()
+    location, orders = [orjson.loads(line) for line in path.read_bytes().splitlines()]
+
+    assert b'secret' not in path.read_bytes()
+    assert location['route'] == '/api/v1/couriers/location'
+    assert location['role'] == COURIER_ROLE
+    assert location['body'] == {'latitude': 'float', 'longitude': 'float', 'comment': 'str'}
+    assert location['status'] == 422
+    assert orders['query'] == {'active': 'true', 'phone': 'str'}
+    assert orders['role'] == 'unknown'
+    assert orders['body'] is None
+    assert orders['status'] == 401
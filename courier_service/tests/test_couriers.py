@@ -1,5 +1,13 @@
+import asyncio
+
+import msgpack
+import orjson
 import pytest
 from httpx import AsyncClient
+from src.core.profiler import assert_max_queries
+from src.delivery.events import order_events
+from src.delivery.locations import courier_locations
+from src.users.security import COURIER_ROLE, create_access_token
 
 from .test_auth import test_login_for_courier_access_token
 
@@ -9,10 +17,36 @@ async def test_available_couriers_orders(async_client: AsyncClient):
     """Тестируем роутер для получения списка свободных заказов для курьеров."""
 
     token = await test_login_for_courier_access_token(async_client)
+    with assert_max_queries(3):
+        response = await async_client.get('/api/v1/couriers/available_orders',
+                                          headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_available_couriers_orders_compact_formats(async_client: AsyncClient):
+    """Тестируем нормализованный ответ и формат MessagePack для списка свободных заказов."""
+
+    token = await test_login_for_courier_access_token(async_client)
+    headers = {'Authorization': f'Bearer {token}'}
+    normalized = 'application/vnd.courier.normalized+json'
     response = await async_client.get('/api/v1/couriers/available_orders',
-                                      headers={'Authorization': f'Bearer {token}'})
+                                      headers={**headers, 'Accept': normalized})
 
     assert response.status_code == 200
+    assert response.headers['Content-Type'] == normalized
+
+    data = response.json()
+    assert [order['restaurant_id'] for order in data['orders']] == [7]
+    assert data['restaurants']['7']['name'] == 'Burgers'
+    assert list(data['users']) == ['1']
+
+    response = await async_client.get('/api/v1/couriers/available_orders',
+                                      headers={**headers, 'Accept': 'application/msgpack'})
+
+    assert response.status_code == 200
+    assert msgpack.unpackb(response.content)[0]['restaurant']['name'] == 'Burgers'
 
 
 @pytest.mark.asyncio(scope='session')
@@ -20,8 +54,9 @@ async def test_courier_orders(async_client: AsyncClient):
     """Тестируем роутер для получения всех заказов курьера."""
 
     token = await test_login_for_courier_access_token(async_client)
-    response = await async_client.get('/api/v1/couriers/orders',
-                                      headers={'Authorization': f'Bearer {token}'})
+    with assert_max_queries(2):
+        response = await async_client.get('/api/v1/couriers/orders',
+                                          headers={'Authorization': f'Bearer {token}'})
 
     assert response.status_code == 200
 
@@ -50,13 +85,35 @@ async def test_error_courier_accepts_order(async_client: AsyncClient):
 
 @pytest.mark.asyncio(scope='session')
 async def test_courier_accepts_order(async_client: AsyncClient):
-    """Тестируем роутер для взятия заказа в работу."""
+    """Тестируем роутер для взятия заказа в работу и событие о смене статуса заказа."""
 
     token = await test_login_for_courier_access_token(async_client)
-    response = await async_client.post('/api/v1/couriers/orders/7',
-                                       headers={'Authorization': f'Bearer {token}'})
 
-    assert response.status_code == 204
+    async with order_events.subscribe(user_id=1) as queue:
+        with assert_max_queries(13):
+            response = await async_client.post('/api/v1/couriers/orders/7',
+                                               headers={'Authorization': f'Bearer {token}'})
+
+        assert response.status_code == 204
+
+        event = orjson.loads(await asyncio.wait_for(queue.get(), timeout=5))
+        assert event['order_id'] == 7
+        assert event['status'] == 'В пути'
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_courier_route(async_client: AsyncClient):
+    """Тестируем маршрут курьера: заказ сначала забирается в ресторане, потом доставляется."""
+
+    token = create_access_token({'sub': '+79999999992', 'role': COURIER_ROLE, 'id': 1})
+    with assert_max_queries(5):
+        response = await async_client.get('/api/v1/couriers/route',
+                                          headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 200
+    route = response.json()
+    assert [(stop['order_id'], stop['action']) for stop in route] == [(7, 'pickup'), (7, 'drop_off')]
+    assert route[0]['street'] == 'Ватутина'
 
 
 @pytest.mark.asyncio(scope='session')
@@ -64,7 +121,46 @@ async def test_courier_completes_order(async_client: AsyncClient):
     """Тестируем роутер для завершения заказа."""
 
     token = await test_login_for_courier_access_token(async_client)
-    response = await async_client.put('/api/v1/couriers/orders/7',
-                                      headers={'Authorization': f'Bearer {token}'})
+    with assert_max_queries(14):
+        response = await async_client.put('/api/v1/couriers/orders/7',
+                                          headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 204
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_courier_orders_not_modified(async_client: AsyncClient):
+    """Тестируем ответ 304 на условный запрос списка заказов курьера."""
+
+    token = await test_login_for_courier_access_token(async_client)
+    headers = {'Authorization': f'Bearer {token}'}
+    response = await async_client.get('/api/v1/couriers/orders?all_orders=1', headers=headers)
+
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = await async_client.get('/api/v1/couriers/orders?all_orders=1',
+                                      headers={**headers, 'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.content == b''
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_update_courier_location(async_client: AsyncClient):
+    """Тестируем отправку геопозиции курьера и поиск ближайших к ресторану курьеров."""
+
+    token = create_access_token({'sub': '+79999999992', 'role': COURIER_ROLE, 'id': 1})
+    with assert_max_queries(0):
+        response = await async_client.post('/api/v1/couriers/location',
+                                           json={'latitude': 57.153, 'longitude': 65.534},
+                                           headers={'Authorization': f'Bearer {token}'})
 
     assert response.status_code == 204
+
+    with assert_max_queries(1):
+        response = await async_client.get('/api/v1/restaurants/7/nearest_couriers')
+
+    assert response.status_code == 200
+    assert [courier['courier_id'] for courier in response.json()] == [1]
+    assert await courier_locations.flush() == 1
@@ -0,0 +1,23 @@
+import pytest
+from httpx import AsyncClient
+from prometheus_client.parser import text_string_to_metric_families
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_metrics(async_client: AsyncClient):
+    """Тестируем метрики запросов, запросов к БД и bcrypt по маршрутам."""
+
+    response = await async_client.get('/metrics')
+
+    assert response.status_code == 200
+
+    samples = {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+    route = '/api/v1/couriers/orders/{order_id}'
+
+    assert samples[('http_requests_total', (('method', 'POST'), ('route', route), ('status', '204')))] >= 1
+    assert samples[('db_queries_total', (('route', route),))] >= 1
+    assert samples[('password_hash_duration_seconds_count', (('operation', 'verify'),))] >= 1
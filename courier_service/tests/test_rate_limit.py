@@ -0,0 +1,114 @@
+import fcntl
+import os
+
+import pytest
+from httpx import AsyncClient
+from src.core import rate_limit
+from src.core.rate_limit import (ANONYMOUS, BUYER, COURIER, Bucket,
+                                 TokenBucketLimiter)
+from src.main import limiter
+from src.users.dependencies import rate_limit_principal
+from src.users.security import COURIER_ROLE, create_access_token
+from starlette.requests import Request
+
+
+def test_token_bucket_shared_between_workers(tmp_path):
+    """Тестируем ведро токенов: оно общее для лимитеров на одном файле, как у разных воркеров."""
+
+    path = str(tmp_path / 'rate-limit')
+    buckets = {ANONYMOUS: Bucket(capacity=5, refill_rate=0.01)}
+    first = TokenBucketLimiter(buckets, rate_limit_principal, path, slots=64)
+    second = TokenBucketLimiter(buckets, rate_limit_principal, path, slots=64)
+
+    assert first.hit(ANONYMOUS, 'client', 2).remaining == 3
+    assert second.hit(ANONYMOUS, 'client', 2).remaining == 1
+
+    decision = first.hit(ANONYMOUS, 'client', 2)
+    assert not decision.allowed
+    assert decision.remaining == 1
+    assert 99 < decision.retry_after <= 100
+
+    assert second.hit(ANONYMOUS, 'client', 1).allowed
+    assert first.hit(ANONYMOUS, 'other client', 5).allowed
+
+    second.reset()
+
+    assert first.hit(ANONYMOUS, 'client', 5).allowed
+
+
+def test_token_bucket_storage(tmp_path):
+    """Тестируем файл счётчиков: своё имя для другого количества ячеек и пропуск запроса, если файл занят."""
+
+    path = str(tmp_path / 'rate-limit')
+    buckets = {ANONYMOUS: Bucket(capacity=5, refill_rate=0.01)}
+    limiter = TokenBucketLimiter(buckets, rate_limit_principal, path, slots=64)
+    other = TokenBucketLimiter(buckets, rate_limit_principal, path, slots=128)
+
+    assert limiter.hit(ANONYMOUS, 'client', 5).allowed
+    assert other.hit(ANONYMOUS, 'client', 5).allowed
+    assert not limiter.hit(ANONYMOUS, 'client', 1).allowed
+
+    # другой воркер держит блокировку
+    fd = os.open(limiter.storage.path, os.O_RDWR)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        assert limiter.hit(ANONYMOUS, 'client', 1).allowed
+    finally:
+        os.close(fd)
+
+    assert not limiter.hit(ANONYMOUS, 'client', 1).allowed
+
+
+def test_rate_limit_principal(monkeypatch):
+    """Тестируем класс клиента: владелец действующего токена или аноним по адресу на любом пути."""
+
+    def request(headers, path='/api/v1/users/orders/get'):
+        return Request({'type': 'http', 'path': path, 'headers': [(key.lower().encode(), value.encode())
+                                                                  for key, value in headers.items()],
+                        'client': ('172.18.0.5', 50000)})
+
+    courier_phone, buyer_phone = '+79990000000', '+79990000001'
+    token = create_access_token({'sub': courier_phone, 'role': COURIER_ROLE, 'id': 1})
+    legacy_token = create_access_token({'sub': buyer_phone})
+
+    assert rate_limit_principal(request({'Authorization': f'Bearer {token}'})) == (COURIER, courier_phone)
+    assert rate_limit_principal(request({'Authorization': f'Bearer {legacy_token}'})) == (BUYER, buyer_phone)
+    # заголовку с адресом клиента верим только от nginx
+    assert rate_limit_principal(
+        request({'Authorization': 'Bearer -', 'X-Real-IP': '203.0.113.7'})
+    ) == (ANONYMOUS, '172.18.0.5')
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_REAL_IP_HEADER', 'X-Real-IP')
+    monkeypatch.setattr(rate_limit, 'TRUSTED_PROXIES', rate_limit._trusted_proxies('172.16.0.0/12'))
+    assert rate_limit_principal(
+        request({'Authorization': 'Bearer -', 'X-Real-IP': '203.0.113.7'})
+    ) == (ANONYMOUS, '203.0.113.7')
+    # путь не даёт другого ведра: у ресторанов нет своих токенов
+    assert rate_limit_principal(request({}, '/api/v1/restaurants/1/orders')) == (ANONYMOUS, '172.18.0.5')
+    assert rate_limit_principal(request({}, '/admin')) == (ANONYMOUS, '172.18.0.5')
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_rate_limit_headers(async_client: AsyncClient, monkeypatch):
+    """Тестируем заголовки «RateLimit-*» и ответ 429, когда токенов не хватает на дорогой маршрут."""
+
+    monkeypatch.setitem(limiter.buckets, ANONYMOUS, Bucket(capacity=6, refill_rate=0.01))
+    monkeypatch.setattr(limiter, 'principal', lambda request: (ANONYMOUS, 'test_rate_limit_headers'))
+    login = {'phone_number': '+79990000099', 'password': 'password'}
+
+    response = await async_client.get('/api/v1/users/orders/get')
+    assert response.status_code == 401
+    assert response.headers['RateLimit-Limit'] == '6'
+    assert response.headers['RateLimit-Remaining'] == '5'
+    assert response.headers['RateLimit-Policy'] == '6;w=600'
+
+    response = await async_client.post('/api/v1/users/token', json=login)
+    assert response.status_code == 401
+    assert response.headers['RateLimit-Remaining'] == '0'
+
+    response = await async_client.post('/api/v1/users/token', json=login)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+    # геопозиция курьера не ограничивается
+    response = await async_client.post('/api/v1/couriers/location', json={'latitude': 0, 'longitude': 0})
+    assert 'RateLimit-Limit' not in response.headers
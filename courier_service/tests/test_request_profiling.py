@@ -0,0 +1,37 @@
+import pytest
+from httpx import AsyncClient
+from src.core import request_profiling
+from src.core.request_profiling import profile_store
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_profile_request(async_client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    """Тестируем профилирование запроса с заголовком «X-Profile-Token» и просмотр отчёта."""
+
+    monkeypatch.setattr(request_profiling, 'PROFILE_TOKEN', 'secret')
+
+    response = await async_client.get('/api/v1/restaurants/7/nearest_couriers',
+                                      headers={'X-Profile-Token': 'wrong'})
+
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+
+    response = await async_client.get('/api/v1/restaurants/7/orders', headers={'X-Profile-Token': 'secret'})
+
+    assert response.status_code == 200
+
+    profile = profile_store.find(response.headers['X-Profile-Id'])
+
+    assert profile['name'] == 'GET /api/v1/restaurants/7/orders'
+    assert profile['allocations']
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in profile['folded'].splitlines())
+
+    response = await async_client.get('/admin/profiles', params={'profile_id': profile['id']})
+
+    assert response.status_code == 200
+    assert 'GET /api/v1/restaurants/7/orders' in response.text
+
+    response = await async_client.get('/admin/profiles/folded', params={'profile_id': profile['id']})
+
+    assert response.status_code == 200
+    assert response.text == profile['folded']
@@ -1,20 +1,24 @@
 import pytest
 from httpx import AsyncClient
+from src.core import profiler
+from src.core.profiler import assert_max_queries
+from src.delivery.restaurant_orders import restaurant_orders
 
 
 @pytest.mark.asyncio(scope='session')
 async def test_create_restaurant(async_client: AsyncClient):
     """Тестируем роутер для регистрации нового ресторана."""
 
-    response = await async_client.post('/api/v1/restaurants', json={
-        "city": "Тюмень",
-        "street": "Ленина",
-        "house_number": "string",
-        "name": "Pizza",
-        "opening_time": "07:15:22",
-        "closing_time": "23:15:22",
-        "duration_delivery": 30
-    })
+    with assert_max_queries(3):
+        response = await async_client.post('/api/v1/restaurants', json={
+            "city": "Тюмень",
+            "street": "Ленина",
+            "house_number": "string",
+            "name": "Pizza",
+            "opening_time": "07:15:22",
+            "closing_time": "23:15:22",
+            "duration_delivery": 30
+        })
 
     assert response.status_code == 201
     assert response.json() == {
@@ -45,9 +49,47 @@ async def test_error_create_restaurant(async_client: AsyncClient):
 async def test_get_restaurant_orders(async_client: AsyncClient):
     """Тестируем роутер для получения всех заказов ресторана."""
 
+    with assert_max_queries(4):
+        response = await async_client.get('/api/v1/restaurants/7/orders')
+
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_restaurant_orders_cache(async_client: AsyncClient):
+    """Тестируем кэш списка заказов ресторана: повторный запрос без БД, после изменения — снова из БД."""
+
+    msgpack = {'Accept': 'application/msgpack'}
+
+    response = await async_client.get('/api/v1/restaurants/7/orders', headers=msgpack)
+
+    with assert_max_queries(0):
+        cached = await async_client.get('/api/v1/restaurants/7/orders', headers=msgpack)
+
+    assert cached.content == response.content
+    assert cached.headers['Content-Type'] == 'application/msgpack'
+
+    restaurant_orders._on_event({'event': 'order_status', 'restaurant_id': 7})
+
+    with assert_max_queries(4) as profile:
+        await async_client.get('/api/v1/restaurants/7/orders', headers=msgpack)
+
+    assert profile.count > 0
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_query_profile_header(async_client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    """Тестируем заголовок с профилем запросов к БД в режиме отладки."""
+
+    monkeypatch.setattr(profiler, 'DEBUG', True)
+    # ответ из кэша не обращается к БД
+    restaurant_orders.bump(7)
+
     response = await async_client.get('/api/v1/restaurants/7/orders')
 
     assert response.status_code == 200
+    assert response.headers['X-Query-Profile'].startswith('count=4, duration_ms=')
+    assert response.headers['X-Query-Profile'].endswith(', n_plus_one=0')
 
 
 @pytest.mark.asyncio(scope='session')
@@ -64,7 +106,8 @@ async def test_error_get_restaurant_orders(async_client: AsyncClient):
 async def test_get_restaurant_order(async_client: AsyncClient):
     """Тестируем роутер для получения подробной информации о заказе для ресторана."""
 
-    response = await async_client.get('/api/v1/restaurants/7/orders/7')
+    with assert_max_queries(4):
+        response = await async_client.get('/api/v1/restaurants/7/orders/7')
 
     assert response.status_code == 200
 
@@ -77,3 +120,21 @@ async def test_error_get_restaurant_order(async_client: AsyncClient):
 
     assert response.status_code == 404
     assert response.json() == {'detail': 'Заказ с такими значениями «restaurant_id» и «order_id» не найден.'}
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_get_restaurant_order_not_modified(async_client: AsyncClient):
+    """Тестируем ответ 304 на условный запрос заказа ресторана, который не менялся."""
+
+    response = await async_client.get('/api/v1/restaurants/7/orders/7')
+    etag = response.headers['ETag']
+
+    with assert_max_queries(1):
+        response = await async_client.get('/api/v1/restaurants/7/orders/7', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+    response = await async_client.get('/api/v1/restaurants/7/orders/7', headers={'If-None-Match': 'W/"old"'})
+
+    assert response.status_code == 200
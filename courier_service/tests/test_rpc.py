@@ -0,0 +1,148 @@
+from datetime import datetime
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import insert, select
+from src.core.admission import READ_PRIORITY, WRITE_PRIORITY
+from src.core.rate_limit import ANONYMOUS, Bucket
+from src.database import db_admission
+from src.delivery.models import Courier, Order
+from src.main import limiter
+
+from .conftest import async_session_maker
+from .test_auth import (test_login_for_courier_access_token,
+                        test_login_for_user_access_token)
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_rpc_batch(async_client: AsyncClient):
+    """Тестируем пакет вызовов JSON-RPC: ответы по ID вызовов, ошибки отдельных вызовов и уведомления."""
+
+    token = await test_login_for_user_access_token(async_client)
+    expected_orders = (await async_client.get('/api/v1/restaurants/1/orders')).json()
+
+    response = await async_client.post('/api/v1/rpc', headers={'Authorization': f'Bearer {token}'}, json=[
+        {'jsonrpc': '2.0', 'method': 'restaurants.orders.list', 'params': {'restaurant_id': 1}, 'id': 1},
+        {'jsonrpc': '2.0', 'method': 'users.orders.list', 'id': 2},
+        {'jsonrpc': '2.0', 'method': 'users.shipping_cost', 'params': {'restaurant_id': 1}, 'id': 3},
+        {'jsonrpc': '2.0', 'method': 'users.shipping_cost', 'params': {'restaurant_id': 17}, 'id': 4},
+        {'jsonrpc': '2.0', 'method': 'restaurants.orders.get', 'params': {'order_id': 'x'}, 'id': 5},
+        {'jsonrpc': '2.0', 'method': 'restaurants.delete', 'id': 6},
+        {'jsonrpc': '2.0', 'method': 'users.orders.list'},
+    ])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [item['id'] for item in body] == [1, 2, 3, 4, 5, 6]
+    assert body[0]['result'] == expected_orders
+    assert isinstance(body[1]['result'], list)
+    assert body[2]['result'] == {'shipping_cost': 50}
+    assert body[3]['error'] == {
+        'code': -32000, 'message': 'Ресторан с таким ID не найден.', 'data': {'status': 404}
+    }
+    assert body[4]['error']['code'] == -32602
+    assert body[5]['error'] == {'code': -32601, 'message': 'Method not found'}
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_error_rpc(async_client: AsyncClient):
+    """Тестируем ошибки JSON-RPC: некорректный JSON и вызов метода пользователя без авторизации."""
+
+    response = await async_client.post('/api/v1/rpc', content=b'{"jsonrpc": "2.0"')
+
+    assert response.json() == {
+        'jsonrpc': '2.0', 'error': {'code': -32700, 'message': 'Parse error'}, 'id': None
+    }
+
+    response = await async_client.post('/api/v1/rpc', json={
+        'jsonrpc': '2.0', 'method': 'users.orders.list', 'id': 'a',
+    })
+
+    assert response.json() == {
+        'jsonrpc': '2.0',
+        'error': {'code': -32000, 'message': 'Not authenticated', 'data': {'status': 401}},
+        'id': 'a',
+    }
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_rpc_courier_orders(async_client: AsyncClient):
+    """Тестируем взятие и завершение заказа через JSON-RPC: статус курьера сохраняется вместе с заказом."""
+
+    async with async_session_maker() as session:
+        await session.execute(insert(Order).values(
+            id=70, status='Поиск курьера', start_time=datetime(2024, 1, 6, 16, 22, 31),
+            restaurant_id=7, user_id=1,
+        ))
+        await session.commit()
+
+    token = await test_login_for_courier_access_token(async_client)
+
+    async def call(method):
+        response = await async_client.post(
+            '/api/v1/rpc', headers={'Authorization': f'Bearer {token}'},
+            json={'jsonrpc': '2.0', 'method': method, 'params': {'order_id': 70}, 'id': 1},
+        )
+        assert response.json() == {'jsonrpc': '2.0', 'result': None, 'id': 1}
+
+        async with async_session_maker() as session:
+            return (await session.execute(select(Courier.status).filter(Courier.id == 1))).scalar_one()
+
+    assert await call('couriers.orders.accept') == 'Выполняет заказ'
+    assert await call('couriers.orders.complete') == 'Без заказа'
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_rpc_batch_cost(async_client: AsyncClient, monkeypatch):
+    """Тестируем стоимость пакета: сумма стоимостей методов, как у тех же запросов к REST API."""
+
+    monkeypatch.setitem(limiter.buckets, ANONYMOUS, Bucket(capacity=6, refill_rate=0.01))
+    monkeypatch.setattr(limiter, 'principal', lambda request: (ANONYMOUS, 'test_rpc_batch_cost'))
+    batch = [
+        {'jsonrpc': '2.0', 'method': 'restaurants.orders.list', 'params': {'restaurant_id': 1}, 'id': index}
+        for index in range(4)
+    ]
+
+    response = await async_client.post('/api/v1/rpc', json=batch)
+    assert response.status_code == 200
+    assert response.headers['RateLimit-Remaining'] == '2'
+
+    response = await async_client.post('/api/v1/rpc', json=batch)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_rpc_admission(async_client: AsyncClient, monkeypatch):
+    """Тестируем допуск пакета: место в «db_admission» на проверку токена и на каждый вызов."""
+
+    token = await test_login_for_user_access_token(async_client)
+    priorities = []
+    acquire = db_admission.acquire
+
+    async def record(priority):
+        priorities.append(priority)
+        await acquire(priority)
+
+    monkeypatch.setattr(db_admission, 'acquire', record)
+
+    async def call(batch):
+        priorities.clear()
+        response = await async_client.post(
+            '/api/v1/rpc', headers={'Authorization': f'Bearer {token}'}, json=batch,
+        )
+        assert response.status_code == 200
+        assert db_admission.active == 0
+        return response.json()
+
+    await call([
+        {'jsonrpc': '2.0', 'method': 'users.orders.list', 'id': index} for index in range(3)
+    ])
+    assert priorities == [READ_PRIORITY] * 4
+
+    body = await call([
+        {'jsonrpc': '2.0', 'method': 'users.orders.list', 'id': 1},
+        {'jsonrpc': '2.0', 'method': 'users.orders.create', 'params': {'restaurant_id': 17}, 'id': 2},
+    ])
+    assert priorities == [WRITE_PRIORITY] * 3
+    assert body[1]['error']['data'] == {'status': 404}
@@ -0,0 +1,20 @@
+import pytest
+from src.core.warmup import warm_up
+from src.delivery.snapshot import available_orders
+from src.main import app
+from src.server import available_cpus
+
+from .conftest import async_session_maker, engine_test
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_warm_up():
+    """Тестируем прогрев воркера: кэши загружены, схема OpenAPI собрана."""
+
+    app.openapi_schema = None
+
+    await warm_up(app, engine_test, async_session_maker, [available_orders.load])
+
+    assert available_orders.is_fresh
+    assert app.openapi_schema is not None
+    assert available_cpus() >= 1
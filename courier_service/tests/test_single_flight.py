@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import select, text
+from src.core.profiler import profile_queries
+from src.delivery.events import order_events
+from src.users.crud import get_user_by_phone_number
+from src.users.models import User
+
+from .conftest import async_session_maker
+
+
+def calls(result: str) -> float:
+    labels = {'function': 'get_user_by_phone_number', 'result': result}
+    return REGISTRY.get_sample_value('single_flight_calls_total', labels) or 0.0
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_single_flight(async_client):
+    """Тестируем объединение одинаковых одновременных запросов: один SQL-запрос, объекты в своих сессиях."""
+
+    merged, bypassed = calls('merged'), calls('bypassed')
+
+    async with async_session_maker() as first, async_session_maker() as second:
+        with profile_queries() as profile:
+            first_user, second_user = await asyncio.gather(
+                get_user_by_phone_number(first, '+79999999999'),
+                get_user_by_phone_number(second, '+79999999999'),
+            )
+
+        assert profile.count == 1
+        assert calls('merged') == merged + 1
+        assert first_user.id == second_user.id
+        assert first_user in first and second_user in second
+
+        # в сессии есть несохранённые изменения: запрос выполняется отдельно
+        second_user.name = 'Изменённое имя'
+        await asyncio.gather(
+            get_user_by_phone_number(first, '+79999999999'),
+            get_user_by_phone_number(second, '+79999999999'),
+        )
+
+        assert calls('merged') == merged + 1
+        assert calls('bypassed') == bypassed + 1
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_single_flight_after_commit(async_client):
+    """Тестируем, что вызов после коммита с изменениями не получает результат запроса, начатого до коммита."""
+
+    merged, leaders = calls('merged'), calls('leader')
+
+    sessions = [async_session_maker() for _ in range(3)]
+    async with sessions[0] as first, sessions[1] as second, sessions[2] as writer:
+        user = (await writer.execute(select(User).filter(User.phone_number == '+79999999999'))).scalar_one()
+        # блокируем таблицу, чтобы запрос ведущего выполнялся, пока другая сессия пишет в БД
+        await writer.execute(text('LOCK TABLE users IN ACCESS EXCLUSIVE MODE'))
+        tasks = [asyncio.create_task(get_user_by_phone_number(first, '+79999999999'))]
+        try:
+            await asyncio.sleep(0)
+            name: str = user.name
+            user.name = 'Изменённое имя'
+            await writer.flush()
+            user.name = name
+            await writer.commit()
+            tasks.append(asyncio.create_task(get_user_by_phone_number(second, '+79999999999')))
+            await asyncio.sleep(0)
+        finally:
+            await writer.rollback()
+            await asyncio.gather(*tasks)
+
+    assert calls('merged') == merged
+    assert calls('leader') == leaders + 2
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_single_flight_after_empty_commit(async_client):
+    """Тестируем, что коммит без изменений не мешает присоединиться к начатому запросу."""
+
+    merged, leaders = calls('merged'), calls('leader')
+
+    sessions = [async_session_maker() for _ in range(4)]
+    async with sessions[0] as first, sessions[1] as second, sessions[2] as locker, sessions[3] as other:
+        await locker.execute(text('LOCK TABLE users IN ACCESS EXCLUSIVE MODE'))
+        tasks = [asyncio.create_task(get_user_by_phone_number(first, '+79999999999'))]
+        try:
+            await asyncio.sleep(0)
+            # так в конце каждого запроса коммитит «get_db»
+            await other.execute(text('SELECT 1'))
+            await other.commit()
+            tasks.append(asyncio.create_task(get_user_by_phone_number(second, '+79999999999')))
+            await asyncio.sleep(0)
+        finally:
+            await locker.rollback()
+            await asyncio.gather(*tasks)
+
+    assert calls('merged') == merged + 1
+    assert calls('leader') == leaders + 1
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_single_flight_after_event(async_client):
+    """Тестируем, что событие из другого воркера тоже не даёт присоединиться к начатому запросу."""
+
+    merged, leaders = calls('merged'), calls('leader')
+
+    async with async_session_maker() as first, async_session_maker() as second:
+        leader = asyncio.create_task(get_user_by_phone_number(first, '+79999999999'))
+        await asyncio.sleep(0)
+        order_events._dispatch({
+            'event': 'order_status', 'order_id': 999999, 'restaurant_id': 999, 'user_id': 1,
+            'status': 'Завершён',
+        })
+        await asyncio.gather(leader, get_user_by_phone_number(second, '+79999999999'))
+
+    assert calls('merged') == merged
+    assert calls('leader') == leaders + 2
@@ -0,0 +1,27 @@
+import pytest
+from httpx import AsyncClient
+from src.core.slow_queries import slow_query_log
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_slow_query_log(async_client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    """Тестируем запись медленных запросов с параметрами, маршрутом и планом и их просмотр в админ панели."""
+
+    monkeypatch.setattr(slow_query_log, 'threshold', 1e-9)
+
+    response = await async_client.get('/api/v1/restaurants/7/nearest_couriers')
+    monkeypatch.undo()
+    await slow_query_log.wait()
+
+    assert response.status_code == 200
+
+    query = slow_query_log.recent()[0]
+
+    assert query['route'] == '/api/v1/restaurants/{restaurant_id}/nearest_couriers'
+    assert '7' in query['parameters']
+    assert query['plan'].startswith(('Index Scan', 'Seq Scan', 'Bitmap Heap Scan'))
+
+    response = await async_client.get('/admin/slow_queries', params={'query_id': query['id']})
+
+    assert response.status_code == 200
+    assert query['statement'][:50] in response.text
@@ -0,0 +1,43 @@
+import pytest
+from httpx import AsyncClient
+from src.core.tracing import trace_exporter
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_request_trace(async_client: AsyncClient):
+    """Тестируем трассировку запроса с заголовком «traceparent» и её просмотр в админ панели."""
+
+    response = await async_client.get('/api/v1/restaurants/7/orders/7',
+                                      headers={'traceparent': f'00-{TRACE_ID}-00f067aa0ba902b7-01'})
+
+    assert response.status_code == 200
+    assert response.headers['traceparent'].startswith(f'00-{TRACE_ID}-')
+    assert response.headers['traceparent'].endswith('-01')
+
+    trace = trace_exporter.find(TRACE_ID)
+    names = [span['name'] for span in trace['spans']]
+
+    assert trace['name'] == 'GET /api/v1/restaurants/{restaurant_id}/orders/{order_id}'
+    assert trace['spans'][0]['parent_id'] == '00f067aa0ba902b7'
+    assert 'delivery.crud.get_order_by_id' in names
+    assert 'sql' in names
+    assert 'render' in names
+
+    response = await async_client.get('/admin/traces', params={'trace_id': TRACE_ID})
+
+    assert response.status_code == 200
+    assert 'delivery.crud.get_order_by_id' in response.text
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_request_not_sampled(async_client: AsyncClient):
+    """Тестируем, что без флага записи трассировка не сохраняется, но её идентификатор передаётся."""
+
+    response = await async_client.get('/api/v1/restaurants/7/nearest_couriers',
+                                      headers={'traceparent': f'00-{"1" * 32}-00f067aa0ba902b7-00'})
+
+    assert response.headers['traceparent'].startswith(f'00-{"1" * 32}-')
+    assert response.headers['traceparent'].endswith('-00')
+    assert trace_exporter.find('1' * 32) is None
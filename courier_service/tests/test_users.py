@@ -1,18 +1,41 @@
+import asyncio
+
 import pytest
 from httpx import AsyncClient
+from src.core.profiler import assert_max_queries
+from src.delivery.eta import delivery_estimates
+from src.delivery.events import order_events
+from src.users.security import COURIER_ROLE, USER_ROLE, create_access_token
 
 from .test_auth import test_login_for_user_access_token
 
 
 @pytest.mark.asyncio(scope='session')
 async def test_new_order(async_client: AsyncClient):
-    """Тестируем роутер для создания заказа из ресторана."""
+    """Тестируем роутер для создания заказа и появление заказа в ленте курьеров."""
 
     token = await test_login_for_user_access_token(async_client)
-    response = await async_client.post('/api/v1/users/orders/post/7',
-                                       headers={'Authorization': f'Bearer {token}'})
+    # список заказов ресторана попадает в кэш до создания заказа
+    await async_client.get('/api/v1/restaurants/7/orders', params={'active': 1})
+
+    async with order_events.subscribe(user_id=1) as queue:
+        with assert_max_queries(9):
+            response = await async_client.post('/api/v1/users/orders/post/7',
+                                               headers={'Authorization': f'Bearer {token}'})
+
+        assert response.status_code == 201
+        await asyncio.wait_for(queue.get(), timeout=5)
+
+    order_id = response.json()['id']
+    courier_token = create_access_token({'sub': '+79999999992', 'role': COURIER_ROLE})
+    response = await async_client.get('/api/v1/couriers/available_orders',
+                                      headers={'Authorization': f'Bearer {courier_token}'})
 
-    assert response.status_code == 201
+    assert [order['id'] for order in response.json()] == [order_id]
+
+    response = await async_client.get('/api/v1/restaurants/7/orders', params={'active': 1})
+
+    assert order_id in [order['id'] for order in response.json()]
 
 
 @pytest.mark.asyncio(scope='session')
@@ -32,8 +55,9 @@ async def test_get_user_orders(async_client: AsyncClient):
     """Тестируем роутер для получения всех заказов пользователя."""
 
     token = await test_login_for_user_access_token(async_client)
-    response = await async_client.get('/api/v1/users/orders/get',
-                                      headers={'Authorization': f'Bearer {token}'})
+    with assert_max_queries(5):
+        response = await async_client.get('/api/v1/users/orders/get',
+                                          headers={'Authorization': f'Bearer {token}'})
 
     assert response.status_code == 200
 
@@ -53,10 +77,42 @@ async def test_get_user_order(async_client: AsyncClient):
     """Тестируем роутер для получения подробной информации об одном заказе для пользователя."""
 
     token = await test_login_for_user_access_token(async_client)
+    headers = {'Authorization': f'Bearer {token}'}
+    with assert_max_queries(6):
+        response = await async_client.get('/api/v1/users/orders/get/7', headers=headers)
+
+    assert response.status_code == 200
+
+    # повторный запрос с ETag: заказ не менялся, тело ответа не передаётся
+    etag = response.headers['ETag']
+    with assert_max_queries(2):
+        response = await async_client.get('/api/v1/users/orders/get/7',
+                                          headers={**headers, 'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.content == b''
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_get_user_order_delivery_estimate(async_client: AsyncClient):
+    """Тестируем оценку времени доставки по доставленным заказам ресторана."""
+
+    token = create_access_token({'sub': '+79999999999', 'role': USER_ROLE, 'id': 1})
+    headers = {'Authorization': f'Bearer {token}'}
+    response = await async_client.get('/api/v1/users/orders/get/7', headers=headers)
+    etag = response.headers['ETag']
+
+    assert response.json()['duration_delivery'] == 50
+
+    # заказ создан в 16 часов, три заказа ресторана в этот час доставлены за 20 минут
+    for _ in range(3):
+        delivery_estimates.observe(restaurant_id=7, hour=16, minutes=20)
     response = await async_client.get('/api/v1/users/orders/get/7',
-                                      headers={'Authorization': f'Bearer {token}'})
+                                      headers={**headers, 'If-None-Match': etag})
 
     assert response.status_code == 200
+    assert response.json()['duration_delivery'] == 32
+    assert await delivery_estimates.flush() == 1
 
 
 @pytest.mark.asyncio(scope='session')
@@ -76,8 +132,9 @@ async def test_shipping_cost(async_client: AsyncClient):
     """Тестируем роутер для получения стоимости доставки из выбранного ресторана."""
 
     token = await test_login_for_user_access_token(async_client)
-    response = await async_client.get('/api/v1/users/shipping_cost/1',
-                                      headers={'Authorization': f'Bearer {token}'})
+    with assert_max_queries(3):
+        response = await async_client.get('/api/v1/users/shipping_cost/1',
+                                          headers={'Authorization': f'Bearer {token}'})
 
     assert response.status_code == 200
 